@@ -1,218 +1,376 @@
 import streamlit as st
-import google.generativeai as genai
-import os
+import backends
 from pathlib import Path
 import json
-from groq import Groq
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from file_cache import GeminiFileCache
+from result_cache import ResultCache, make_key
+from prefetch import PrefetchSlot
+from ingest import SessionRegistry
+from metrics import DEFAULT_METRICS_PORT, bind_call_id, instrumented_upload, new_call_id, start_metrics_server
+from prompts import system_prompt_audio, system_prompt_json
+from prompt_registry import PromptCache, configured_ttl_s
+from streaming_transcript import stream_transcript
+from audio_utils import load_audio
+from audio_preprocess import PREPROCESS_SETTINGS, load_time_remap, normalize_audio, preprocessed_hash, preprocessed_segment, save_time_remap
+from chunked_transcription import DEFAULT_WINDOW_S, transcribe_long_audio
+from pipeline import VALID_EXTENSIONS, mime_type_for, transcribe_audio, transcript_to_original_time, parse_json
+from provider_router import AllProvidersFailed, build_analysis_router
+from call_store import CallStore
+from job_service import PRIORITY_INTERACTIVE, JobQueue, QueueFull
+
+# google.generativeai, or the local stub server with CURATEAI_BACKEND=stub
+genai = backends.gemini_backend()
 
-# Configure the generative AI API
-genai.configure(api_key=st.secrets["gemini_api_key"])
+# Configure the generative AI API once per process (reconfiguring rebuilds its clients)
+@st.cache_resource
+def configure_genai(api_key):
+    genai.configure(api_key=api_key)
 
-# Initialize Groq client
-groq_client = Groq(api_key=st.secrets["groq_key"])
+configure_genai(None if backends.stub_enabled() else st.secrets["gemini_api_key"])
 
-# Helper function to upload files to Gemini
+# Groq client shared by all sessions of this process
+@st.cache_resource
+def get_groq_client():
+    return backends.groq_client(None if backends.stub_enabled() else st.secrets["groq_key"])
+
+# Helper function to upload files to Gemini (timed as an "upload" span)
+@instrumented_upload
 def upload_to_gemini(path, mime_type=None):
     """Uploads the given file to Gemini."""
     file = genai.upload_file(path, mime_type=mime_type)
     return file
 
-# Common generation configuration
-generation_config = {
-    "temperature": 0.3,
-    "response_mime_type": "application/json"
-}
-
-# Prompts for the models (keep the same as original)
-Prompt_for_audio_transcript = '''
-You are an advanced AI assistant specialized in audio processing, speaker diarization, and emotion detection. Your expertise lies in analyzing audio files, identifying speakers, transcribing conversations, and detecting emotions in real-time. Your task is to process an audio file from a call center and provide a detailed, structured output in JSON format.
-Task:
-
-Number of Speakers: Identify and state the total number of unique speakers in the audio file.
-
-Transcript with Speaker Labels: Generate a clear and accurate transcript of the audio, labeling each segment of speech with the corresponding speaker (e.g.Agent,Client etc). Use proper punctuation and formatting for readability.
-
-Emotion Detection: For each speaker at every point in the conversation, detect and note their emotion (e.g., happy, sad, angry, neutral, frustrated, etc.). Provide a timeline of emotions in JSON format.
-
-Guidelines:
-- Use clear, concise, and professional language.
--Ensure the transcript is accurate and easy to read.
--If a speaker cannot be identified, label them as "Unknown."
--Emotions should be detected for each speaker at every conversational turn.
--Follow the JSON output format strictly.
-
-Output Format:
-Provide the output in the following JSON structure:
-{
-  "Call Details": {
-    "Number of Speakers": "<total_number_of_speakers>",
-    "Transcript": [
-      {
-        "Speaker": "<Agent/client/Unknown>",
-        "Voice": "<extracted_text_from_audio>",
-        "Emotion": "<detected_emotion>"
-      },
-      {
-        "Speaker": "<Agent/client/Unknown>",
-        "Voice": "<extracted_text_from_audio>",
-        "Emotion": "<detected_emotion>"
-      },
-      ...
-    ]
-  }
-}
-Example Output:
-{
-  "Call Details": {
-    "Number of Speakers": 2,
-    "Transcript": [
-      {
-        "Speaker": "Agent",
-        "Voice": "Hello, how can I assist you today?",
-        "Emotion": "neutral"
-      },
-      {
-        "Speaker": "Client",
-        "Voice": "I’m having issues with my recent order.",
-        "Emotion": "frustrated"
-      },
-      {
-        "Speaker": "Agent",
-        "Voice": "I’m sorry to hear that. Can you provide your order number?",
-        "Emotion": "neutral"
-      },
-      ...
-    ]
-  }
-}
-'''
-system_prompt_audio = '''You are a highly skilled AI assistant with a deep understanding of audio analysis, natural language processing, and emotional intelligence. You are meticulous, detail-oriented, and committed to delivering accurate and structured results. Your goal is to provide a comprehensive analysis of the call center audio, ensuring the transcript is clear, emotions are accurately detected, and the output is well-organized for further use.'''
-system_prompt_json = '''You are an AI trained in analyzing customer service call transcripts. Your expertise lies in emotion detection, summarization, and extracting key insights from conversations. You are meticulous, detail-oriented, and capable of providing structured outputs in JSON format.'''
-prompt_transcript_to_output = '''
-Analyze the provided JSON input, which contains a customer service call transcript with emotion labels for each speaker. Extract the following details and present them in a structured JSON format:
-	1- Emotion Tracking of Clients: A list of emotions expressed by the client (Speaker B) throughout the conversation.
-	2-Emotion Tracking of Agents: A list of emotions expressed by the agent (Speaker A) throughout the conversation.
-	3-Important Words Used in the Conversation: A list of key words or phrases that are significant to the conversation (e.g., billing, late fee, card expired, etc.).
-	4-Questions Asked by the Customer:ANALYSE THIS CAREFULLY.THIS SHOULD INCLUDE WHY A CLIENT CALLED CUSTOMER SERVICE.Donot just copy paste client exact conversation word.Use proper sentence to explain in points why client called the customer care.
-	5-Resolutions Given by the Agent: A list of resolutions or actions taken by the agent to address the client's concerns.
- 	6-Suggestions For Agents:Analyse carefully what the customer asks and what are the response given by the agent.Then decide what better we can suggest the Agent to improve.
-	7-Important Conclusion and Summary of Conversation: A concise summary of the conversation, including the main issue, resolution, and any additional actions taken.
- 	8-Entity Detection:A list of entity detected in the provided transcript (Carefully analyse this to find out the entities correctly),Most probable entities are Organisation,Person,Email address,Location,Duration
-	9-Client Satisfaction: A boolean value (true or false) indicating whether the client seemed satisfied with the agent's response based on their emotions and statements.
-	
-Input:
-The JSON input provided contains the call transcript with speaker labels, their statements, and emotion labels.
-
-Output Format:
-Your output must be in JSON format, structured as follows:
-{
-  "Emotion Tracking of Clients": ["emotion1", "emotion2", ...],
-  "Emotion Tracking of Agents": ["emotion1", "emotion2", ...],
-  "Important Words Used in the Conversation": ["word1", "word2", ...],
-  "Questions Asked by the Customer": ["question1", "question2", ...],
-  "Resolutions Given by the Agent": ["resolution1", "resolution2", ...],
-  "Suggestion For the Agent" :["Suggestion1", "Suggestion2",...]
-  "Important Conclusion and Summary of Conversation": "summary text",
-  "Entities Detected:["Organization:(Entity detected)","Location":(Location entity detected),"Email address":(email entity detected),
-  "Client Satisfaction": true/false
-}
-
-Example Output:
-Here’s an example of how the output should look:
-{
-  "Emotion Tracking of Clients": ["confused", "concerned", "neutral", "slightly-regretful", "relieved", "hopeful", "neutral", "grateful"],
-  "Emotion Tracking of Agents": ["neutral", "sympathetic", "neutral", "neutral", "neutral", "neutral", "neutral", "neutral"],
-  "Important Words Used in the Conversation": ["billing statement", "late fee", "card expired", "waive", "adjustment", "coverage", "savings"],
-  "Questions Asked by the Customer": [
-    "The client called  because his latest billing statement seems higher than usual, and he don't understand why.",
-    "Would you be open to a quick review?"
-  ],
-  "Resolutions Given by the Agent": [
-    "Waived the late fee as a courtesy.",
-    "Updated the client's payment method to avoid future issues.",
-    "Offered to review the client's current plan for potential savings."
-  ],
-  "Suggestion For the agent":["Offer multiple option to cut cost of client".....],
-  "Important Conclusion and Summary of Conversation": "The client called regarding an unexpectedly high billing statement due to a late fee. The agent identified the issue as a result of an expired card and waived the late fee. The agent also updated the client's payment details and offered to review their current plan for potential savings. The client expressed relief and gratitude.",
-  "Entities Detected:["Organization:(Newco, General, Allison, Allison, Allison, B. Ben Hur)","Location":(4741 Pick Street, Fort Morgan, Colorado 80701),"Email address":(Adam turnermail.com),
-  "Client Satisfaction": true
-}
-
-Instructions:
-	- Carefully analyze the JSON input to extract the required details.
-	- Ensure the output is well-structured and adheres to the provided JSON format.
-	- Focus on accuracy in emotion tracking, key phrase extraction, and summarization.
-	- Use the client's final emotions and statements to determine satisfaction.
-'''
-# Initialize the model for audio processing
-model_audio = genai.GenerativeModel(
-    model_name="gemini-1.5-flash-8b-001",
-    system_instruction=system_prompt_audio
-)
+# Shared across sessions so reruns and repeat uploads reuse the same Gemini file
+@st.cache_resource
+def get_file_cache():
+    return GeminiFileCache(delete_file=genai.delete_file)
+
+# Per-session temp files and Gemini uploads, removed once a session goes idle
+@st.cache_resource
+def get_session_registry():
+    return SessionRegistry(delete_file=genai.delete_file)
+
+# On-disk cache of transcripts and analyses, shared by all sessions
+@st.cache_resource
+def get_result_cache():
+    return ResultCache()
+
+# Every processed call is recorded here for the Call Analytics page
+@st.cache_resource
+def get_call_store():
+    return CallStore()
+
+def store_call(**documents):
+    """Adds the current file's transcript or analysis to the call analytics store."""
+    get_call_store().ingest(
+        st.session_state.source_hash, call_id=st.session_state.call_id,
+        agent=st.session_state.get("agent_name") or None, **documents
+    )
+
+# Prometheus metrics for all sessions of this process, served on METRICS_PORT
+@st.cache_resource
+def get_metrics_server():
+    try:
+        return start_metrics_server(int(os.environ.get("METRICS_PORT", DEFAULT_METRICS_PORT)))
+    except OSError:
+        # Port already taken (e.g. by the other app); metrics are still written to the span log
+        return None
+
+# Static prompts cached on Gemini once per process, so requests only send the audio or transcript
+@st.cache_resource
+def get_prompt_cache():
+    return PromptCache(genai, ttl_s=configured_ttl_s())
+
+# Stage-2 router shared by all sessions: Groq first, Gemini for failover and hedging
+@st.cache_resource
+def get_analysis_router():
+    model_json = genai.GenerativeModel(model_name="gemini-2.0-flash", system_instruction=system_prompt_json)
+    model_json = get_prompt_cache().wrap(model_json, system_prompt_json)
+    return build_analysis_router(model_json, get_groq_client(), primary="groq", result_cache=get_result_cache())
+
+# Queue of the background job service (python job_service.py serve), shared by all sessions
+@st.cache_resource
+def get_job_queue():
+    return JobQueue()
+
+def submit_job(uploaded_audio, options):
+    """Queues the uploaded file as an interactive job for the job service."""
+    st.session_state.job_error = None
+    st.session_state.job_loaded = False
+    try:
+        st.session_state.job_id = get_job_queue().submit(
+            data=uploaded_audio.getbuffer(), suffix=Path(uploaded_audio.name).suffix.lower(),
+            priority=PRIORITY_INTERACTIVE, options=options, call_id=st.session_state.call_id,
+            source=uploaded_audio.name, agent=st.session_state.get("agent_name") or None,
+        )
+    except QueueFull:
+        st.warning("The job service is busy; try again in a minute or turn off background processing.")
+
+def load_job_result(record):
+    """Puts a finished job's transcript in the session and its analysis in the prefetch slot."""
+    st.session_state.transcript_json = record["transcript"]
+    st.session_state.analysis_report = dict(
+        record.get("compaction") or {},
+        provider=record.get("analysis_provider"),
+        hedged=record.get("analysis_hedged", False),
+    )
+    st.session_state.analysis_prefetch.fill(
+        make_key(transcript=record["transcript"]),
+        (json.dumps(record["analysis"]), record.get("analysis_cached", False)),
+    )
+    st.session_state.job_loaded = True
+
+# Polls the submitted job without rerunning the rest of the script
+@st.fragment(run_every=2)
+def show_job_progress():
+    job = get_job_queue().get(st.session_state.job_id)
+    if job is None or job["status"] == "cancelled":
+        st.session_state.job_id = None
+        st.rerun()
+    if job["status"] == "queued":
+        st.info(f"Waiting for a worker (position {job['position']} in the queue)...")
+    elif job["status"] == "running":
+        st.info(f"Processing: {job['stage'] or 'starting'} ({time.time() - job['started_at']:.0f}s)")
+    else:
+        st.session_state.job_id = None
+        if job["status"] == "done":
+            load_job_result(job["result"])
+        else:
+            st.session_state.job_error = job["error"]
+        st.rerun()
+
+# Background workers for speculative detailed-analysis requests, shared by all sessions
+@st.cache_resource
+def get_prefetch_executor():
+    return ThreadPoolExecutor(max_workers=8, thread_name_prefix="analysis-prefetch")
+
+# Model for audio processing, created once per process and shared by all sessions
+@st.cache_resource
+def get_audio_model():
+    model_audio = genai.GenerativeModel(
+        model_name="gemini-1.5-flash-8b-001",
+        system_instruction=system_prompt_audio
+    )
+    return get_prompt_cache().wrap(model_audio, system_prompt_audio)
+
+model_audio = get_audio_model()
 
 st.title("Welcome to CurateAI Audio Assistant with Ollama")
 
 # Placeholder for storing the first API call result
 transcript_json = None
+if "analysis_prefetch" not in st.session_state:
+    st.session_state.analysis_prefetch = PrefetchSlot()
+if "analysis_report" not in st.session_state:
+    st.session_state.analysis_report = {}
 
 # Audio file upload section
 uploaded_audio = st.file_uploader("Upload an audio file", type=["mp3", "aac", "wav", "aiff"], accept_multiple_files=False)
 
 if uploaded_audio is not None:
     file_extension = Path(uploaded_audio.name).suffix.lower()
-    valid_extensions = [".mp3", ".aac", ".wav", ".aiff"]
     
-    if file_extension not in valid_extensions:
+    if file_extension not in VALID_EXTENSIONS:
         st.error("AUDIO FILE IS NOT IN VALID FORMAT")
     else:
-        # Save the uploaded audio file temporarily
-        with open(uploaded_audio.name, "wb") as f:
-            f.write(uploaded_audio.getbuffer())
-        
-        # Upload to Gemini and process
-        mime_type = f"audio/{file_extension.strip('.') if file_extension != '.mp3' else 'mpeg'}"
-        myaudio = upload_to_gemini(uploaded_audio.name, mime_type=mime_type)
+        mime_type = mime_type_for(uploaded_audio.name)
+        compress_audio = st.checkbox("Compress audio before upload (mono, 16 kHz)", value=True)
+        trim_audio = st.checkbox("Trim long silences and hold music before upload", value=True, disabled=not compress_audio)
+        preprocess_settings = dict(PREPROCESS_SETTINGS, trim_silence=trim_audio)
+        st.text_input("Agent name (optional, used by Call Analytics)", key="agent_name")
+        # Offered while a job service is running: the work then happens outside this script
+        background = get_job_queue().service_alive() and st.checkbox("Process in the background job service", value=True)
+
+        # Each session writes to its own temp directory under random file names
+        if "session_id" not in st.session_state:
+            st.session_state.session_id = uuid.uuid4().hex
+        session_files = get_session_registry().get(st.session_state.session_id)
+        source_hash = session_files.digest(uploaded_audio.file_id, uploaded_audio.getbuffer())
+
+        # A different file replaces the previous one: drop its transcript and pending analysis
+        if st.session_state.get("source_hash") != source_hash:
+            if st.session_state.get("source_hash") is not None:
+                # Remove the previous file's spooled copies and window uploads right away
+                get_session_registry().end(st.session_state.session_id)
+                session_files = get_session_registry().get(st.session_state.session_id)
+            st.session_state.analysis_prefetch.cancel()
+            st.session_state.transcript_json = None
+            st.session_state.analysis_report = {}
+            if st.session_state.get("job_id"):
+                get_job_queue().cancel(st.session_state.job_id)
+            st.session_state.job_id = None
+            st.session_state.job_error = None
+            st.session_state.job_loaded = False
+            st.session_state.source_hash = source_hash
+            st.session_state.call_id = new_call_id()
+        # Spans of this rerun (and of the background analysis) belong to the current file's call
+        bind_call_id(st.session_state.call_id)
+
+        def spool_upload():
+            # Stream the uploaded audio to disk in chunks (written once per file)
+            return session_files.spool(uploaded_audio.getbuffer(), suffix=file_extension, key=source_hash)
+
+        def save_and_upload():
+            upload_path, upload_mime = spool_upload(), mime_type
+            if compress_audio:
+                data, upload_mime, prep_stats = normalize_audio(upload_path, file_extension.strip("."), **preprocess_settings)
+                upload_path = session_files.spool(data, suffix=f".{PREPROCESS_SETTINGS['codec']}")
+                del data
+                st.caption(
+                    f"Compressed audio from {prep_stats['bytes_in'] / (1024 * 1024):.1f} MB to "
+                    f"{prep_stats['bytes_out'] / (1024 * 1024):.1f} MB in {prep_stats['seconds']:.1f}s"
+                )
+                if "vad" in prep_stats:
+                    st.caption(
+                        f"Trimmed {prep_stats['vad']['removed_s']:.0f}s of silence/hold music "
+                        f"({prep_stats['vad']['removed_pct']:.0f}% of the call)"
+                    )
+                    # Needed to place the turns whenever this transcript is served from the cache
+                    save_time_remap(get_result_cache(), audio_hash, prep_stats["time_remap"])
+            return upload_to_gemini(upload_path, mime_type=upload_mime)
+
+        # Upload to Gemini only if this audio isn't already cached
+        audio_hash = source_hash
+        if compress_audio:
+            audio_hash = preprocessed_hash(source_hash, preprocess_settings)
+        file_cache = get_file_cache()
+        long_mode = st.checkbox("Long-audio mode (transcribe overlapping windows in parallel)", value=False)
+        stream_mode = st.checkbox("Show transcript turns as they are generated", value=True, disabled=long_mode)
+        myaudio = None
+        # Long-audio mode uploads its windows instead of the whole file
+        if not background and not long_mode:
+            myaudio = file_cache.get_or_upload(uploaded_audio.getbuffer(), mime_type, save_and_upload, digest=audio_hash)
+        cache_stats = file_cache.stats()
+        st.caption(
+            f"Upload cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+            f"{cache_stats['bytes_saved'] / (1024 * 1024):.1f} MB of uploads saved"
+        )
         
         st.audio(uploaded_audio, format=mime_type)
         
-        if st.button("View Transcript"):
-            response_audio = model_audio.generate_content([myaudio, Prompt_for_audio_transcript], generation_config=generation_config)
+        if background:
+            job_options = {
+                "compress": compress_audio,
+                "trim_silence": trim_audio,
+                "window_minutes": DEFAULT_WINDOW_S / 60 if long_mode else 0,
+            }
+            if st.button("Submit Transcription Job", disabled=bool(st.session_state.get("job_id"))):
+                submit_job(uploaded_audio, job_options)
+            if st.session_state.get("job_id"):
+                show_job_progress()
+            if st.session_state.get("job_error"):
+                st.error(f"Background job failed: {st.session_state.job_error}")
+            if st.session_state.get("job_loaded"):
+                st.success("Transcript and detailed analysis are ready.")
+                st.json(st.session_state.transcript_json, expanded=False)
+        elif st.button("View Transcript"):
+            if long_mode:
+                with st.spinner("Transcribing audio windows in parallel..."):
+                    # Windows are cut from the same (compressed, trimmed) audio a single upload would send
+                    if compress_audio:
+                        segment, prep_stats = preprocessed_segment(spool_upload(), file_extension.strip("."), **preprocess_settings)
+                    else:
+                        segment = load_audio(spool_upload(), format=file_extension.strip("."))
+                    long_transcript, long_stats = transcribe_long_audio(
+                        model_audio, segment, session_files.tracked_upload(upload_to_gemini), get_result_cache(),
+                        session_files=session_files, bitrate=PREPROCESS_SETTINGS["bitrate"] if compress_audio else None,
+                        time_remap=prep_stats.get("time_remap") if compress_audio else None,
+                    )
+                    del segment
+                response_text, cached = json.dumps(long_transcript), False
+                st.caption(f"{len(long_stats['windows'])} windows transcribed in {long_stats['wall_seconds']:.1f}s")
+                if compress_audio and "vad" in prep_stats:
+                    st.caption(
+                        f"Trimmed {prep_stats['vad']['removed_s']:.0f}s of silence/hold music "
+                        f"({prep_stats['vad']['removed_pct']:.0f}% of the call)"
+                    )
+                for failure in long_stats["failed_windows"]:
+                    st.warning(f"Window {failure['window'] + 1} could not be transcribed: {failure['error']}")
+            elif stream_mode:
+                live_turns = st.container()
+
+                def show_turn(turn):
+                    live_turns.markdown(f"**{turn.get('Speaker', '')}** ({turn.get('Emotion', '')}): {turn.get('Voice', '')}")
+
+                response_text, cached, first_turn_s = stream_transcript(
+                    model_audio, myaudio, audio_hash, get_result_cache(), on_turn=show_turn
+                )
+                if first_turn_s is not None and not cached:
+                    st.caption(f"First turn shown after {first_turn_s:.1f}s")
+            else:
+                response_text, cached = transcribe_audio(model_audio, myaudio, audio_hash, get_result_cache())
+            if cached:
+                st.caption("Loaded transcript from cache.")
             try:
-                transcript_json = json.loads(response_audio.text)
+                parse_report = {}
+                transcript_json = parse_json(response_text, "transcript", report=parse_report)
+                if compress_audio and trim_audio and not long_mode:
+                    # Turn times refer to the trimmed upload; move them back to the original recording
+                    transcript_json = transcript_to_original_time(transcript_json, load_time_remap(get_result_cache(), audio_hash))
+                if parse_report["outcome"] == "salvaged":
+                    st.warning(
+                        "The model's answer was cut off or malformed; showing the "
+                        f"{len(transcript_json['Call Details']['Transcript'])} complete turns that could be recovered."
+                    )
                 st.json(transcript_json, expanded=True)
                 st.session_state.transcript_json = transcript_json
+                store_call(transcript_json=transcript_json, source=uploaded_audio.name)
                 st.success("GREAT! Transcript generated successfully! You can now proceed to detailed analysis.")
             except json.JSONDecodeError:
                 st.write("Here is the raw output from the model:")
-                st.text(response_audio.text)
+                st.text(response_text)
+
+# Start the detailed analysis in the background as soon as a transcript exists
+if st.session_state.get("transcript_json") is not None:
+    analysis_key = make_key(transcript=st.session_state.transcript_json)
+    st.session_state.analysis_prefetch.start(
+        get_prefetch_executor(), analysis_key,
+        get_analysis_router().analyze, st.session_state.transcript_json, report=st.session_state.analysis_report
+    )
 
 # View Detailed Analysis button
 if st.session_state.get("transcript_json") is not None:
+    prefetch_status = st.session_state.analysis_prefetch.status(analysis_key)
+    if prefetch_status == "ready":
+        st.caption("Detailed analysis is ready.")
+    elif prefetch_status == "failed":
+        st.warning("The background analysis failed; it will be retried when you click View Detailed Analysis.")
     if st.button("View Detailed Analysis"):
         transcript_json = st.session_state.transcript_json
         
-        # Prepare the Groq API call
-        formatted_json = json.dumps(transcript_json, indent=2)
-        
-        messages = [
-            {
-                "role": "user",
-                "content": f"{prompt_transcript_to_output}\n\nHere's the JSON data:\n```json\n{formatted_json}\n```"
-            }
-        ]
-        
-        # Get completion from Groq
-        chat_completion = groq_client.chat.completions.create(
-            messages=messages,
-            model="llama-3.3-70b-versatile",
-            temperature=0.3,
-            response_format={"type": "json_object"},
-            max_tokens=2048
-        )
+        # Use the background request (waiting for it if needed), or call the router directly
+        result = st.session_state.analysis_prefetch.result(analysis_key)
+        if result is None:
+            try:
+                result = get_analysis_router().analyze(transcript_json, report=st.session_state.analysis_report)
+            except AllProvidersFailed as exc:
+                st.error(f"Detailed analysis failed: {exc}")
+                st.stop()
+        response_text, cached = result
+        if cached:
+            st.caption("Loaded detailed analysis from cache.")
         
         try:
-            detailed_analysis_json = json.loads(chat_completion.choices[0].message.content)
+            detailed_analysis_json = parse_json(response_text, "analysis")
+            store_call(analysis_json=detailed_analysis_json)
             st.json(detailed_analysis_json, expanded=True)
+            report = st.session_state.analysis_report
+            if report:
+                if report.get("cached"):
+                    st.caption(
+                        f"No transcript tokens sent: answer served from the cache (first sent in compact form, "
+                        f"level {report['level']}, ~{report['payload_tokens']} tokens)"
+                    )
+                else:
+                    st.caption(
+                        f"Transcript sent in compact form (level {report['level']}): ~{report['payload_tokens']} "
+                        f"tokens instead of ~{report['baseline_tokens']} ({report['saved_pct']:.0f}% saved)"
+                    )
+                st.caption(f"Answered by {report['provider']}{' (hedged request)' if report['hedged'] else ''}")
             
             # Add download button for final JSON output
             st.download_button(
@@ -224,16 +382,10 @@ if st.session_state.get("transcript_json") is not None:
             
         except json.JSONDecodeError:
             st.write("Here is the raw output from the model:")
-            st.text(chat_completion.choices[0].message.content)
-
-# Clean up temporary files after session
-@st.cache_data()
-def get_session_files():
-    return []
+            st.text(response_text)
 
-def remove_temp_files():
-    for file_path in get_session_files():
-        if os.path.exists(file_path):
-            os.remove(file_path)
+get_metrics_server()
 
-remove_temp_files()
+# Clean up temp files and Gemini uploads of sessions that have gone idle
+get_session_registry().sweep()
+get_file_cache().purge_idle()
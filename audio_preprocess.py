@@ -0,0 +1,129 @@
+import io
+import json
+import os
+import time
+
+from audio_utils import load_audio, segment_to_array, resample, array_to_segment
+from result_cache import make_key
+from vad import VAD_SETTINGS, trim_non_speech
+
+# Speech diarization does not need more than this; keep the upload small
+PREPROCESS_SETTINGS = {
+    "target_rate": 16000,
+    "codec": "mp3",
+    "bitrate": "32k",
+    "trim_silence": True,
+}
+
+CODEC_MIME_TYPES = {
+    "mp3": "audio/mpeg",
+    "ogg": "audio/ogg",
+    "flac": "audio/flac",
+    "wav": "audio/wav",
+}
+
+
+def preprocessed_hash(audio_hash, settings=PREPROCESS_SETTINGS):
+    """Identifies the upload produced from ``audio_hash`` with the given settings.
+
+    Used in place of the raw audio hash for the upload and transcript caches,
+    so preprocessed and original uploads never share a cache entry.
+    """
+    if settings.get("trim_silence"):
+        return make_key(audio=audio_hash, preprocess=settings, vad=VAD_SETTINGS)
+    return make_key(audio=audio_hash, preprocess=settings)
+
+
+def time_remap_key(audio_hash):
+    """Result-cache key of the time remap of a preprocessed upload (see ``preprocessed_hash``)."""
+    return make_key(stage="time_remap", audio=audio_hash)
+
+
+def save_time_remap(result_cache, audio_hash, remap):
+    """Stores the remap next to the transcript cached for the same upload."""
+    if result_cache is not None and remap is not None:
+        result_cache.put(time_remap_key(audio_hash), json.dumps(remap), stage="time_remap")
+
+
+def load_time_remap(result_cache, audio_hash):
+    """Returns the remap saved for ``audio_hash``, or None if it is not cached."""
+    text = result_cache.get(time_remap_key(audio_hash)) if result_cache is not None else None
+    return None if text is None else [tuple(row) for row in json.loads(text)]
+
+
+def preprocess_samples(data, format=None, target_rate=16000, trim_silence=False):
+    """Decodes ``data``, downmixes it to mono, resamples it and optionally trims it.
+
+    The steps of ``normalize_audio`` before encoding; returns ``(samples, rate, stats)``.
+    """
+    if isinstance(data, (str, os.PathLike)):
+        stats = {"bytes_in": os.path.getsize(data)}
+    else:
+        stats = {"bytes_in": len(memoryview(data))}
+
+    started = time.perf_counter()
+    segment = load_audio(data, format=format)
+    stats["duration_s"] = len(segment) / 1000
+    stats["channels_in"] = segment.channels
+    stats["rate_in"] = segment.frame_rate
+    stats["decode_s"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    samples, rate = segment_to_array(segment)
+    del segment
+    samples, rate = resample(samples, rate, target_rate)
+    stats["resample_s"] = time.perf_counter() - started
+
+    stats["trim_s"] = 0.0
+    if trim_silence:
+        started = time.perf_counter()
+        samples, stats["time_remap"], stats["vad"] = trim_non_speech(samples, rate, VAD_SETTINGS)
+        stats["trim_s"] = time.perf_counter() - started
+    stats["rate_out"] = rate
+    return samples, rate, stats
+
+
+def encode_segment(segment, codec="mp3", bitrate="32k"):
+    """Encodes a pydub AudioSegment; returns ``(encoded_bytes, mime_type)``."""
+    out = io.BytesIO()
+    export_args = {"format": codec}
+    if codec in ("mp3", "ogg"):
+        export_args["bitrate"] = bitrate
+    if codec == "ogg":
+        export_args["codec"] = "libopus"
+    segment.export(out, **export_args)
+    return out.getvalue(), CODEC_MIME_TYPES[codec]
+
+
+def normalize_audio(data, format=None, target_rate=16000, codec="mp3", bitrate="32k", trim_silence=False):
+    """Downmixes to mono, resamples to ``target_rate`` and re-encodes with ``codec``.
+
+    ``data`` may be a file path, which avoids holding the encoded input in
+    memory next to the decoded samples. With ``trim_silence``, long silence and hold-music stretches are cut by
+    ``vad.trim_non_speech``; ``stats["time_remap"]`` then maps times in the
+    uploaded audio back to the original recording.
+
+    Returns ``(encoded_bytes, mime_type, stats)``; ``stats`` holds the byte
+    counts before and after and the time spent in each step.
+    """
+    samples, rate, stats = preprocess_samples(data, format, target_rate, trim_silence)
+
+    started = time.perf_counter()
+    encoded, mime_type = encode_segment(array_to_segment(samples, rate), codec, bitrate)
+    stats["encode_s"] = time.perf_counter() - started
+
+    stats["bytes_out"] = len(encoded)
+    stats["seconds"] = stats["decode_s"] + stats["resample_s"] + stats["trim_s"] + stats["encode_s"]
+    return encoded, mime_type, stats
+
+
+def preprocessed_segment(data, format=None, target_rate=16000, trim_silence=False, **encoding):
+    """Like ``normalize_audio`` but returns the audio as a pydub AudioSegment, not encoded.
+
+    Long-audio mode cuts its windows from this, so they hold the same audio a
+    single upload would send; ``encoding`` (codec, bitrate) is accepted so the
+    settings dict can be passed as is. Returns ``(segment, stats)``.
+    """
+    samples, rate, stats = preprocess_samples(data, format, target_rate, trim_silence)
+    stats["seconds"] = stats["decode_s"] + stats["resample_s"] + stats["trim_s"]
+    return array_to_segment(samples, rate), stats
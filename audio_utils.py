@@ -0,0 +1,96 @@
+import io
+
+import numpy as np
+
+
+def load_audio(source, format=None):
+    """Decodes an audio file (path, bytes or file object) into a pydub AudioSegment.
+
+    pydub shells out to ffmpeg for mp3/aac, so ffmpeg must be on the PATH.
+    """
+    from pydub import AudioSegment
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    return AudioSegment.from_file(source, format=format)
+
+
+def segment_to_array(segment):
+    """Returns ``(samples, rate)`` with samples as mono float32 in [-1, 1]."""
+    samples = np.array(segment.get_array_of_samples(), dtype=np.float32)
+    if segment.channels > 1:
+        samples = samples.reshape(-1, segment.channels).mean(axis=1)
+    samples /= float(1 << (8 * segment.sample_width - 1))
+    return samples, segment.frame_rate
+
+
+def frame_signal(samples, rate, frame_ms=30, hop_ms=None):
+    """Splits samples into (n_frames, frame_len) frames without copying."""
+    frame_len = max(1, int(rate * frame_ms / 1000))
+    hop = max(1, int(rate * (hop_ms or frame_ms) / 1000))
+    if len(samples) < frame_len:
+        samples = np.pad(samples, (0, frame_len - len(samples)))
+    n_frames = 1 + (len(samples) - frame_len) // hop
+    return np.lib.stride_tricks.as_strided(
+        samples,
+        shape=(n_frames, frame_len),
+        strides=(samples.strides[0] * hop, samples.strides[0]),
+        writeable=False,
+    ), hop
+
+
+def frame_energy_db(samples, rate, frame_ms=30):
+    """Returns the RMS level of each frame in dBFS and the hop in seconds."""
+    frames, hop = frame_signal(samples, rate, frame_ms)
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10)), hop / rate
+
+
+def runs_of(mask):
+    """Returns ``(start, end)`` index pairs of consecutive True values in a boolean array."""
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(np.diff(padded.astype(np.int8)))
+    return list(zip(edges[::2], edges[1::2]))
+
+
+def find_silences(samples, rate, threshold_db=-40.0, min_silence_ms=500, frame_ms=30):
+    """Returns ``(start_s, end_s)`` intervals where the level stays below ``threshold_db``."""
+    energy, hop_s = frame_energy_db(samples, rate, frame_ms)
+    min_frames = max(1, int(min_silence_ms / 1000 / hop_s))
+    return [
+        (float(start * hop_s), float(end * hop_s))
+        for start, end in runs_of(energy < threshold_db)
+        if end - start >= min_frames
+    ]
+
+
+def resample(samples, rate, target_rate):
+    """Resamples mono float samples to ``target_rate`` with vectorized NumPy.
+
+    When downsampling, a short moving-average filter removes most content
+    above the new Nyquist rate before linear interpolation onto the new
+    time grid.
+    """
+    if rate == target_rate or len(samples) == 0:
+        return samples.astype(np.float32, copy=False), rate
+    if target_rate < rate:
+        width = int(round(rate / target_rate))
+        if width > 1:
+            kernel = np.full(width, 1.0 / width, dtype=np.float32)
+            samples = np.convolve(samples.astype(np.float32, copy=False), kernel, mode="same")
+    n_out = int(len(samples) * target_rate / rate)
+    positions = np.arange(n_out, dtype=np.float64) * (rate / target_rate)
+    # Linear interpolation by hand avoids np.interp's float64 copy of the input
+    left = positions.astype(np.int64)
+    frac = (positions - left).astype(np.float32)
+    right = np.minimum(left + 1, len(samples) - 1)
+    out = samples[left] * (1 - frac) + samples[right] * frac
+    return out.astype(np.float32, copy=False), target_rate
+
+
+def array_to_segment(samples, rate):
+    """Builds a 16-bit mono pydub AudioSegment from float samples in [-1, 1]."""
+    from pydub import AudioSegment
+
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+    return AudioSegment(pcm.tobytes(), frame_rate=rate, sample_width=2, channels=1)
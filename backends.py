@@ -0,0 +1,283 @@
+"""Model backends: the real Gemini/Groq clients or the local stub server.
+
+Set ``CURATEAI_BACKEND=stub`` (and optionally ``STUB_SERVER_URL``) to send
+every upload and generation request to ``stub_server.py`` instead of the
+real APIs; no API keys are needed then. The stub clients implement the part
+of the ``google.generativeai`` and ``groq.Groq`` interfaces this code uses.
+"""
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+DEFAULT_STUB_URL = "http://localhost:8765"
+
+
+def stub_enabled():
+    return os.environ.get("CURATEAI_BACKEND", "live").lower() == "stub"
+
+
+def stub_url():
+    return os.environ.get("STUB_SERVER_URL", DEFAULT_STUB_URL).rstrip("/")
+
+
+def gemini_backend():
+    """Returns the module-like Gemini backend: ``google.generativeai`` or a stub client."""
+    if stub_enabled():
+        return StubGemini(stub_url())
+    import google.generativeai as genai
+
+    return genai
+
+
+def groq_client(api_key=None):
+    """Returns a ``groq.Groq`` client, or a stub client when the stub backend is enabled."""
+    if stub_enabled():
+        return StubGroq(stub_url())
+    from groq import Groq
+
+    return Groq(api_key=api_key)
+
+
+class StubAPIError(RuntimeError):
+    """An error status from the stub server; ``status_code`` is what the retry logic looks at."""
+
+    def __init__(self, status_code, message):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+
+
+def _open(url, body=None, data=None, headers=None, method="POST", timeout=None):
+    if body is not None:
+        data = json.dumps(body).encode("utf-8")
+        headers = dict(headers or {}, **{"Content-Type": "application/json"})
+    request = urllib.request.Request(url, data=data, headers=headers or {}, method=method)
+    try:
+        return urllib.request.urlopen(request, timeout=timeout or 600)
+    except urllib.error.HTTPError as exc:
+        raise StubAPIError(exc.code, exc.read().decode("utf-8", "replace")) from None
+    except urllib.error.URLError as exc:
+        if isinstance(exc.reason, TimeoutError):
+            raise TimeoutError(str(exc.reason)) from None
+        raise ConnectionError(str(exc.reason)) from None
+
+
+def _request(url, **kwargs):
+    with _open(url, **kwargs) as response:
+        return json.loads(response.read() or b"null")
+
+
+def _audio_seconds(data, size=None):
+    """Duration of WAV audio from its header (``size`` is the full length when
+    ``data`` holds only the header), or None for other formats (the server estimates it)."""
+    size = len(data) if size is None else size
+    if bytes(data[:4]) != b"RIFF" or len(data) < 44:
+        return None
+    channels = int.from_bytes(bytes(data[22:24]), "little")
+    rate = int.from_bytes(bytes(data[24:28]), "little")
+    width = int.from_bytes(bytes(data[34:36]), "little") // 8
+    return (size - 44) / max(1, channels * rate * width)
+
+
+class StubFile(SimpleNamespace):
+    pass
+
+
+def _usage_metadata(usage):
+    return SimpleNamespace(
+        prompt_token_count=usage.get("prompt_tokens", 0),
+        candidates_token_count=usage.get("output_tokens", 0),
+        cached_content_token_count=usage.get("cached_tokens", 0),
+    )
+
+
+class StubResponse:
+    """Looks like a Gemini response; iterating it yields chunks, like ``stream=True``."""
+
+    def __init__(self, payload, chunk_chars=200):
+        self.text = payload["text"]
+        self.usage_metadata = _usage_metadata(payload.get("usage", {}))
+        self._chunk_chars = chunk_chars
+
+    def __iter__(self):
+        for start in range(0, len(self.text), self._chunk_chars):
+            yield SimpleNamespace(text=self.text[start:start + self._chunk_chars])
+
+
+class StubStreamResponse:
+    """A streamed Gemini response: chunks arrive as the server sends them (one JSON line each).
+
+    ``text`` and ``usage_metadata`` are complete once the stream has been read.
+    """
+
+    def __init__(self, response):
+        self._response = response
+        self._texts = []
+        self.usage_metadata = None
+
+    def __iter__(self):
+        with self._response:
+            for line in self._response:
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                if "usage" in chunk:
+                    self.usage_metadata = _usage_metadata(chunk["usage"])
+                if chunk.get("text"):
+                    self._texts.append(chunk["text"])
+                    yield SimpleNamespace(text=chunk["text"])
+
+    @property
+    def text(self):
+        return "".join(self._texts)
+
+
+class StubModel:
+    """Stand-in for ``genai.GenerativeModel`` backed by the stub server."""
+
+    def __init__(self, base_url, model_name, system_instruction=None, cached_content=None):
+        self.base_url = base_url
+        self.model_name = model_name if model_name.startswith("models/") else f"models/{model_name}"
+        self.system_instruction = system_instruction
+        self.cached_content = cached_content
+
+    def generate_content(self, contents, generation_config=None, request_options=None, stream=False, **kwargs):
+        parts = []
+        for part in contents if isinstance(contents, list) else [contents]:
+            if isinstance(part, str):
+                parts.append({"text": part})
+            elif isinstance(part, StubFile):
+                parts.append({"file": part.name})
+            elif isinstance(part, dict) and "data" in part:
+                # Inline audio: only its size and length matter to the stub
+                parts.append({"inline_bytes": len(part["data"]), "duration_s": _audio_seconds(part["data"])})
+            else:
+                parts.append({"text": str(part)})
+        request = {
+            "url": f"{self.base_url}/v1/{self.model_name}:generateContent",
+            "body": {
+                "parts": parts, "stream": stream, "system_instruction": self.system_instruction,
+                "cached_content": self.cached_content,
+            },
+            "timeout": (request_options or {}).get("timeout"),
+        }
+        if stream:
+            return StubStreamResponse(_open(**request))
+        return StubResponse(_request(**request))
+
+
+class _StubModels:
+    """``genai.GenerativeModel``: called to build a model, or ``from_cached_content``."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def __call__(self, model_name, system_instruction=None, **kwargs):
+        return StubModel(self.base_url, model_name, system_instruction)
+
+    def from_cached_content(self, cached_content, **kwargs):
+        return StubModel(self.base_url, cached_content.model, cached_content=cached_content.name)
+
+
+class StubCachedContent:
+    """Stand-in for ``genai.caching.CachedContent`` (a prompt prefix stored by the stub server)."""
+
+    def __init__(self, base_url, payload):
+        self.base_url = base_url
+        self._set(payload)
+
+    def _set(self, payload):
+        self.name = payload["name"]
+        self.model = payload["model"]
+        self.display_name = payload.get("display_name")
+        self.expire_time = datetime.fromtimestamp(payload["expires_at"], tz=timezone.utc)
+        self.usage_metadata = SimpleNamespace(total_token_count=payload["tokens"])
+
+    @classmethod
+    def create(cls, base_url, model, display_name=None, system_instruction=None, contents=None, ttl=None):
+        model = model if model.startswith("models/") else f"models/{model}"
+        payload = _request(f"{base_url}/v1/cachedContents", body={
+            "model": model,
+            "display_name": display_name,
+            "system_instruction": system_instruction,
+            "contents": [str(part) for part in contents or []],
+            "ttl_s": ttl.total_seconds() if ttl is not None else 3600,
+        })
+        return cls(base_url, payload)
+
+    def update(self, ttl=None, **kwargs):
+        self._set(_request(f"{self.base_url}/v1/{self.name}", body={"ttl_s": ttl.total_seconds()}, method="PATCH"))
+
+    def delete(self):
+        _request(f"{self.base_url}/v1/{self.name}", method="DELETE")
+
+
+class StubGemini:
+    """Module-like stand-in for ``google.generativeai`` talking to the stub server."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.GenerativeModel = _StubModels(base_url)
+        self.caching = SimpleNamespace(CachedContent=SimpleNamespace(
+            create=lambda model, **kwargs: StubCachedContent.create(base_url, model, **kwargs)
+        ))
+
+    def configure(self, api_key=None, **kwargs):
+        pass
+
+    def upload_file(self, path, mime_type=None, display_name=None):
+        size = os.path.getsize(path)
+        headers = {"Content-Type": mime_type or "application/octet-stream", "Content-Length": str(size)}
+        with open(path, "rb") as f:
+            seconds = _audio_seconds(f.read(44), size)
+            if seconds is not None:
+                headers["X-Audio-Seconds"] = str(seconds)
+            f.seek(0)
+            # Streamed from disk, so the upload does not hold the file in memory
+            payload = _request(f"{self.base_url}/v1/files", data=f, headers=headers)
+        return StubFile(
+            name=payload["name"],
+            uri=f"{self.base_url}/v1/{payload['name']}",
+            mime_type=mime_type,
+            size_bytes=size,
+            expiration_time=datetime.fromtimestamp(payload["expires_at"], tz=timezone.utc),
+            create_time=datetime.fromtimestamp(time.time(), tz=timezone.utc),
+        )
+
+    def delete_file(self, name):
+        name = getattr(name, "name", name)
+        _request(f"{self.base_url}/v1/{name}", method="DELETE")
+
+
+class _StubCompletions:
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def create(self, messages, model, timeout=None, **params):
+        payload = _request(
+            f"{self.base_url}/openai/v1/chat/completions",
+            body={"model": model, "messages": messages},
+            timeout=timeout,
+        )
+        usage = payload.get("usage", {})
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=payload["text"]))],
+            usage=SimpleNamespace(
+                prompt_tokens=usage.get("prompt_tokens", 0), completion_tokens=usage.get("output_tokens", 0)
+            ),
+        )
+
+
+class StubGroq:
+    """Stand-in for ``groq.Groq`` talking to the stub server."""
+
+    def __init__(self, base_url):
+        self.chat = SimpleNamespace(completions=_StubCompletions(base_url))
+
+
+def stub_stats(base_url=None):
+    """Request, byte and fault counters of the stub server."""
+    return _request(f"{base_url or stub_url()}/stats", method="GET")
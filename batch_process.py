@@ -0,0 +1,342 @@
+"""Headless batch pipeline for a directory (or manifest) of call recordings.
+
+Runs the same two stages as the Streamlit apps (transcript prompt, then
+``prompt_transcript_to_output``) for many calls at once and writes one JSON
+line per call. Re-running with the same output file skips calls that already
+finished, so an interrupted nightly run can simply be restarted.
+
+Example:
+    python batch_process.py recordings/ --output results.jsonl --analysis-provider groq
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from file_cache import content_hash
+from result_cache import DEFAULT_CACHE_PATH, ResultCache
+from backends import gemini_backend, groq_client, stub_enabled
+from ingest import SessionFiles, open_mapped
+from rate_limit import ProviderLimiter
+from metrics import call_scope, instrumented_upload, start_metrics_server
+from provider_router import RetryPolicy, build_analysis_router
+from json_repair import PARSE_STATS
+from call_store import DEFAULT_STORE_PATH, CallStore, batch_record_to_call
+from prompts import system_prompt_audio, system_prompt_json
+from prompt_registry import DEFAULT_TTL_S, PromptCache
+from audio_utils import load_audio
+from audio_preprocess import (
+    PREPROCESS_SETTINGS,
+    encode_segment,
+    load_time_remap,
+    normalize_audio,
+    preprocessed_hash,
+    preprocessed_segment,
+    save_time_remap,
+)
+from chunked_transcription import transcribe_long_audio
+from pipeline import (
+    VALID_EXTENSIONS,
+    GROQ_MODEL,
+    mime_type_for,
+    transcribe_audio,
+    transcript_to_original_time,
+    parse_json,
+)
+
+
+def load_secret(name, env_var):
+    """Reads an API key from the environment, falling back to .streamlit/secrets.toml."""
+    if stub_enabled():
+        # The stub server accepts any key
+        return None
+    if os.environ.get(env_var):
+        return os.environ[env_var]
+    secrets_path = Path(".streamlit") / "secrets.toml"
+    if secrets_path.exists():
+        import toml
+        value = toml.load(secrets_path).get(name)
+        if value:
+            return value
+    raise SystemExit(f"Missing API key: set {env_var} or add {name} to {secrets_path}")
+
+
+def collect_inputs(inputs):
+    """Expands directories and manifest files (one path per line) into audio paths."""
+    paths = []
+    for item in inputs:
+        item = Path(item)
+        if item.is_dir():
+            paths.extend(sorted(p for p in item.rglob("*") if p.suffix.lower() in VALID_EXTENSIONS))
+        elif item.suffix.lower() in VALID_EXTENSIONS:
+            paths.append(item)
+        elif item.is_file():
+            # Manifest: one audio path per line, relative to the manifest
+            for line in item.read_text().splitlines():
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    path = Path(line)
+                    paths.append(path if path.is_absolute() else item.parent / path)
+    return [p.resolve() for p in paths]
+
+
+def load_finished(output_path):
+    """Returns the set of audio paths that already have a successful record."""
+    finished = set()
+    if not os.path.exists(output_path):
+        return finished
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A partially written last line from an interrupted run
+                continue
+            if record.get("status") == "ok":
+                finished.add(record["path"])
+    return finished
+
+
+class BatchRunner:
+    """Processes calls on a thread pool with per-provider limits."""
+
+    def __init__(self, args):
+        genai = gemini_backend()
+
+        self.args = args
+        self.genai = genai
+        genai.configure(api_key=load_secret("gemini_api_key", "GEMINI_API_KEY"))
+        self.model_audio = genai.GenerativeModel(model_name=args.audio_model, system_instruction=system_prompt_audio)
+        self.model_json = genai.GenerativeModel(model_name=args.analysis_model, system_instruction=system_prompt_json)
+        self.prompt_cache = None
+        if args.prompt_cache_ttl:
+            # Requests reference the static prompts cached on Gemini instead of resending them
+            self.prompt_cache = PromptCache(genai, ttl_s=args.prompt_cache_ttl)
+            self.model_audio = self.prompt_cache.wrap(self.model_audio, system_prompt_audio)
+            self.model_json = self.prompt_cache.wrap(self.model_json, system_prompt_json)
+        self.groq_client = None
+        if args.analysis_provider == "groq" or args.failover:
+            self.groq_client = groq_client(load_secret("groq_key", "GROQ_API_KEY"))
+        self.result_cache = None if args.no_cache else ResultCache(args.cache_path)
+        self.upload_limiter = ProviderLimiter("gemini-upload", args.upload_concurrency)
+        self.gemini_limiter = ProviderLimiter("gemini", args.gemini_concurrency, args.gemini_rpm)
+        self.groq_limiter = ProviderLimiter("groq", args.groq_concurrency, args.groq_rpm)
+        # Without --failover only the chosen provider is used (still with retries and deadlines)
+        self.analysis_router = build_analysis_router(
+            self.model_json if args.analysis_provider == "gemini" or args.failover else None,
+            self.groq_client,
+            primary=args.analysis_provider,
+            result_cache=self.result_cache,
+            gemini_limiter=self.gemini_limiter,
+            groq_limiter=self.groq_limiter,
+            groq_model=args.groq_model,
+            hedge=args.hedge,
+            policy=RetryPolicy(attempt_timeout_s=args.attempt_timeout, deadline_s=args.analysis_deadline),
+            max_workers=2 * args.workers,
+        )
+
+    def close(self):
+        """Deletes the cached prompt prefixes instead of paying for them until their TTL ends."""
+        if self.prompt_cache is not None:
+            self.prompt_cache.close()
+
+    def upload(self, path, mime_type):
+        with self.upload_limiter:
+            return self.genai.upload_file(path, mime_type=mime_type)
+
+    def process(self, path, options=None, call_id=None, on_stage=None):
+        """Runs both stages for one recording and returns its result record.
+
+        ``options`` overrides pipeline arguments for this call only (e.g.
+        ``{"compress": True}``), and ``on_stage`` is called with "transcript",
+        "upload" (only when the transcript is not cached) and "analysis" as
+        the call progresses.
+        """
+        settings = argparse.Namespace(**{**vars(self.args), **(options or {})})
+        # Every span of this call (upload, transcript, analysis...) shares one call ID
+        with call_scope(call_id) as call_id:
+            record = self._process(path, settings, on_stage or (lambda stage: None))
+        record["call_id"] = call_id
+        return record
+
+    def _process(self, path, settings, on_stage):
+        started = time.time()
+        record = {"path": str(path), "status": "ok"}
+        # Temp files and Gemini uploads for this call, removed when it finishes
+        call_files = SessionFiles(delete_file=self.genai.delete_file)
+        upload = call_files.tracked_upload(instrumented_upload(self.upload))
+        try:
+            with open_mapped(path) as data:
+                record["audio_hash"] = content_hash(data)
+                record["bytes"] = len(data)
+            upload_hash = record["audio_hash"]
+            preprocess_settings = dict(PREPROCESS_SETTINGS, trim_silence=settings.trim_silence)
+            if settings.compress:
+                # Known without preprocessing, so cached transcripts skip it entirely
+                upload_hash = preprocessed_hash(upload_hash, preprocess_settings)
+
+            segment = None
+            if settings.window_minutes:
+                # Windows are cut from the same (compressed, trimmed) audio a single upload would send
+                if settings.compress:
+                    segment, prep_stats = preprocessed_segment(str(path), path.suffix.strip("."), **preprocess_settings)
+                    if "vad" in prep_stats:
+                        record["vad"] = prep_stats["vad"]
+                        record["time_remap"] = prep_stats["time_remap"]
+                else:
+                    segment = load_audio(str(path))
+
+            def prepare_upload():
+                """Compresses (with --compress) and uploads the call; only run on a transcript cache miss."""
+                on_stage("upload")
+                upload_path, upload_mime = str(path), mime_type_for(path)
+                if settings.compress:
+                    if segment is not None:
+                        # Already preprocessed for windowing, but too short to need windows
+                        compressed, upload_mime = encode_segment(segment, PREPROCESS_SETTINGS["codec"], PREPROCESS_SETTINGS["bitrate"])
+                        prep_stats = {}
+                    else:
+                        compressed, upload_mime, prep_stats = normalize_audio(upload_path, path.suffix.strip("."), **preprocess_settings)
+                    upload_path = call_files.spool(compressed, suffix=f".{PREPROCESS_SETTINGS['codec']}")
+                    record["bytes_uploaded"] = len(compressed)
+                    del compressed
+                    if "vad" in prep_stats:
+                        record["vad"] = prep_stats["vad"]
+                        record["time_remap"] = prep_stats["time_remap"]
+                    # Needed to place the turns of this transcript whenever it is served from the cache
+                    save_time_remap(self.result_cache, upload_hash, record.get("time_remap"))
+                uploaded = upload(upload_path, mime_type=upload_mime)
+                on_stage("transcript")
+                return uploaded
+
+            if segment is not None and len(segment) > settings.window_minutes * 60 * 1000:
+                on_stage("transcript")
+                transcript_json, long_stats = transcribe_long_audio(
+                    self.model_audio, segment, upload, self.result_cache, self.gemini_limiter,
+                    window_s=settings.window_minutes * 60, session_files=call_files,
+                    bitrate=PREPROCESS_SETTINGS["bitrate"] if settings.compress else None,
+                    time_remap=record.get("time_remap"),
+                )
+                record["windows"] = len(long_stats["windows"])
+                if long_stats["failed_windows"]:
+                    raise RuntimeError(f"windows failed: {long_stats['failed_windows']}")
+            else:
+                on_stage("transcript")
+                response_text, record["transcript_cached"] = transcribe_audio(
+                    self.model_audio, prepare_upload, upload_hash, self.result_cache, self.gemini_limiter
+                )
+                transcript_json = parse_json(response_text, "transcript")
+                if settings.compress and settings.trim_silence:
+                    if "time_remap" not in record:
+                        record["time_remap"] = load_time_remap(self.result_cache, upload_hash)
+                    transcript_json = transcript_to_original_time(transcript_json, record["time_remap"])
+            del segment
+            record["transcript"] = transcript_json
+
+            on_stage("analysis")
+            record["compaction"] = {}
+            response_text, record["analysis_cached"] = self.analysis_router.analyze(
+                transcript_json, report=record["compaction"]
+            )
+            record["analysis_provider"] = record["compaction"].pop("provider", None)
+            record["analysis_hedged"] = record["compaction"].pop("hedged", False)
+            record["analysis"] = parse_json(response_text, "analysis")
+        except Exception as exc:
+            record["status"] = "error"
+            record["error"] = f"{type(exc).__name__}: {exc}"
+        finally:
+            call_files.cleanup()
+        record["elapsed_s"] = round(time.time() - started, 3)
+        return record
+
+
+def run(args):
+    paths = collect_inputs(args.inputs)
+    finished = load_finished(args.output)
+    pending = [p for p in paths if str(p) not in finished]
+    print(f"{len(paths)} calls found, {len(paths) - len(pending)} already done, {len(pending)} to process", file=sys.stderr)
+    if not pending:
+        return 0
+
+    runner = BatchRunner(args)
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+        print(f"Serving metrics on http://localhost:{args.metrics_port}/metrics", file=sys.stderr)
+    store = None if args.no_store else CallStore(args.store)
+    write_lock = threading.Lock()
+    failures = 0
+    with open(args.output, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(runner.process, path): path for path in pending}
+        for done, future in enumerate(as_completed(futures), start=1):
+            record = future.result()
+            if record["status"] != "ok":
+                failures += 1
+            with write_lock:
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+            call = batch_record_to_call(record, args.agent_from_dir)
+            if store is not None and call is not None:
+                store.ingest(**call)
+            print(f"[{done}/{len(pending)}] {record['status']} {record['path']} ({record['elapsed_s']}s)", file=sys.stderr)
+    runner.close()
+    for stage, stats in PARSE_STATS.summary().items():
+        print(
+            f"{stage} output: {stats['ok']} valid, {stats['repaired']} repaired, {stats['salvaged']} salvaged, "
+            f"{stats['failed']} unusable ({stats['reruns_avoided']} re-runs avoided)",
+            file=sys.stderr,
+        )
+    return 1 if failures else 0
+
+
+def add_pipeline_arguments(parser):
+    """Options of BatchRunner, shared with ``job_service.py serve``."""
+    parser.add_argument("--analysis-provider", choices=["gemini", "groq"], default="gemini")
+    parser.add_argument("--audio-model", default="gemini-2.0-flash-001")
+    parser.add_argument("--analysis-model", default="gemini-2.0-flash")
+    parser.add_argument("--groq-model", default=GROQ_MODEL)
+    parser.add_argument("--workers", type=int, default=16, help="Calls processed at the same time")
+    parser.add_argument("--upload-concurrency", type=int, default=8)
+    parser.add_argument("--gemini-concurrency", type=int, default=8)
+    parser.add_argument("--gemini-rpm", type=float, default=0, help="Gemini requests per minute (0 = unlimited)")
+    parser.add_argument("--groq-concurrency", type=int, default=4)
+    parser.add_argument("--groq-rpm", type=float, default=0, help="Groq requests per minute (0 = unlimited)")
+    parser.add_argument("--window-minutes", type=float, default=0,
+                        help="Split recordings longer than this into parallel overlapping windows (0 = off)")
+    parser.add_argument("--compress", action="store_true",
+                        help="Downmix to mono, resample to 16 kHz and re-encode before uploading")
+    parser.add_argument("--no-trim", dest="trim_silence", action="store_false",
+                        help="With --compress, keep long silences and hold music")
+    parser.add_argument("--failover", action="store_true",
+                        help="Fall back to the other analysis provider when the chosen one fails (needs both keys)")
+    parser.add_argument("--hedge", action="store_true",
+                        help="With --failover, also ask the other provider when the first one is slower than its p95")
+    parser.add_argument("--attempt-timeout", type=float, default=60, help="Seconds allowed per analysis request")
+    parser.add_argument("--analysis-deadline", type=float, default=150,
+                        help="Seconds allowed for the analysis of one call, retries included")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the on-disk result cache")
+    parser.add_argument("--prompt-cache-ttl", type=float, default=0,
+                        help=f"Seconds the static prompt prefixes stay cached on Gemini, e.g. {DEFAULT_TTL_S:g} "
+                             "(0 = send them in full; prefixes below the model's minimum cache size always are)")
+    parser.add_argument("--cache-path", default=DEFAULT_CACHE_PATH, help="On-disk result cache to use")
+    parser.add_argument("--metrics-port", type=int, default=0,
+                        help="Serve Prometheus metrics on this port while running (0 = off)")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH, help="Call analytics store that finished calls are added to")
+    parser.add_argument("--no-store", action="store_true", help="Do not add finished calls to the call analytics store")
+    parser.add_argument("--agent-from-dir", action="store_true",
+                        help="Record each call's parent directory name as its agent in the call analytics store")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Transcribe and analyze a batch of call recordings.")
+    parser.add_argument("inputs", nargs="+", help="Audio files, directories, or manifest files with one path per line")
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSON-lines output file (appended to, used for resume)")
+    add_pipeline_arguments(parser)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(run(parse_args()))
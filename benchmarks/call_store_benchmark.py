@@ -0,0 +1,91 @@
+"""Benchmark of aggregate queries on the call analytics store.
+
+Fills a temporary store with synthetic calls (random agents, emotions,
+keywords, entities and satisfaction over the last 30 days) and times each
+dashboard query.
+
+    python -m benchmarks.call_store_benchmark --calls 100000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from call_store import CallStore  # noqa: E402
+from local_extraction import DEFAULT_KEYWORDS  # noqa: E402
+
+EMOTIONS = ["neutral", "happy", "frustrated", "angry", "confused", "relieved", "grateful", "sympathetic"]
+ORGANIZATIONS = ["Newco", "General", "Acme", "Globex", "Initech"]
+CITIES = ["Fort Morgan", "Denver", "Austin", "Boston", "Seattle"]
+
+
+def synthetic_call(rng, now, agents):
+    turns = []
+    for index in range(rng.randint(10, 60)):
+        turns.append({
+            "Speaker": "Agent" if index % 2 == 0 else "Client",
+            "Voice": "...",
+            "Emotion": rng.choice(EMOTIONS),
+        })
+    analysis = {
+        "Important Words Used in the Conversation": rng.sample(list(DEFAULT_KEYWORDS), 4),
+        "Important Conclusion and Summary of Conversation": "Synthetic call.",
+        "Entities Detected": {"Organization": [rng.choice(ORGANIZATIONS)], "Location": [rng.choice(CITIES)]},
+        "Client Satisfaction": rng.random() < 0.7,
+    }
+    return dict(
+        call_key=f"{rng.getrandbits(128):032x}",
+        transcript_json={"Call Details": {"Number of Speakers": 2, "Transcript": turns}},
+        analysis_json=analysis,
+        agent=rng.choice(agents),
+        processed_at=now - rng.random() * 30 * 86400,
+    )
+
+
+def timed(label, fn):
+    started = time.perf_counter()
+    rows = fn()
+    print(f"{label:<40} {1000 * (time.perf_counter() - started):8.1f} ms  ({len(rows) if isinstance(rows, list) else 1} rows)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=100000)
+    parser.add_argument("--agents", type=int, default=200)
+    parser.add_argument("--store", help="Existing store to query instead of a synthetic one")
+    args = parser.parse_args(argv)
+
+    now = time.time()
+    week_ago = now - 7 * 86400
+    directory = tempfile.mkdtemp()
+    path = args.store or os.path.join(directory, "calls.sqlite3")
+    store = CallStore(path)
+    if not args.store:
+        rng = random.Random(0)
+        agents = [f"agent-{i:03d}" for i in range(args.agents)]
+        started = time.perf_counter()
+        for start in range(0, args.calls, 1000):
+            store.ingest_many([synthetic_call(rng, now, agents) for _ in range(min(1000, args.calls - start))])
+        print(f"Ingested {args.calls} calls in {time.perf_counter() - started:.1f}s "
+              f"({os.path.getsize(path) / (1024 * 1024):.0f} MB)")
+
+    timed("satisfaction, last 7 days", lambda: store.satisfaction(since=week_ago))
+    timed("satisfaction, all time", lambda: store.satisfaction())
+    timed("client emotions, last 7 days", lambda: store.emotion_counts("Client", since=week_ago))
+    timed("client emotions, all time", lambda: store.emotion_counts("Client"))
+    timed("agents by client frustration, 7 days", lambda: store.agents_by_emotion("frustrated", since=week_ago))
+    timed("agents by client frustration, all time", lambda: store.agents_by_emotion("frustrated"))
+    timed("top keywords, last 7 days", lambda: store.top_keywords(since=week_ago))
+    timed("top keywords, all time", lambda: store.top_keywords())
+    timed("top organizations", lambda: store.top_entities("Organization"))
+    timed("unsatisfied angry calls about refunds", lambda: store.find_calls(
+        emotion="angry", keyword="refund", satisfied=False))
+
+
+if __name__ == "__main__":
+    main()
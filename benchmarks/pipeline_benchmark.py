@@ -0,0 +1,200 @@
+"""Offline benchmark of the full pipeline against the local stub API.
+
+Starts ``stub_server.py`` in-process, generates synthetic calls of several
+lengths and runs them through ``BatchRunner`` (upload, transcript, analysis)
+with a fresh result cache. Reports throughput, call latency percentiles, peak
+memory and, per stage, latency, bytes uploaded and tokens (with those served
+from cached prompt prefixes). Any pipeline option can be passed through, so
+changes like compression, chunking or compaction can be compared without API
+keys:
+
+    python -m benchmarks.pipeline_benchmark --minutes 1 5 15 --repeat 4 --save before.json
+    python -m benchmarks.pipeline_benchmark --minutes 1 5 15 --repeat 4 --compress --baseline before.json
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import metrics  # noqa: E402
+from backends import stub_stats  # noqa: E402
+from batch_process import BatchRunner, add_pipeline_arguments  # noqa: E402
+from benchmarks.preprocess_benchmark import synthetic_call_wav  # noqa: E402
+from stub_server import PROFILES, StubServer  # noqa: E402
+
+
+class SpanCollector:
+    """Stands in for the span log and keeps every finished span in memory."""
+
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        with self._lock:
+            self.records.append(dict(record))
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def stage_summary(records):
+    stages = {}
+    for record in records:
+        stages.setdefault(record["stage"], []).append(record)
+    summary = {}
+    for stage, spans in sorted(stages.items()):
+        seconds = [s["seconds"] for s in spans]
+        summary[stage] = {
+            "count": len(spans),
+            "errors": sum(s["status"] != "ok" for s in spans),
+            "cache_hits": sum(s["cache"] == "hit" for s in spans),
+            "p50_s": percentile(seconds, 0.5),
+            "p95_s": percentile(seconds, 0.95),
+            "bytes": sum(s["bytes"] for s in spans),
+            "prompt_tokens": sum(s["prompt_tokens"] for s in spans),
+            "output_tokens": sum(s["output_tokens"] for s in spans),
+            "cached_tokens": sum(s.get("cached_tokens", 0) for s in spans),
+        }
+    return summary
+
+
+def run_pass(runner, paths, workers):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        records = list(executor.map(runner.process, paths))
+    return records, time.perf_counter() - started
+
+
+def summarize(records, wall_s, audio_minutes, spans):
+    latencies = [r["elapsed_s"] for r in records]
+    return {
+        "calls": len(records),
+        "failed": sum(r["status"] != "ok" for r in records),
+        "wall_s": round(wall_s, 3),
+        "calls_per_min": round(len(records) / wall_s * 60, 2),
+        "audio_min_per_min": round(audio_minutes / wall_s * 60, 2),
+        "p50_s": percentile(latencies, 0.5),
+        "p95_s": percentile(latencies, 0.95),
+        "p99_s": percentile(latencies, 0.99),
+        "stages": stage_summary(spans),
+    }
+
+
+def print_report(name, result, baseline=None):
+    def delta(value, before):
+        if before in (None, 0) or value is None:
+            return ""
+        return f" ({(value - before) / before:+.0%})"
+
+    before = baseline or {}
+    print(f"\n{name}: {result['calls']} calls, {result['failed']} failed in {result['wall_s']:.1f}s")
+    print(f"  throughput   {result['calls_per_min']:.1f} calls/min{delta(result['calls_per_min'], before.get('calls_per_min'))}, "
+          f"{result['audio_min_per_min']:.1f} audio min/min")
+    for key in ("p50_s", "p95_s", "p99_s"):
+        print(f"  latency {key[:3]}  {result[key] or 0:.2f}s{delta(result[key], before.get(key))}")
+    print(f"  {'stage':<18}{'count':>6}{'errors':>7}{'hits':>6}{'p50 s':>8}{'p95 s':>8}{'MB':>9}{'tok in':>10}{'cached':>9}{'tok out':>9}")
+    for stage, stats in result["stages"].items():
+        old = before.get("stages", {}).get(stage, {})
+        print(
+            f"  {stage:<18}{stats['count']:>6}{stats['errors']:>7}{stats['cache_hits']:>6}{stats['p50_s'] or 0:>8.2f}"
+            f"{stats['p95_s'] or 0:>8.2f}{stats['bytes'] / 1e6:>9.2f}{stats['prompt_tokens']:>10}{stats['cached_tokens']:>9}{stats['output_tokens']:>9}"
+            f"{delta(stats['p50_s'], old.get('p50_s'))}"
+        )
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--minutes", type=float, nargs="*", default=[1, 5, 15], help="Synthetic call lengths")
+    parser.add_argument("--repeat", type=int, default=2, help="Distinct calls per length")
+    parser.add_argument("--passes", type=int, default=1, help="Runs over the same calls (later ones hit the result cache)")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="fast", help="Stub latency and fault profile")
+    parser.add_argument("--error-rate", type=float, help="Override the profile's share of failed requests")
+    parser.add_argument("--truncate-rate", type=float, help="Override the profile's share of cut-off responses")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the stub's fault injection")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against results saved with --save")
+    add_pipeline_arguments(parser)
+    # A throwaway cache and no analytics store, unless asked for
+    parser.set_defaults(workers=4, cache_path=None, no_store=True)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    overrides = {
+        key: value for key, value in (("error_rate", args.error_rate), ("truncate_rate", args.truncate_rate))
+        if value is not None
+    }
+    server = StubServer(port=0, profile=args.profile, seed=args.seed, **overrides).start()
+    os.environ["CURATEAI_BACKEND"] = "stub"
+    os.environ["STUB_SERVER_URL"] = server.url
+    collector = SpanCollector()
+    metrics.SPAN_LOG = collector
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    with tempfile.TemporaryDirectory(prefix="pipeline-bench-") as tmp:
+        if args.cache_path is None:
+            args.cache_path = os.path.join(tmp, "results.sqlite3")
+        paths = []
+        for minutes in args.minutes:
+            for index in range(args.repeat):
+                path = Path(tmp) / f"call_{minutes:g}min_{index}.wav"
+                path.write_bytes(synthetic_call_wav(minutes, seed=index))
+                paths.append(path)
+        audio_minutes = sum(args.minutes) * args.repeat
+        print(f"{len(paths)} synthetic calls ({audio_minutes:g} audio minutes), {args.workers} workers, "
+              f"{args.profile} stub profile", file=sys.stderr)
+
+        tracemalloc.start()
+        runner = BatchRunner(args)
+        results = {}
+        for number in range(1, args.passes + 1):
+            collector.records.clear()
+            records, wall_s = run_pass(runner, paths, args.workers)
+            name = "cold" if number == 1 else f"pass {number}"
+            results[name] = summarize(records, wall_s, audio_minutes, collector.records)
+            for record in records:
+                if record["status"] != "ok":
+                    print(f"  failed {Path(record['path']).name}: {record['error']}", file=sys.stderr)
+        peak_traced = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    stats = stub_stats(server.url)
+    server.stop()
+    results["memory"] = {
+        "peak_python_mb": round(peak_traced / 1e6, 1),
+        # ru_maxrss is in kilobytes on Linux
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    results["stub"] = stats
+
+    for name, result in results.items():
+        if name not in ("memory", "stub"):
+            print_report(name, result, (baseline or {}).get(name))
+    print(f"\npeak memory: {results['memory']['peak_python_mb']} MB Python heap, {results['memory']['max_rss_mb']} MB RSS")
+    print(f"stub: {stats['bytes_uploaded'] / 1e6:.1f} MB uploaded, {stats['errors']} injected errors, "
+          f"{stats['truncated']} truncated responses, requests {stats['requests']}")
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
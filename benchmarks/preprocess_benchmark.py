@@ -0,0 +1,96 @@
+"""Benchmark of client-side audio normalization before upload.
+
+Compares uploading the original WAV against normalizing it first (mono,
+16 kHz, low-bitrate mp3). Upload time is estimated from ``--uplink-mbps``
+unless ``--upload`` is given, in which case the files are really uploaded
+to Gemini (needs GEMINI_API_KEY).
+
+    python -m benchmarks.preprocess_benchmark --minutes 1 5 15
+    python -m benchmarks.preprocess_benchmark --files calls/*.wav --upload
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+import wave
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from audio_preprocess import PREPROCESS_SETTINGS, normalize_audio  # noqa: E402
+
+
+def synthetic_call_wav(minutes, rate=44100, channels=2, seed=0):
+    """Returns WAV bytes of alternating noise bursts and pauses, like a two-party call."""
+    rng = np.random.default_rng(seed)
+    n = int(minutes * 60 * rate)
+    t = np.arange(n, dtype=np.float32) / rate
+    # Turns of ~5 s separated by pauses, with a 4 Hz syllable rhythm
+    envelope = (np.sin(2 * np.pi * t / 7.0) > -0.3) * np.clip(np.sin(2 * np.pi * 4 * t), 0.05, None)
+    voice = (
+        0.2 * np.sin(2 * np.pi * 180 * t)
+        + 0.1 * np.sin(2 * np.pi * 720 * t)
+        + 0.05 * np.sin(2 * np.pi * 1600 * t)
+        + 0.02 * rng.standard_normal(n)
+    )
+    mono = (voice * envelope).astype(np.float32)
+    pcm = (np.clip(np.repeat(mono[:, None], channels, axis=1), -1, 1) * 32767).astype("<i2")
+    out = io.BytesIO()
+    with wave.open(out, "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(pcm.tobytes())
+    return out.getvalue()
+
+
+def upload_seconds(data, mime_type, suffix, args):
+    if not args.upload:
+        return len(data) * 8 / (args.uplink_mbps * 1_000_000)
+    import google.generativeai as genai
+
+    genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        started = time.perf_counter()
+        file = genai.upload_file(path, mime_type=mime_type)
+        seconds = time.perf_counter() - started
+        genai.delete_file(file.name)
+        return seconds
+    finally:
+        os.remove(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--minutes", type=float, nargs="*", default=[1, 5, 15], help="Synthetic WAV lengths")
+    parser.add_argument("--files", nargs="*", default=[], help="Real WAV files to use instead")
+    parser.add_argument("--uplink-mbps", type=float, default=20.0, help="Assumed upload bandwidth")
+    parser.add_argument("--upload", action="store_true", help="Really upload to Gemini instead of estimating")
+    parser.add_argument("--trim", action="store_true", help="Also trim silence and hold music")
+    args = parser.parse_args(argv)
+    settings = dict(PREPROCESS_SETTINGS, trim_silence=args.trim)
+
+    samples = [(path, Path(path).read_bytes()) for path in args.files]
+    if not samples:
+        samples = [(f"synthetic {m:g} min", synthetic_call_wav(m)) for m in args.minutes]
+
+    print(f"{'input':<24}{'MB in':>8}{'MB out':>8}{'prep s':>8}{'raw total s':>13}{'prep total s':>14}{'speedup':>9}")
+    for name, data in samples:
+        compressed, mime_type, stats = normalize_audio(data, "wav", **settings)
+        raw_total = upload_seconds(data, "audio/wav", ".wav", args)
+        prep_total = stats["seconds"] + upload_seconds(compressed, mime_type, f".{PREPROCESS_SETTINGS['codec']}", args)
+        print(
+            f"{name[:23]:<24}{stats['bytes_in'] / 1e6:>8.1f}{stats['bytes_out'] / 1e6:>8.2f}"
+            f"{stats['seconds']:>8.2f}{raw_total:>13.2f}{prep_total:>14.2f}{raw_total / prep_total:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
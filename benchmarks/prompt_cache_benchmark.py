@@ -0,0 +1,148 @@
+"""Prompt tokens and time to first token with and without cached prompt prefixes.
+
+Sends the same streamed requests per stage (transcript of a short inline
+call, judgment and full analysis of recorded transcripts) once with the
+static prompts in every request and once referencing them as cached content
+(``prompt_registry.PromptCache``). Runs against the in-process stub server,
+which enforces Gemini's per-model minimum cache size, or against Gemini with
+``--live`` (needs GEMINI_API_KEY). Prefixes below the model's minimum are
+sent in full and show no savings; with today's prompts that is all of them.
+
+    python -m benchmarks.prompt_cache_benchmark --requests 20
+    python -m benchmarks.prompt_cache_benchmark --live --model gemini-2.0-flash-001
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from backends import gemini_backend  # noqa: E402
+from benchmarks.pipeline_benchmark import percentile  # noqa: E402
+from benchmarks.preprocess_benchmark import synthetic_call_wav  # noqa: E402
+from prompt_registry import PromptCache  # noqa: E402
+from prompts import (  # noqa: E402
+    Prompt_for_audio_transcript,
+    analysis_generation_config,
+    judgment_generation_config,
+    prompt_transcript_to_judgment,
+    prompt_transcript_to_output,
+    system_prompt_audio,
+    system_prompt_json,
+    transcript_generation_config,
+)
+from stub_server import PROFILES, StubServer, load_fixtures  # noqa: E402
+from transcript_codec import encode_transcript  # noqa: E402
+
+
+def stage_requests(seconds):
+    """(stage, system instruction, contents, generation config) of one request per stage and transcript."""
+    audio = {"mime_type": "audio/wav", "data": synthetic_call_wav(seconds / 60, rate=16000, channels=1)}
+    requests = [("transcript", system_prompt_audio, [audio, Prompt_for_audio_transcript], transcript_generation_config)]
+    for text in load_fixtures()["transcript"]:
+        payload = encode_transcript(json.loads(text))
+        requests.append(("judgment", system_prompt_json, [payload, prompt_transcript_to_judgment], judgment_generation_config))
+        requests.append(("analysis", system_prompt_json, [payload, prompt_transcript_to_output], analysis_generation_config))
+    return requests
+
+
+def timed_request(model, contents, generation_config):
+    """Streams one answer; returns (time to first token, total time, usage metadata)."""
+    started = time.perf_counter()
+    first_token_s = None
+    response = model.generate_content(contents, generation_config=generation_config, stream=True)
+    for _ in response:
+        if first_token_s is None:
+            first_token_s = time.perf_counter() - started
+    return first_token_s, time.perf_counter() - started, response.usage_metadata
+
+
+def run_mode(genai, args, prompt_cache):
+    models = {}
+    for system, name in ((system_prompt_audio, args.audio_model), (system_prompt_json, args.model)):
+        model = genai.GenerativeModel(model_name=name, system_instruction=system)
+        models[system] = prompt_cache.wrap(model, system) if prompt_cache is not None else model
+    variants = {}
+    for stage, *request in stage_requests(args.audio_seconds):
+        variants.setdefault(stage, []).append(request)
+    samples = {}
+    for stage, requests in variants.items():
+        for index in range(args.requests):
+            system, contents, generation_config = requests[index % len(requests)]
+            first_token_s, total_s, usage = timed_request(models[system], contents, generation_config)
+            prompt = getattr(usage, "prompt_token_count", 0) or 0
+            cached = getattr(usage, "cached_content_token_count", 0) or 0
+            samples.setdefault(stage, []).append((first_token_s, total_s, prompt, cached))
+    summary = {}
+    for stage, rows in samples.items():
+        count = len(rows)
+        summary[stage] = {
+            "requests": count,
+            "prompt_tokens": round(sum(r[2] for r in rows) / count),
+            "cached_tokens": round(sum(r[3] for r in rows) / count),
+            "fresh_tokens": round(sum(r[2] - r[3] for r in rows) / count),
+            "ttft_p50_s": percentile([r[0] for r in rows if r[0] is not None], 0.5),
+            "ttft_p95_s": percentile([r[0] for r in rows if r[0] is not None], 0.95),
+            "total_p50_s": percentile([r[1] for r in rows], 0.5),
+        }
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=10, help="Requests per stage and mode")
+    parser.add_argument("--model", default="gemini-2.0-flash", help="Stage-2 model")
+    parser.add_argument("--audio-model", default="gemini-2.0-flash-001")
+    parser.add_argument("--audio-seconds", type=float, default=30, help="Length of the synthetic call for stage 1")
+    parser.add_argument("--ttl", type=float, default=600, help="TTL of the cached prefixes")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="realistic", help="Stub latency profile")
+    parser.add_argument("--live", action="store_true", help="Use the Gemini API instead of the stub server")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    server = None
+    if not args.live:
+        # Faults would only add noise to token counts and latencies
+        server = StubServer(port=0, profile=args.profile, error_rate=0.0, truncate_rate=0.0).start()
+        os.environ["CURATEAI_BACKEND"] = "stub"
+        os.environ["STUB_SERVER_URL"] = server.url
+    genai = gemini_backend()
+    if args.live:
+        from batch_process import load_secret
+
+        genai.configure(api_key=load_secret("gemini_api_key", "GEMINI_API_KEY"))
+
+    prompt_cache = PromptCache(genai, ttl_s=args.ttl)
+    try:
+        results = {"full": run_mode(genai, args, None), "cached": run_mode(genai, args, prompt_cache)}
+        results["prefixes"] = prompt_cache.report()
+    finally:
+        prompt_cache.close()
+        if server is not None:
+            server.stop()
+
+    print(f"{'stage':<12}{'mode':<8}{'prompt tok':>11}{'cached':>8}{'fresh':>8}{'TTFT p50':>10}{'TTFT p95':>10}{'total p50':>11}")
+    for stage in results["full"]:
+        for mode in ("full", "cached"):
+            row = results[mode][stage]
+            print(
+                f"{stage:<12}{mode:<8}{row['prompt_tokens']:>11}{row['cached_tokens']:>8}{row['fresh_tokens']:>8}"
+                f"{row['ttft_p50_s'] or 0:>9.2f}s{row['ttft_p95_s'] or 0:>9.2f}s{row['total_p50_s'] or 0:>10.2f}s"
+            )
+        full, cached = results["full"][stage], results["cached"][stage]
+        saved = 1 - cached["fresh_tokens"] / full["fresh_tokens"] if full["fresh_tokens"] else 0
+        faster = 1 - (cached["ttft_p50_s"] or 0) / full["ttft_p50_s"] if full["ttft_p50_s"] else 0
+        print(f"{'':<12}{'':<8}{saved:>10.0%} fewer uncached prompt tokens, time to first token {faster:.0%} lower")
+    for row in results["prefixes"]:
+        status = f"{row['cached_tokens']} tokens cached" if row["cached"] else f"not cached ({row['error']})"
+        print(f"prefix {row['version']} on {row['model']}: {status}")
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
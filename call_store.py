@@ -0,0 +1,387 @@
+"""SQLite store of processed calls for fleet-level queries.
+
+Every transcript and analysis is written here (incrementally: a call can be
+stored after stage 1 and completed after stage 2). Aggregates are answered
+from small indexed tables: per-call emotion counts by speaker role,
+keywords, entities and client satisfaction. The full JSON documents live in
+a separate table so scans over ``calls`` stay cheap.
+
+Import an existing batch output:
+    python call_store.py import batch_results.jsonl
+"""
+import json
+import os
+import sqlite3
+import sys
+import time
+from contextlib import closing
+
+from transcript_codec import canonical_speaker
+
+DEFAULT_STORE_PATH = os.environ.get("CALL_STORE_PATH", os.path.join("data", "calls.sqlite3"))
+# Calls written per transaction when importing batch output
+IMPORT_CHUNK = 500
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS calls (
+        call_key TEXT PRIMARY KEY,
+        call_id TEXT,
+        source TEXT,
+        agent TEXT,
+        processed_at REAL NOT NULL,
+        speakers INTEGER,
+        turns INTEGER,
+        satisfied INTEGER,
+        summary TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_calls_processed_at ON calls (processed_at)",
+    "CREATE INDEX IF NOT EXISTS idx_calls_satisfied ON calls (satisfied, processed_at)",
+    "CREATE INDEX IF NOT EXISTS idx_calls_agent ON calls (agent, processed_at)",
+    # processed_at and agent are copied from calls so aggregates over a time
+    # range or per agent are answered from one covering index, without a join
+    """CREATE TABLE IF NOT EXISTS call_emotions (
+        call_key TEXT NOT NULL,
+        role TEXT NOT NULL,
+        emotion TEXT NOT NULL,
+        turns INTEGER NOT NULL,
+        processed_at REAL NOT NULL,
+        agent TEXT,
+        PRIMARY KEY (call_key, role, emotion)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS idx_call_emotions_time ON call_emotions (role, processed_at, emotion, turns, agent)",
+    "CREATE INDEX IF NOT EXISTS idx_call_emotions_emotion ON call_emotions (role, emotion, processed_at, agent, turns)",
+    """CREATE TABLE IF NOT EXISTS call_keywords (
+        keyword TEXT NOT NULL,
+        call_key TEXT NOT NULL,
+        processed_at REAL NOT NULL,
+        PRIMARY KEY (keyword, call_key)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS idx_call_keywords_call ON call_keywords (call_key)",
+    "CREATE INDEX IF NOT EXISTS idx_call_keywords_time ON call_keywords (processed_at, keyword)",
+    """CREATE TABLE IF NOT EXISTS call_entities (
+        kind TEXT NOT NULL,
+        value TEXT NOT NULL,
+        call_key TEXT NOT NULL,
+        processed_at REAL NOT NULL,
+        PRIMARY KEY (kind, value, call_key)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS idx_call_entities_call ON call_entities (call_key)",
+    "CREATE INDEX IF NOT EXISTS idx_call_entities_value ON call_entities (value, call_key)",
+    "CREATE INDEX IF NOT EXISTS idx_call_entities_time ON call_entities (processed_at, kind, value)",
+    """CREATE TABLE IF NOT EXISTS call_documents (
+        call_key TEXT PRIMARY KEY,
+        transcript TEXT,
+        analysis TEXT
+    )""",
+]
+
+
+def _normalize(value):
+    return " ".join(str(value).split()).lower()
+
+
+def _emotion_counts(transcript_json):
+    counts = {}
+    for turn in transcript_json.get("Call Details", {}).get("Transcript", []):
+        emotion = _normalize(turn.get("Emotion", ""))
+        if emotion:
+            key = (canonical_speaker(turn.get("Speaker")), emotion)
+            counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def _entity_rows(analysis_json):
+    entities = analysis_json.get("Entities Detected")
+    if not isinstance(entities, dict):
+        return set()
+    rows = set()
+    for kind, values in entities.items():
+        for value in values if isinstance(values, list) else [values]:
+            if isinstance(value, str) and value.strip():
+                rows.add((kind, _normalize(value)))
+    return rows
+
+
+def _time_filter(since, until, column="c.processed_at"):
+    clauses, params = [], []
+    if since is not None:
+        clauses.append(f"{column} >= ?")
+        params.append(since)
+    if until is not None:
+        clauses.append(f"{column} < ?")
+        params.append(until)
+    return clauses, params
+
+
+def batch_record_to_call(record, agent_from_dir=False):
+    """Arguments of ``CallStore.ingest`` for one ``batch_process.py`` record (None if it failed)."""
+    if record.get("status") != "ok" or not record.get("audio_hash"):
+        return None
+    return dict(
+        call_key=record["audio_hash"], transcript_json=record.get("transcript"),
+        analysis_json=record.get("analysis"), call_id=record.get("call_id"), source=record.get("path"),
+        agent=os.path.basename(os.path.dirname(record["path"])) if agent_from_dir else None,
+    )
+
+
+class CallStore:
+    """Indexed store of call transcripts and analyses.
+
+    Like ``ResultCache``, every operation opens its own connection on a WAL
+    database, so the apps, the batch runner and the dashboard can share the
+    file. ``since``/``until`` arguments are epoch seconds.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in SCHEMA:
+                conn.execute(statement)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        # Aggregates scan large indexes; a bigger page cache and mmap keep them in memory
+        conn.execute("PRAGMA cache_size = -65536")
+        conn.execute("PRAGMA mmap_size = 1073741824")
+        return conn
+
+    def _query(self, sql, params=()):
+        with closing(self._connect()) as conn:
+            conn.row_factory = sqlite3.Row
+            return [dict(row) for row in conn.execute(sql, params)]
+
+    def ingest(self, call_key, transcript_json=None, analysis_json=None, call_id=None, source=None, agent=None,
+               processed_at=None):
+        """Adds or updates one call; parts that are None are left as they were.
+
+        ``call_key`` identifies the recording (the content hash), so storing
+        the same call again replaces its rows instead of duplicating them.
+        """
+        self.ingest_many([dict(
+            call_key=call_key, transcript_json=transcript_json, analysis_json=analysis_json,
+            call_id=call_id, source=source, agent=agent, processed_at=processed_at,
+        )])
+
+    def ingest_many(self, calls):
+        """Ingests several calls (dicts of ``ingest`` arguments) in one transaction."""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for call in calls:
+                self._ingest(conn, **call)
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _ingest(self, conn, call_key, transcript_json=None, analysis_json=None, call_id=None, source=None, agent=None,
+                processed_at=None):
+        processed_at = processed_at or time.time()
+        conn.execute(
+            "INSERT INTO calls (call_key, call_id, source, agent, processed_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (call_key) DO UPDATE SET call_id = COALESCE(excluded.call_id, call_id), "
+            "source = COALESCE(excluded.source, source), agent = COALESCE(excluded.agent, agent)",
+            (call_key, call_id, source, agent, processed_at),
+        )
+        conn.execute("INSERT OR IGNORE INTO call_documents (call_key) VALUES (?)", (call_key,))
+        processed_at, agent = conn.execute(
+            "SELECT processed_at, agent FROM calls WHERE call_key = ?", (call_key,)
+        ).fetchone()
+        conn.execute("UPDATE call_emotions SET agent = ? WHERE call_key = ? AND agent IS NOT ?", (agent, call_key, agent))
+        if transcript_json is not None:
+            details = transcript_json.get("Call Details", {})
+            speakers = details.get("Number of Speakers")
+            conn.execute(
+                "UPDATE calls SET speakers = ?, turns = ? WHERE call_key = ?",
+                (speakers if isinstance(speakers, int) else None, len(details.get("Transcript", [])), call_key),
+            )
+            conn.execute("DELETE FROM call_emotions WHERE call_key = ?", (call_key,))
+            conn.executemany(
+                "INSERT INTO call_emotions (call_key, role, emotion, turns, processed_at, agent) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (call_key, role, emotion, count, processed_at, agent)
+                    for (role, emotion), count in _emotion_counts(transcript_json).items()
+                ],
+            )
+            conn.execute(
+                "UPDATE call_documents SET transcript = ? WHERE call_key = ?",
+                (json.dumps(transcript_json, ensure_ascii=False), call_key),
+            )
+        if analysis_json is not None:
+            satisfied = analysis_json.get("Client Satisfaction")
+            conn.execute(
+                "UPDATE calls SET satisfied = ?, summary = ? WHERE call_key = ?",
+                (
+                    int(satisfied) if isinstance(satisfied, bool) else None,
+                    analysis_json.get("Important Conclusion and Summary of Conversation"),
+                    call_key,
+                ),
+            )
+            keywords = {
+                _normalize(word) for word in analysis_json.get("Important Words Used in the Conversation") or []
+                if isinstance(word, str) and word.strip()
+            }
+            conn.execute("DELETE FROM call_keywords WHERE call_key = ?", (call_key,))
+            conn.executemany(
+                "INSERT INTO call_keywords (keyword, call_key, processed_at) VALUES (?, ?, ?)",
+                [(keyword, call_key, processed_at) for keyword in keywords],
+            )
+            conn.execute("DELETE FROM call_entities WHERE call_key = ?", (call_key,))
+            conn.executemany(
+                "INSERT INTO call_entities (kind, value, call_key, processed_at) VALUES (?, ?, ?, ?)",
+                [(kind, value, call_key, processed_at) for kind, value in _entity_rows(analysis_json)],
+            )
+            conn.execute(
+                "UPDATE call_documents SET analysis = ? WHERE call_key = ?",
+                (json.dumps(analysis_json, ensure_ascii=False), call_key),
+            )
+
+    def import_results(self, path, agent_from_dir=False):
+        """Ingests the successful records of a ``batch_process.py`` output file.
+
+        Returns the number of calls stored. Safe to re-run: calls are keyed by
+        their audio hash.
+        """
+        stored = 0
+        pending = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                call = batch_record_to_call(record, agent_from_dir)
+                if call is None:
+                    continue
+                pending.append(call)
+                if len(pending) >= IMPORT_CHUNK:
+                    self.ingest_many(pending)
+                    stored, pending = stored + len(pending), []
+        if pending:
+            self.ingest_many(pending)
+            stored += len(pending)
+        return stored
+
+    def satisfaction(self, since=None, until=None, agent=None):
+        """Counts of satisfied, unsatisfied and not-yet-analyzed calls."""
+        clauses, params = _time_filter(since, until)
+        if agent is not None:
+            clauses.append("c.agent = ?")
+            params.append(agent)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        row = self._query(
+            "SELECT COUNT(*) AS calls, COALESCE(SUM(c.satisfied = 1), 0) AS satisfied, "
+            f"COALESCE(SUM(c.satisfied = 0), 0) AS unsatisfied FROM calls c {where}",
+            params,
+        )[0]
+        analyzed = row["satisfied"] + row["unsatisfied"]
+        row["unknown"] = row["calls"] - analyzed
+        row["unsatisfied_pct"] = round(100 * row["unsatisfied"] / analyzed, 1) if analyzed else 0.0
+        return row
+
+    def emotion_counts(self, role="Client", since=None, until=None, agent=None, limit=20):
+        """Emotions of one speaker role: how many calls and turns show each one."""
+        clauses, params = _time_filter(since, until, "processed_at")
+        if agent is not None:
+            clauses.append("agent = ?")
+            params.append(agent)
+        where = " AND ".join(["role = ?"] + clauses)
+        return self._query(
+            f"SELECT emotion, COUNT(*) AS calls, SUM(turns) AS turns FROM call_emotions WHERE {where} "
+            "GROUP BY emotion ORDER BY calls DESC LIMIT ?",
+            [role] + params + [limit],
+        )
+
+    def agents_by_emotion(self, emotion="frustrated", role="Client", since=None, until=None, min_calls=1, limit=20):
+        """Agents ranked by the share of their calls in which ``role`` showed ``emotion``."""
+        clauses, params = _time_filter(since, until, "processed_at")
+        where = " AND ".join(["agent IS NOT NULL"] + clauses)
+        totals = {
+            row["agent"]: row["calls"]
+            for row in self._query(f"SELECT agent, COUNT(*) AS calls FROM calls WHERE {where} GROUP BY agent", params)
+        }
+        matches = self._query(
+            f"SELECT agent, COUNT(*) AS calls FROM call_emotions WHERE role = ? AND emotion = ? AND {where} "
+            "GROUP BY agent",
+            [role, _normalize(emotion)] + params,
+        )
+        rows = []
+        for row in matches:
+            calls = totals.get(row["agent"], 0)
+            if calls >= min_calls:
+                rows.append({
+                    "agent": row["agent"],
+                    "calls": calls,
+                    "calls_with_emotion": row["calls"],
+                    "pct": round(100 * row["calls"] / calls, 1),
+                })
+        rows.sort(key=lambda row: (row["pct"], row["calls_with_emotion"]), reverse=True)
+        return rows[:limit]
+
+    def top_keywords(self, since=None, until=None, limit=20):
+        clauses, params = _time_filter(since, until, "processed_at")
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._query(
+            f"SELECT keyword, COUNT(*) AS calls FROM call_keywords {where} GROUP BY keyword ORDER BY calls DESC LIMIT ?",
+            params + [limit],
+        )
+
+    def top_entities(self, kind=None, since=None, until=None, limit=20):
+        clauses, params = _time_filter(since, until, "processed_at")
+        if kind is not None:
+            clauses.insert(0, "kind = ?")
+            params.insert(0, kind)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._query(
+            f"SELECT kind, value, COUNT(*) AS calls FROM call_entities {where} "
+            "GROUP BY kind, value ORDER BY calls DESC LIMIT ?",
+            params + [limit],
+        )
+
+    def find_calls(self, emotion=None, role="Client", keyword=None, entity=None, satisfied=None, agent=None,
+                   since=None, until=None, limit=50):
+        """Lists calls matching every given filter, newest first."""
+        clauses, params = _time_filter(since, until)
+        if emotion is not None:
+            clauses.append("c.call_key IN (SELECT call_key FROM call_emotions WHERE role = ? AND emotion = ?)")
+            params += [role, _normalize(emotion)]
+        if keyword is not None:
+            clauses.append("c.call_key IN (SELECT call_key FROM call_keywords WHERE keyword = ?)")
+            params.append(_normalize(keyword))
+        if entity is not None:
+            clauses.append("c.call_key IN (SELECT call_key FROM call_entities WHERE value = ?)")
+            params.append(_normalize(entity))
+        if satisfied is not None:
+            clauses.append("c.satisfied = ?")
+            params.append(int(satisfied))
+        if agent is not None:
+            clauses.append("c.agent = ?")
+            params.append(agent)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._query(
+            "SELECT c.call_key, c.call_id, c.source, c.agent, c.processed_at, c.turns, c.satisfied, c.summary "
+            f"FROM calls c {where} ORDER BY c.processed_at DESC LIMIT ?",
+            params + [limit],
+        )
+
+    def get_call(self, call_key):
+        """Returns the stored transcript and analysis JSON of one call, or None."""
+        rows = self._query("SELECT transcript, analysis FROM call_documents WHERE call_key = ?", (call_key,))
+        if not rows:
+            return None
+        return {name: json.loads(value) if value else None for name, value in rows[0].items()}
+
+    def agents(self):
+        return [row["agent"] for row in self._query("SELECT DISTINCT agent FROM calls WHERE agent IS NOT NULL ORDER BY agent")]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "import":
+        sys.exit("usage: python call_store.py import <batch_results.jsonl> [--agent-from-dir]")
+    count = CallStore().import_results(sys.argv[2], agent_from_dir="--agent-from-dir" in sys.argv[3:])
+    print(f"{count} calls stored in {DEFAULT_STORE_PATH}")
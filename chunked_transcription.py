@@ -0,0 +1,184 @@
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from difflib import SequenceMatcher
+
+from audio_utils import segment_to_array, find_silences
+from file_cache import content_hash
+from ingest import SessionFiles
+from metrics import in_current_context
+from pipeline import transcribe_audio, parse_json
+from transcript_codec import canonical_speaker
+from vad import remap_turn_starts
+
+DEFAULT_WINDOW_S = 8 * 60
+DEFAULT_OVERLAP_S = 20
+# How far a window boundary may move to land in a pause instead of mid-speech
+DEFAULT_SNAP_S = 30
+
+
+def plan_windows(duration_s, silences=(), window_s=DEFAULT_WINDOW_S, overlap_s=DEFAULT_OVERLAP_S, snap_s=DEFAULT_SNAP_S):
+    """Returns overlapping ``(start_s, end_s)`` windows covering the recording.
+
+    Each cut is moved to the middle of the nearest silence within ``snap_s``
+    of the nominal boundary, and every window after the first starts
+    ``overlap_s`` before the cut so turns at the edge are seen twice.
+    """
+    if duration_s <= window_s + overlap_s:
+        return [(0.0, duration_s)]
+    cuts = [0.0]
+    nominal = window_s
+    while nominal < duration_s - overlap_s:
+        best = nominal
+        best_distance = snap_s
+        for start, end in silences:
+            middle = (start + end) / 2
+            distance = abs(middle - nominal)
+            if distance <= best_distance and middle > cuts[-1] + overlap_s:
+                best, best_distance = middle, distance
+        cuts.append(best)
+        nominal = best + window_s
+    cuts.append(duration_s)
+    return [(max(0.0, cuts[i] - (overlap_s if i else 0)), cuts[i + 1]) for i in range(len(cuts) - 1)]
+
+
+def _normalize_text(text):
+    return re.sub(r"[^a-z0-9 ]+", "", (text or "").lower()).strip()
+
+
+def _same_turn(a, b, min_ratio=0.8):
+    a, b = _normalize_text(a.get("Voice")), _normalize_text(b.get("Voice"))
+    if not a or not b:
+        return False
+    # A turn cut by the window edge shows up as a fragment of the full turn
+    if len(a) > 10 and len(b) > 10 and (a in b or b in a):
+        return True
+    return SequenceMatcher(None, a, b).ratio() >= min_ratio
+
+
+def merge_window(merged, turns, lookback=8):
+    """Merges one window's turns into the running ``merged`` list (in place).
+
+    Turns at the start of the window that repeat the end of ``merged`` (the
+    overlap) are dropped, keeping the longer version of a turn that was cut
+    by the window edge. Speaker labels are remapped to the labels used for
+    the same turns so far, so "Agent" and "Client" stay consistent.
+
+    Returns the index of the first turn of ``merged`` that changed or was added.
+    """
+    turns = [dict(turn, Speaker=canonical_speaker(turn.get("Speaker"))) for turn in turns]
+    tail_start = max(0, len(merged) - lookback)
+    matches = []
+    for j, turn in enumerate(turns[:lookback]):
+        for i in range(tail_start, len(merged)):
+            if (not matches or i > matches[-1][0]) and _same_turn(merged[i], turn):
+                matches.append((i, j))
+                break
+
+    votes = Counter((turns[j]["Speaker"], merged[i]["Speaker"]) for i, j in matches)
+    mapping = {}
+    for (label, previous), _ in votes.most_common():
+        if label not in mapping and previous not in mapping.values():
+            mapping[label] = previous
+    if len(mapping) == 1:
+        # Two-party calls: if one label is remapped, the other one swaps too
+        (label, previous), = mapping.items()
+        if label != previous:
+            mapping[previous] = label
+
+    first_changed = len(merged)
+    for i, j in matches:
+        if len(turns[j].get("Voice", "")) > len(merged[i].get("Voice", "")):
+            merged[i] = dict(turns[j], Speaker=merged[i]["Speaker"])
+            first_changed = min(first_changed, i)
+    skip = matches[-1][1] + 1 if matches else 0
+    for turn in turns[skip:]:
+        merged.append(dict(turn, Speaker=mapping.get(turn["Speaker"], turn["Speaker"])))
+    return first_changed
+
+
+def merge_transcripts(window_turns, lookback=8):
+    """Merges per-window turn lists into a single transcript (see ``merge_window``)."""
+    merged = []
+    for turns in window_turns:
+        merge_window(merged, turns, lookback)
+    return merged
+
+
+def transcribe_long_audio(model_audio, segment, upload, result_cache=None, limiter=None,
+                          window_s=DEFAULT_WINDOW_S, overlap_s=DEFAULT_OVERLAP_S, max_workers=8,
+                          session_files=None, bitrate=None, time_remap=None):
+    """Transcribes a long recording as parallel overlapping windows.
+
+    ``segment`` is a pydub AudioSegment and ``upload(path, mime_type)`` uploads
+    a local file to Gemini. Window files are written to ``session_files``
+    (an ``ingest.SessionFiles``, or a private one removed at the end) and
+    exported as mp3 at ``bitrate`` (ffmpeg's default if None). Turn start
+    times are shifted by their window's start and, if ``segment`` was
+    trimmed, mapped back to the original recording with ``time_remap``.
+    Returns ``(transcript_json, stats)`` where the transcript has the same
+    "Call Details" shape as a single-request transcript.
+    """
+    started = time.perf_counter()
+    duration_s = len(segment) / 1000
+    samples, rate = segment_to_array(segment)
+    windows = plan_windows(duration_s, find_silences(samples, rate), window_s, overlap_s)
+    del samples
+    files = session_files if session_files is not None else SessionFiles()
+    export_args = {"bitrate": bitrate} if bitrate else {}
+
+    def run_window(index):
+        window_started = time.perf_counter()
+        start_s, end_s = windows[index]
+        piece = segment[int(start_s * 1000):int(end_s * 1000)]
+        path = files.new_path(".mp3")
+        try:
+            piece.export(path, format="mp3", **export_args)
+            with open(path, "rb") as f:
+                audio_hash = content_hash(f.read())
+            # Uploaded only if this window's transcript is not cached yet
+            response_text, cached = transcribe_audio(
+                model_audio, lambda: upload(path, mime_type="audio/mpeg"), audio_hash, result_cache, limiter
+            )
+        finally:
+            os.remove(path)
+        turns = parse_json(response_text, "transcript").get("Call Details", {}).get("Transcript", [])
+        # Cached per window audio, so the window's position is applied afterwards
+        return remap_turn_starts(turns, offset_s=start_s), cached, time.perf_counter() - window_started
+
+    window_turns = []
+    window_seconds = []
+    failed_windows = []
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(windows)))) as executor:
+            futures = [executor.submit(in_current_context(run_window), i) for i in range(len(windows))]
+            for index, future in enumerate(futures):
+                try:
+                    turns, _, seconds = future.result()
+                except Exception as exc:
+                    failed_windows.append({"window": index, "error": f"{type(exc).__name__}: {exc}"})
+                    turns, seconds = [], None
+                window_turns.append(turns)
+                window_seconds.append(seconds)
+    finally:
+        if session_files is None:
+            files.cleanup()
+
+    transcript = remap_turn_starts(merge_transcripts(window_turns), time_remap)
+    speakers = {turn["Speaker"] for turn in transcript if turn["Speaker"] != "Unknown"}
+    transcript_json = {
+        "Call Details": {
+            "Number of Speakers": len(speakers),
+            "Transcript": transcript,
+        }
+    }
+    stats = {
+        "duration_s": duration_s,
+        "windows": windows,
+        "window_seconds": window_seconds,
+        "failed_windows": failed_windows,
+        "wall_seconds": time.perf_counter() - started,
+    }
+    return transcript_json, stats
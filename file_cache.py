@@ -0,0 +1,149 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+# Gemini keeps uploaded files for 48 hours; refresh a little before that.
+DEFAULT_FILE_TTL_SECONDS = 48 * 60 * 60
+DEFAULT_REFRESH_MARGIN_SECONDS = 10 * 60
+DEFAULT_MAX_IDLE_SECONDS = 6 * 60 * 60
+
+
+def content_hash(data):
+    """Returns the SHA-256 hex digest of the given audio bytes."""
+    return hashlib.sha256(memoryview(data)).hexdigest()
+
+
+def _expires_at(file, uploaded_at):
+    """Returns the epoch time at which an uploaded Gemini file expires."""
+    expiration = getattr(file, "expiration_time", None)
+    if isinstance(expiration, datetime):
+        if expiration.tzinfo is None:
+            expiration = expiration.replace(tzinfo=timezone.utc)
+        return expiration.timestamp()
+    return uploaded_at + DEFAULT_FILE_TTL_SECONDS
+
+
+class GeminiFileCache:
+    """Reuses Gemini file handles for audio that has already been uploaded.
+
+    Entries are keyed by the content hash of the audio bytes plus the mime
+    type, so the same recording uploaded from any session maps to the same
+    remote file. Entries close to expiry are re-uploaded, and the least
+    recently used entries are evicted once ``max_entries`` is exceeded.
+    """
+
+    def __init__(self, max_entries=64, refresh_margin=DEFAULT_REFRESH_MARGIN_SECONDS, delete_file=None):
+        self.max_entries = max_entries
+        self.refresh_margin = refresh_margin
+        self.delete_file = delete_file
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.evictions = 0
+        self.bytes_saved = 0
+
+    def _is_valid(self, entry, now):
+        file = entry["file"]
+        state = getattr(getattr(file, "state", None), "name", "ACTIVE")
+        if state == "FAILED":
+            return False
+        return entry["expires_at"] - self.refresh_margin > now
+
+    def get_or_upload(self, data, mime_type, upload, digest=None):
+        """Returns a Gemini file for ``data``, calling ``upload()`` only on a miss.
+
+        ``upload`` is a zero-argument callable that performs the actual upload
+        (possibly of a compressed copy) and returns the Gemini file object.
+        ``digest`` may be passed when the caller has already computed
+        ``content_hash(data)``. Concurrent misses for the same key share one
+        upload; ``bytes_saved`` counts the size of the file that was uploaded.
+        """
+        key = (digest or content_hash(data), mime_type)
+        while True:
+            now = time.time()
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and self._is_valid(entry, now):
+                    self._entries.move_to_end(key)
+                    entry["last_used"] = now
+                    self.hits += 1
+                    self.bytes_saved += entry["size"]
+                    return entry["file"]
+                pending = self._pending.get(key)
+                if pending is None:
+                    if entry is not None:
+                        self.refreshes += 1
+                        del self._entries[key]
+                    self.misses += 1
+                    pending = self._pending[key] = threading.Event()
+                    break
+            # Another session is uploading the same audio: wait for it and reuse its file
+            pending.wait()
+
+        evicted = []
+        try:
+            # Upload outside the lock so other sessions are not blocked meanwhile.
+            file = upload()
+            uploaded_at = time.time()
+            with self._lock:
+                self._entries[key] = {
+                    "file": file,
+                    "size": getattr(file, "size_bytes", None) or len(memoryview(data)),
+                    "expires_at": _expires_at(file, uploaded_at),
+                    "last_used": uploaded_at,
+                }
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    _, old = self._entries.popitem(last=False)
+                    self.evictions += 1
+                    evicted.append(old["file"])
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+            pending.set()
+
+        for old_file in evicted:
+            self._delete_remote(old_file)
+        return file
+
+    def purge_idle(self, max_idle=DEFAULT_MAX_IDLE_SECONDS):
+        """Drops (and deletes remotely) entries unused for ``max_idle`` seconds or expired."""
+        now = time.time()
+        purged = []
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry["last_used"] < now - max_idle or entry["expires_at"] < now:
+                    del self._entries[key]
+                    self.evictions += 1
+                    purged.append(entry["file"])
+        for file in purged:
+            self._delete_remote(file)
+        return len(purged)
+
+    def _delete_remote(self, file):
+        if self.delete_file is None:
+            return
+        try:
+            self.delete_file(file.name)
+        except Exception:
+            # The file may already have expired on the server side.
+            pass
+
+    def stats(self):
+        """Returns hit/miss counters and the number of upload bytes avoided."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+                "bytes_saved": self.bytes_saved,
+            }
@@ -0,0 +1,152 @@
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from file_cache import content_hash
+
+CHUNK_SIZE = 1024 * 1024
+DEFAULT_SESSION_TTL_SECONDS = 60 * 60
+
+
+@contextmanager
+def open_mapped(path):
+    """Memory-maps a file read-only so it can be hashed or re-read without a copy."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mapped
+        finally:
+            mapped.close()
+
+
+class SessionFiles:
+    """Local temp files and remote Gemini files owned by one Streamlit session.
+
+    Files live in a private temp directory under random names, so two
+    sessions uploading "call.mp3" never collide, and everything is removed
+    by ``cleanup``.
+    """
+
+    def __init__(self, base_dir=None, delete_file=None):
+        self.directory = tempfile.mkdtemp(prefix="curateai-", dir=base_dir)
+        self.delete_file = delete_file
+        self.last_seen = time.time()
+        self._digests = {}
+        self._spooled = {}
+        self._remote = []
+        self._lock = threading.Lock()
+
+    def new_path(self, suffix=""):
+        """Returns a fresh, collision-free path inside the session directory."""
+        return os.path.join(self.directory, uuid.uuid4().hex + suffix)
+
+    def digest(self, file_id, data):
+        """Returns the content hash of an upload, computed once per ``file_id``."""
+        with self._lock:
+            if file_id in self._digests:
+                return self._digests[file_id]
+        digest = content_hash(data)
+        with self._lock:
+            self._digests[file_id] = digest
+        return digest
+
+    def spool(self, data, suffix="", key=None):
+        """Writes ``data`` (bytes-like or a binary file object) to a session file.
+
+        Bytes-like data is written as memoryview slices and file objects are
+        copied in ``CHUNK_SIZE`` pieces, so no extra full copy is made. With a
+        ``key`` (e.g. the content hash), repeat calls reuse the same file.
+        """
+        with self._lock:
+            if key is not None and key in self._spooled:
+                return self._spooled[key]
+        path = self.new_path(suffix)
+        with open(path, "wb") as out:
+            if hasattr(data, "read"):
+                data.seek(0)
+                shutil.copyfileobj(data, out, CHUNK_SIZE)
+            else:
+                view = memoryview(data)
+                for start in range(0, len(view), CHUNK_SIZE):
+                    out.write(view[start:start + CHUNK_SIZE])
+        with self._lock:
+            if key is not None:
+                self._spooled[key] = path
+        return path
+
+    def track_remote(self, file):
+        """Registers a Gemini file to delete when the session is cleaned up."""
+        with self._lock:
+            self._remote.append(file.name)
+        return file
+
+    def tracked_upload(self, upload):
+        """Wraps ``upload(path, mime_type)`` so every uploaded file is tracked."""
+        def upload_and_track(path, mime_type=None):
+            return self.track_remote(upload(path, mime_type=mime_type))
+        return upload_and_track
+
+    def cleanup(self):
+        """Deletes the session directory and every tracked remote file."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        with self._lock:
+            remote, self._remote = self._remote, []
+            self._spooled.clear()
+        if self.delete_file is not None:
+            for name in remote:
+                try:
+                    self.delete_file(name)
+                except Exception:
+                    # Already expired or deleted on the server side
+                    pass
+
+
+class SessionRegistry:
+    """Process-wide map of session id -> SessionFiles with idle expiry.
+
+    Streamlit has no session-end hook, so sessions that have not been seen
+    for ``ttl_seconds`` are cleaned up by ``sweep``, which the apps call on
+    every rerun.
+    """
+
+    def __init__(self, ttl_seconds=DEFAULT_SESSION_TTL_SECONDS, delete_file=None, base_dir=None):
+        self.ttl_seconds = ttl_seconds
+        self.delete_file = delete_file
+        self.base_dir = base_dir
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id):
+        """Returns the SessionFiles for ``session_id`` and marks it as active."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = SessionFiles(self.base_dir, self.delete_file)
+                self._sessions[session_id] = session
+            session.last_seen = time.time()
+            return session
+
+    def end(self, session_id):
+        """Cleans up one session right away (e.g. when a new file replaces the old one)."""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None:
+            session.cleanup()
+
+    def sweep(self):
+        """Cleans up every session idle for longer than the TTL; returns how many."""
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [sid for sid, session in self._sessions.items() if session.last_seen < cutoff]
+            sessions = [self._sessions.pop(sid) for sid in expired]
+        for session in sessions:
+            session.cleanup()
+        return len(sessions)
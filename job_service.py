@@ -0,0 +1,445 @@
+"""Background job service: a durable SQLite queue and a pool of pipeline workers.
+
+The Streamlit apps submit a recording and poll the job instead of running the
+upload, transcript and analysis steps in the script thread. Workers share one
+set of model clients, rate limiters and caches for the whole process (the
+same ``BatchRunner`` as ``batch_process.py``).
+
+    python job_service.py serve --workers 8 --compress --failover
+    python job_service.py submit recordings/ --priority bulk
+    python job_service.py status
+"""
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import closing
+from pathlib import Path
+
+DEFAULT_QUEUE_PATH = os.environ.get("JOB_QUEUE_PATH", os.path.join("data", "jobs.sqlite3"))
+# Jobs waiting to run before new submissions are refused
+DEFAULT_MAX_QUEUED = 200
+# Part of the queue that only interactive jobs may use, so bulk work cannot lock out a waiting supervisor
+DEFAULT_INTERACTIVE_RESERVE = 20
+# A running job whose worker has not reported for this long is handed to another worker
+DEFAULT_LEASE_S = 300
+HEARTBEAT_S = 15
+MAX_ATTEMPTS = 2
+# Finished jobs (and their results) are kept this long for polling clients
+RETENTION_S = 7 * 24 * 3600
+
+PRIORITY_BULK = 0
+PRIORITY_INTERACTIVE = 10
+PRIORITIES = {"bulk": PRIORITY_BULK, "interactive": PRIORITY_INTERACTIVE}
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS jobs (
+        job_id TEXT PRIMARY KEY,
+        priority INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        stage TEXT,
+        audio_path TEXT NOT NULL,
+        owns_audio INTEGER NOT NULL,
+        options TEXT,
+        call_id TEXT,
+        source TEXT,
+        agent TEXT,
+        submitted_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        heartbeat_at REAL,
+        worker_id TEXT,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        result TEXT,
+        error TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, priority DESC, submitted_at)",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at)",
+    """CREATE TABLE IF NOT EXISTS workers (
+        worker_id TEXT PRIMARY KEY,
+        heartbeat_at REAL NOT NULL
+    )""",
+]
+
+
+class QueueFull(RuntimeError):
+    """Raised by ``JobQueue.submit`` when the queue is at its limit (backpressure)."""
+
+
+class JobQueue:
+    """Durable priority queue of pipeline jobs stored in SQLite.
+
+    Like the result cache, every operation opens its own connection and the
+    database runs in WAL mode, so Streamlit sessions, the service and CLI
+    clients can use the same file at once. Uploaded audio is copied next to
+    the database so the service can read it from another process.
+    """
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH, max_queued=DEFAULT_MAX_QUEUED,
+                 interactive_reserve=DEFAULT_INTERACTIVE_RESERVE):
+        self.path = path
+        self.max_queued = max_queued
+        self.interactive_reserve = interactive_reserve
+        self.audio_dir = os.path.join(os.path.dirname(os.path.abspath(path)), "job_audio")
+        os.makedirs(self.audio_dir, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in SCHEMA:
+                conn.execute(statement)
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def _limit(self, priority):
+        if priority >= PRIORITY_INTERACTIVE:
+            return self.max_queued
+        return self.max_queued - self.interactive_reserve
+
+    def submit(self, audio_path=None, data=None, suffix="", priority=PRIORITY_BULK, options=None, call_id=None,
+               source=None, agent=None):
+        """Queues one recording (a path, or bytes-like ``data`` copied into the queue) and returns the job ID.
+
+        Raises QueueFull when the queue already holds as many waiting jobs as
+        ``priority`` may use.
+        """
+        job_id = uuid.uuid4().hex
+        owns_audio = data is not None
+        if owns_audio:
+            audio_path = os.path.join(self.audio_dir, job_id + suffix)
+            with open(audio_path, "wb") as f:
+                f.write(memoryview(data))
+        audio_path = os.path.abspath(audio_path)
+        try:
+            with closing(self._connect()) as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+                if queued >= self._limit(priority):
+                    conn.execute("ROLLBACK")
+                    raise QueueFull(f"{queued} jobs waiting")
+                conn.execute(
+                    "INSERT INTO jobs (job_id, priority, status, audio_path, owns_audio, options, call_id, source, "
+                    "agent, submitted_at) VALUES (?, ?, 'queued', ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, priority, audio_path, int(owns_audio), json.dumps(options or {}), call_id,
+                     source or audio_path, agent, time.time()),
+                )
+                conn.execute("COMMIT")
+        except BaseException:
+            if owns_audio:
+                _remove(audio_path)
+            raise
+        return job_id
+
+    def claim(self, worker_id, min_priority=None):
+        """Marks the next job (highest priority, then oldest) as running for ``worker_id`` and returns it."""
+        where, params = "status = 'queued'", []
+        if min_priority is not None:
+            where += " AND priority >= ?"
+            params.append(min_priority)
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                f"SELECT job_id FROM jobs WHERE {where} ORDER BY priority DESC, submitted_at LIMIT 1", params
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = 'running', stage = NULL, started_at = ?, heartbeat_at = ?, worker_id = ?, "
+                "attempts = attempts + 1 WHERE job_id = ?",
+                (now, now, worker_id, row[0]),
+            )
+            conn.execute("COMMIT")
+        return self.get(row[0])
+
+    def set_stage(self, job_id, stage):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET stage = ?, heartbeat_at = ? WHERE job_id = ? AND status = 'running'",
+                (stage, time.time(), job_id),
+            )
+
+    def heartbeat(self, worker_id, job_ids=()):
+        """Records that ``worker_id`` is alive and still working on ``job_ids``."""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO workers (worker_id, heartbeat_at) VALUES (?, ?) "
+                "ON CONFLICT (worker_id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at",
+                (worker_id, now),
+            )
+            conn.executemany(
+                "UPDATE jobs SET heartbeat_at = ? WHERE job_id = ? AND status = 'running'",
+                [(now, job_id) for job_id in job_ids],
+            )
+
+    def finish(self, job_id, record):
+        """Stores the result record of a job ("done" or "failed" from its status)."""
+        status = "done" if record.get("status") == "ok" else "failed"
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, stage = NULL, finished_at = ?, result = ?, error = ? "
+                "WHERE job_id = ? AND status = 'running'",
+                (status, time.time(), json.dumps(record, ensure_ascii=False), record.get("error"), job_id),
+            )
+        self._remove_audio(job_id)
+
+    def cancel(self, job_id):
+        """Cancels a queued or running job; the result of a running one is discarded."""
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is not None and row[0] in ("queued", "running"):
+                conn.execute("UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE job_id = ?", (time.time(), job_id))
+            conn.execute("COMMIT")
+        # A running job's audio is removed by its worker when it finishes
+        if row is not None and row[0] == "queued":
+            self._remove_audio(job_id)
+
+    def requeue_stale(self, lease_s=DEFAULT_LEASE_S, max_attempts=MAX_ATTEMPTS):
+        """Hands jobs of workers that stopped reporting back to the queue (or fails them after ``max_attempts``).
+
+        Returns the number of jobs requeued.
+        """
+        cutoff = time.time() - lease_s
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            failed = [row[0] for row in conn.execute(
+                "SELECT job_id FROM jobs WHERE status = 'running' AND heartbeat_at < ? AND attempts >= ?",
+                (cutoff, max_attempts),
+            )]
+            conn.executemany(
+                "UPDATE jobs SET status = 'failed', finished_at = ?, error = 'worker stopped responding' WHERE job_id = ?",
+                [(time.time(), job_id) for job_id in failed],
+            )
+            requeued = conn.execute(
+                "UPDATE jobs SET status = 'queued', stage = NULL, worker_id = NULL "
+                "WHERE status = 'running' AND heartbeat_at < ?",
+                (cutoff,),
+            ).rowcount
+            conn.execute("COMMIT")
+        for job_id in failed:
+            self._remove_audio(job_id)
+        return requeued
+
+    def purge(self, older_than_s=RETENTION_S):
+        """Deletes jobs that finished more than ``older_than_s`` ago, and workers gone as long."""
+        cutoff = time.time() - older_than_s
+        with closing(self._connect()) as conn:
+            conn.execute("DELETE FROM jobs WHERE finished_at < ?", (cutoff,))
+            conn.execute("DELETE FROM workers WHERE heartbeat_at < ?", (cutoff,))
+
+    def get(self, job_id):
+        """Returns a job as a dict (``result`` and ``options`` decoded), with its queue position while queued."""
+        with closing(self._connect()) as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = dict(row)
+            if job["status"] == "queued":
+                job["position"] = 1 + conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND "
+                    "(priority > ? OR (priority = ? AND submitted_at < ?))",
+                    (job["priority"], job["priority"], job["submitted_at"]),
+                ).fetchone()[0]
+        job["options"] = json.loads(job["options"]) if job["options"] else {}
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def stats(self):
+        """Job counts per status and the number of workers seen recently."""
+        with closing(self._connect()) as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            workers = conn.execute(
+                "SELECT COUNT(*) FROM workers WHERE heartbeat_at >= ?", (time.time() - 2 * HEARTBEAT_S,)
+            ).fetchone()[0]
+        return {
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "cancelled": counts.get("cancelled", 0),
+            "workers": workers,
+        }
+
+    def service_alive(self):
+        """True when at least one service has reported within the last two heartbeats."""
+        return self.stats()["workers"] > 0
+
+    def _remove_audio(self, job_id):
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT audio_path, owns_audio FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is not None and row[1]:
+            _remove(row[0])
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class JobService:
+    """Runs queued jobs on worker threads that share one ``BatchRunner``.
+
+    ``interactive_workers`` of the threads only take interactive jobs, so a
+    supervisor's call starts right away even while bulk jobs fill the rest.
+    """
+
+    def __init__(self, queue, runner, workers=4, interactive_workers=1, store=None, poll_s=1.0,
+                 lease_s=DEFAULT_LEASE_S):
+        self.queue = queue
+        self.runner = runner
+        self.workers = workers
+        self.interactive_workers = min(interactive_workers, workers)
+        self.store = store
+        self.poll_s = poll_s
+        self.lease_s = lease_s
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._active = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self.queue.heartbeat(self.worker_id)
+        for index in range(self.workers):
+            min_priority = PRIORITY_INTERACTIVE if index < self.interactive_workers else None
+            thread = threading.Thread(target=self._work, args=(min_priority,), name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        maintenance = threading.Thread(target=self._maintain, name="job-maintenance", daemon=True)
+        maintenance.start()
+        self._threads.append(maintenance)
+
+    def stop(self, timeout=None):
+        """Stops claiming jobs and waits for the running ones to finish."""
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _work(self, min_priority):
+        while not self._stop.is_set():
+            job = self.queue.claim(self.worker_id, min_priority)
+            if job is None:
+                self._stop.wait(self.poll_s)
+                continue
+            with self._lock:
+                self._active.add(job["job_id"])
+            try:
+                self._run(job)
+            finally:
+                with self._lock:
+                    self._active.discard(job["job_id"])
+
+    def _run(self, job):
+        from call_store import batch_record_to_call
+
+        record = self.runner.process(
+            Path(job["audio_path"]), options=job["options"], call_id=job["call_id"],
+            on_stage=lambda stage: self.queue.set_stage(job["job_id"], stage),
+        )
+        record["path"] = job["source"]
+        self.queue.finish(job["job_id"], record)
+        call = batch_record_to_call(record)
+        if self.store is not None and call is not None:
+            self.store.ingest(**dict(call, agent=job["agent"]))
+        print(f"{record['status']} {job['job_id']} {job['source']} ({record['elapsed_s']}s)", file=sys.stderr)
+
+    def _maintain(self):
+        while not self._stop.wait(HEARTBEAT_S):
+            with self._lock:
+                active = list(self._active)
+            self.queue.heartbeat(self.worker_id, active)
+            requeued = self.queue.requeue_stale(self.lease_s)
+            if requeued:
+                print(f"Requeued {requeued} jobs of unresponsive workers", file=sys.stderr)
+            self.queue.purge()
+
+
+def serve(args):
+    from batch_process import BatchRunner
+    from call_store import CallStore
+    from metrics import start_metrics_server
+
+    queue = JobQueue(args.queue)
+    runner = BatchRunner(args)
+    service = JobService(
+        queue, runner, workers=args.workers, interactive_workers=args.interactive_workers,
+        store=None if args.no_store else CallStore(args.store),
+    )
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+    service.start()
+    print(f"Job service {service.worker_id}: {args.workers} workers on {args.queue}", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print("Finishing running jobs...", file=sys.stderr)
+        service.stop()
+        runner.close()
+    return 0
+
+
+def submit(args):
+    from batch_process import collect_inputs
+
+    queue = JobQueue(args.queue)
+    submitted = 0
+    for path in collect_inputs(args.inputs):
+        try:
+            queue.submit(audio_path=path, priority=PRIORITIES[args.priority])
+        except QueueFull as exc:
+            print(f"Queue full ({exc}); submitted {submitted} jobs, stopped at {path}", file=sys.stderr)
+            return 1
+        submitted += 1
+    print(f"Submitted {submitted} jobs", file=sys.stderr)
+    return 0
+
+
+def status(args):
+    queue = JobQueue(args.queue)
+    if args.job_id:
+        job = queue.get(args.job_id)
+        if job is None:
+            print(f"No job {args.job_id}", file=sys.stderr)
+            return 1
+        job.pop("result")
+        print(json.dumps(job, indent=2))
+    else:
+        print(json.dumps(queue.stats(), indent=2))
+    return 0
+
+
+def parse_args(argv=None):
+    from batch_process import add_pipeline_arguments
+
+    parser = argparse.ArgumentParser(description="Background job service for the call pipeline.")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_PATH, help="Job queue database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="Run queued jobs")
+    add_pipeline_arguments(serve_parser)
+    serve_parser.add_argument("--interactive-workers", type=int, default=1,
+                              help="Workers that only take interactive jobs")
+    serve_parser.set_defaults(handler=serve)
+    submit_parser = commands.add_parser("submit", help="Queue recordings")
+    submit_parser.add_argument("inputs", nargs="+", help="Audio files, directories, or manifest files")
+    submit_parser.add_argument("--priority", choices=sorted(PRIORITIES), default="bulk")
+    submit_parser.set_defaults(handler=submit)
+    status_parser = commands.add_parser("status", help="Show queue counts, or one job")
+    status_parser.add_argument("job_id", nargs="?")
+    status_parser.set_defaults(handler=status)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    sys.exit(args.handler(args))
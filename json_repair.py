@@ -0,0 +1,297 @@
+import json
+import re
+import threading
+
+from schemas import TURN_SCHEMA, schema_errors
+
+_FENCE_PATTERN = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+_TRAILING_STRING = re.compile(r'"(?:[^"\\]|\\.)*"$', re.DOTALL)
+_PARTIAL_LITERAL = re.compile(r"(?<=[:\[,])\s*(?:t|tr|tru|f|fa|fal|fals|n|nu|nul|-|-?\d+\.|-?\d+(?:\.\d+)?[eE][+-]?)$")
+
+# Parse outcomes, from best to worst
+OUTCOMES = ("ok", "repaired", "salvaged", "failed")
+
+
+def _next_significant(text, pos):
+    while pos < len(text) and text[pos] in " \t\r\n":
+        pos += 1
+    return text[pos] if pos < len(text) else ""
+
+
+def _drop_trailing_comma(out):
+    index = len(out) - 1
+    while index >= 0 and out[index] in (" ", "\t", "\r", "\n"):
+        index -= 1
+    if index >= 0 and out[index] == ",":
+        del out[index]
+
+
+def _trim_tail(text, stack):
+    """Drops whatever cannot end a value: commas, dangling keys, colons, partial literals."""
+    while True:
+        previous = text
+        text = text.rstrip()
+        if text.endswith(","):
+            text = text[:-1]
+        elif text.endswith(":"):
+            text = _TRAILING_STRING.sub("", text[:-1].rstrip())
+        elif stack and stack[-1] == "{" and text.endswith('"'):
+            # A string right after "{" or "," inside an object is a key without a value
+            match = _TRAILING_STRING.search(text)
+            if match and text[:match.start()].rstrip()[-1:] in ("{", ","):
+                text = text[:match.start()]
+        else:
+            text = _PARTIAL_LITERAL.sub("", text)
+        if text == previous:
+            return text
+
+
+def repair_json(text):
+    """Rewrites malformed model output so ``json.loads`` can read it.
+
+    Handles code fences, unescaped quotes and raw line breaks inside strings,
+    trailing commas, mismatched or missing closing brackets, and output that
+    was cut off mid-string or mid-value. The result is not guaranteed to
+    parse; callers still need to try it.
+    """
+    text = _FENCE_PATTERN.sub("", text)
+    out = []
+    stack = []
+    in_string = False
+    escape = False
+    for pos, char in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+                out.append(char)
+            elif char == "\\":
+                escape = True
+                out.append(char)
+            elif char == '"':
+                # Only a quote followed by a structural character ends the string
+                if _next_significant(text, pos + 1) in (",", ":", "}", "]", ""):
+                    in_string = False
+                    out.append(char)
+                else:
+                    out.append('\\"')
+            elif char == "\n":
+                out.append("\\n")
+            elif char == "\r":
+                out.append("\\r")
+            elif char == "\t":
+                out.append("\\t")
+            else:
+                out.append(char)
+            continue
+        if char == '"':
+            in_string = True
+            out.append(char)
+        elif char in "{[":
+            stack.append(char)
+            out.append(char)
+        elif char in "}]":
+            if not stack:
+                continue
+            _drop_trailing_comma(out)
+            # A closer of the wrong kind is replaced by the one that is open
+            out.append("}" if stack.pop() == "{" else "]")
+        else:
+            out.append(char)
+
+    if in_string:
+        if escape:
+            out.pop()
+        out.append('"')
+    repaired = _trim_tail("".join(out), stack)
+    while stack:
+        repaired += "}" if stack.pop() == "{" else "]"
+        repaired = _trim_tail(repaired, stack)
+    return repaired
+
+
+def loads_tolerant(text):
+    """Returns ``(value, outcome)`` with outcome "ok" or "repaired".
+
+    Raises ``json.JSONDecodeError`` when the text cannot be repaired.
+    """
+    try:
+        return json.loads(text), "ok"
+    except json.JSONDecodeError:
+        pass
+    return json.loads(repair_json(text)), "repaired"
+
+
+class TranscriptStreamParser:
+    """Incremental JSON scanner that yields transcript turns as they complete.
+
+    Feed it the text chunks of a streamed response. Every object inside the
+    ``"Transcript"`` array is returned from ``feed`` as soon as its closing
+    brace arrives. The full text is kept so the caller can still run
+    ``json.loads`` on the finished response, exactly like the blocking path.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_string = None
+        # One entry per open container: [kind, key of the value being parsed]
+        self._stack = []
+        self._turn_start = None
+
+    def _in_transcript_array(self):
+        return (
+            len(self._stack) >= 2
+            and self._stack[-1][0] == "["
+            and self._stack[-2][0] == "{"
+            and self._stack[-2][1] == "Transcript"
+        )
+
+    def feed(self, chunk):
+        """Consumes a chunk of text and returns the list of newly completed turns."""
+        self.text += chunk
+        turns = []
+        text = self.text
+        for pos in range(self._pos, len(text)):
+            char = text[pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start:pos + 1]
+                continue
+            if char == '"':
+                self._in_string = True
+                self._string_start = pos
+            elif char == ":":
+                if self._stack and self._stack[-1][0] == "{" and self._last_string is not None:
+                    try:
+                        self._stack[-1][1] = json.loads(self._last_string)
+                    except json.JSONDecodeError:
+                        self._stack[-1][1] = None
+            elif char in "{[":
+                if char == "{" and self._in_transcript_array():
+                    self._turn_start = pos
+                self._stack.append([char, None])
+            elif char in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if char == "}" and self._turn_start is not None and self._in_transcript_array():
+                    turn = _complete_turn(text[self._turn_start:pos + 1])
+                    if turn is not None:
+                        turns.append(turn)
+                    self._turn_start = None
+        self._pos = len(text)
+        return turns
+
+
+def _complete_turn(fragment):
+    try:
+        turn, _ = loads_tolerant(fragment)
+    except json.JSONDecodeError:
+        return None
+    return turn if isinstance(turn, dict) and not schema_errors(turn, TURN_SCHEMA) else None
+
+
+def salvage_transcript(text):
+    """Rebuilds a transcript from every complete turn found in broken output.
+
+    Returns None when no complete turn can be recovered.
+    """
+    parser = TranscriptStreamParser()
+    turns = parser.feed(text)
+    if not turns:
+        return None
+    match = re.search(r'"Number of Speakers"\s*:\s*"?(\d+)', text)
+    speakers = int(match.group(1)) if match else len({turn["Speaker"] for turn in turns})
+    return {"Call Details": {"Number of Speakers": speakers, "Transcript": turns}}
+
+
+def parse_transcript(text):
+    """Parses stage-1 output, repairing it or salvaging its complete turns.
+
+    Returns ``(transcript_json, outcome)``. A repaired transcript whose last
+    turn was cut off keeps only the complete turns and counts as "salvaged".
+    Raises ``json.JSONDecodeError`` when nothing can be recovered.
+    """
+    try:
+        value, outcome = loads_tolerant(text)
+    except json.JSONDecodeError:
+        value, outcome = None, "failed"
+    turns = value.get("Call Details", {}).get("Transcript") if isinstance(value, dict) else None
+    if isinstance(turns, list) and isinstance(value["Call Details"], dict):
+        complete = [turn for turn in turns if isinstance(turn, dict) and not schema_errors(turn, TURN_SCHEMA)]
+        if len(complete) < len(turns):
+            value["Call Details"]["Transcript"] = complete
+            outcome = "salvaged"
+        return value, outcome
+    salvaged = salvage_transcript(text)
+    if salvaged is not None:
+        return salvaged, "salvaged"
+    if value is not None:
+        return value, outcome
+    raise json.JSONDecodeError("no JSON or transcript turns could be recovered", text, 0)
+
+
+def is_recoverable(text, stage=None):
+    """Like ``result_cache.is_json``, but also accepts output the parsers can fix."""
+    try:
+        if stage == "transcript":
+            parse_transcript(text)
+        else:
+            loads_tolerant(text)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def is_cacheable(text, stage=None):
+    """True for output worth keeping in the result cache: valid or repaired JSON.
+
+    A salvaged transcript has lost turns, so it is used once but not cached;
+    the next request regenerates it.
+    """
+    try:
+        if stage == "transcript":
+            return parse_transcript(text)[1] != "salvaged"
+        loads_tolerant(text)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+class ParseStats:
+    """Counts parse outcomes per stage so the avoided re-runs can be measured."""
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage, outcome):
+        with self._lock:
+            counts = self._counts.setdefault(stage, dict.fromkeys(OUTCOMES, 0))
+            counts[outcome] += 1
+
+    def summary(self):
+        """Per stage: the outcome counts, repair/salvage rates and re-runs avoided."""
+        with self._lock:
+            counts = {stage: dict(values) for stage, values in self._counts.items()}
+        summary = {}
+        for stage, values in counts.items():
+            total = sum(values.values())
+            summary[stage] = dict(
+                values,
+                total=total,
+                repair_rate=round(values["repaired"] / total, 4) if total else 0.0,
+                salvage_rate=round(values["salvaged"] / total, 4) if total else 0.0,
+                reruns_avoided=values["repaired"] + values["salvaged"],
+            )
+        return summary
+
+
+PARSE_STATS = ParseStats()
@@ -0,0 +1,553 @@
+"""Near-real-time analysis of a call that is still in progress.
+
+Audio arrives as 16-bit mono PCM frames from a socket, a growing file or a
+paced replay of a finished recording. ``RollingWindower`` cuts the stream
+into short overlapping windows (at a pause when there is one), each window
+goes through the usual transcript prompt, and its turns are merged into the
+running ``Call Details.Transcript``. ``LiveAnalysis`` updates the local
+stage-2 fields turn by turn, raises emotion alerts, and refreshes the LLM
+judgment from the previous judgment plus the new turns only.
+
+Only the current window (plus the overlap) is kept as audio, so memory does
+not grow with the length of the call.
+
+    python live_analysis.py replay call.mp3 --speed 2
+    python live_analysis.py replay call.mp3 --stub transcript.json
+    python live_analysis.py socket --port 9555
+    python live_analysis.py send call.mp3 --port 9555
+"""
+import argparse
+import io
+import json
+import socket
+import sys
+import threading
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+import numpy as np
+
+from audio_utils import frame_energy_db
+from chunked_transcription import merge_window
+from file_cache import content_hash
+from local_extraction import KeywordMatcher, detect_entities, load_keywords, merge_analysis
+from metrics import REGISTRY, in_current_context, record_usage, span
+from pipeline import transcribe_audio, parse_json
+from prompts import judgment_generation_config, prompt_update_judgment
+from transcript_codec import canonical_speaker, encode_transcript
+
+LIVE_RATE = 16000
+FRAME_MS = 100
+# Client emotions that notify a supervisor
+ALERT_EMOTIONS = {"angry", "frustrated", "annoyed", "irritated", "upset", "disappointed"}
+# The LLM judgment is refreshed at most this often while the call runs
+JUDGE_EVERY_S = 30
+
+
+def decode_pcm(path, rate=LIVE_RATE):
+    """Decodes a recording into 16-bit mono PCM bytes at ``rate``."""
+    from audio_utils import load_audio
+
+    segment = load_audio(path).set_channels(1).set_frame_rate(rate).set_sample_width(2)
+    return segment.raw_data
+
+
+def pcm_to_wav(pcm, rate=LIVE_RATE):
+    """Wraps 16-bit mono PCM in a WAV container (no re-encoding, no ffmpeg)."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(rate)
+        out.writeframes(pcm)
+    return buffer.getvalue()
+
+
+class ReplaySource:
+    """Plays a finished recording as a live stream, paced at ``speed`` times real time (0 = no pacing)."""
+
+    def __init__(self, path, rate=LIVE_RATE, frame_ms=FRAME_MS, speed=1.0):
+        self.path = path
+        self.rate = rate
+        self.frame_bytes = 2 * int(rate * frame_ms / 1000)
+        self.speed = speed
+
+    def __iter__(self):
+        pcm = decode_pcm(self.path, self.rate)
+        started = time.monotonic()
+        for offset in range(0, len(pcm), self.frame_bytes):
+            if self.speed:
+                due = started + offset / (2 * self.rate) / self.speed
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            yield pcm[offset:offset + self.frame_bytes]
+
+
+class GrowingFileSource:
+    """Reads raw PCM (or WAV) from a file that another process is still writing.
+
+    The stream ends once the file has not grown for ``idle_timeout_s``.
+    """
+
+    def __init__(self, path, rate=LIVE_RATE, frame_ms=FRAME_MS, poll_s=0.05, idle_timeout_s=5.0):
+        self.path = path
+        self.rate = rate
+        self.frame_bytes = 2 * int(rate * frame_ms / 1000)
+        self.poll_s = poll_s
+        self.idle_timeout_s = idle_timeout_s
+
+    def __iter__(self):
+        with open(self.path, "rb") as f:
+            if self.path.lower().endswith(".wav"):
+                f.read(44)
+            idle_since = time.monotonic()
+            pending = b""
+            while True:
+                data = f.read(self.frame_bytes - len(pending))
+                if data:
+                    pending += data
+                    idle_since = time.monotonic()
+                    if len(pending) == self.frame_bytes:
+                        yield pending
+                        pending = b""
+                elif time.monotonic() - idle_since > self.idle_timeout_s:
+                    break
+                else:
+                    time.sleep(self.poll_s)
+            if len(pending) >= 2:
+                yield pending[:len(pending) - len(pending) % 2]
+
+
+class SocketSource:
+    """Accepts one TCP connection and reads raw 16-bit mono PCM from it until it closes."""
+
+    def __init__(self, host="0.0.0.0", port=9555, rate=LIVE_RATE, frame_ms=FRAME_MS):
+        self.host = host
+        self.port = port
+        self.rate = rate
+        self.frame_bytes = 2 * int(rate * frame_ms / 1000)
+
+    def __iter__(self):
+        with socket.create_server((self.host, self.port)) as server:
+            conn, _ = server.accept()
+            with conn:
+                pending = b""
+                while True:
+                    data = conn.recv(self.frame_bytes)
+                    if not data:
+                        break
+                    pending += data
+                    cut = len(pending) - len(pending) % 2
+                    if cut:
+                        yield pending[:cut]
+                        pending = pending[cut:]
+
+
+class RollingWindower:
+    """Cuts a PCM stream into overlapping windows, preferring to cut in a pause.
+
+    A window closes at the first pause after ``min_window_s`` of new audio,
+    or at ``max_window_s``; the next window repeats the last ``overlap_s``
+    so turns cut at the edge are seen twice (``merge_window`` drops the
+    repeat). Only the open window is buffered.
+    """
+
+    def __init__(self, rate=LIVE_RATE, min_window_s=4.0, max_window_s=10.0, overlap_s=1.0, pause_ms=400,
+                 threshold_db=-40.0):
+        self.rate = rate
+        self.min_bytes = 2 * int(rate * min_window_s)
+        self.max_bytes = 2 * int(rate * max_window_s)
+        self.overlap_bytes = 2 * int(rate * overlap_s)
+        self.pause_bytes = 2 * int(rate * pause_ms / 1000)
+        self.threshold_db = threshold_db
+        self._buffer = bytearray()
+        # Bytes at the front of the buffer repeated from the previous window
+        self._carried = 0
+        self._start_byte = 0
+        self._index = 0
+
+    def _in_pause(self):
+        if len(self._buffer) < self.pause_bytes:
+            return False
+        tail = np.frombuffer(bytes(self._buffer[-self.pause_bytes:]), dtype="<i2").astype(np.float32) / 32768
+        energy, _ = frame_energy_db(tail, self.rate)
+        return bool(np.all(energy < self.threshold_db))
+
+    def push(self, frame):
+        """Adds a frame; returns the windows it closed (usually none or one)."""
+        self._buffer += frame
+        new_bytes = len(self._buffer) - self._carried
+        if new_bytes >= self.max_bytes or (new_bytes >= self.min_bytes and self._in_pause()):
+            return [self._close()]
+        return []
+
+    def flush(self):
+        """Closes the last, partial window when the stream ends (None if it holds no new audio)."""
+        if len(self._buffer) <= self._carried:
+            return None
+        return self._close()
+
+    def _close(self):
+        pcm = bytes(self._buffer)
+        window = {
+            "index": self._index,
+            "start_s": self._start_byte / (2 * self.rate),
+            "end_s": (self._start_byte + len(pcm)) / (2 * self.rate),
+            "pcm": pcm,
+            "closed_at": time.monotonic(),
+        }
+        self._index += 1
+        self._carried = min(self.overlap_bytes, len(pcm))
+        self._start_byte += len(pcm) - self._carried
+        del self._buffer[:len(pcm) - self._carried]
+        return window
+
+
+class ModelTranscriber:
+    """Transcribes a window with the stage-1 prompt, sending the audio inline instead of uploading it."""
+
+    def __init__(self, model_audio, result_cache=None, limiter=None, rate=LIVE_RATE):
+        self.model_audio = model_audio
+        self.result_cache = result_cache
+        self.limiter = limiter
+        self.rate = rate
+
+    def __call__(self, window):
+        wav = pcm_to_wav(window["pcm"], self.rate)
+        response_text, _ = transcribe_audio(
+            self.model_audio, {"mime_type": "audio/wav", "data": wav}, content_hash(wav), self.result_cache, self.limiter
+        )
+        return parse_json(response_text, "transcript").get("Call Details", {}).get("Transcript", [])
+
+
+class StubTranscriber:
+    """Stand-in for the model: returns the turns of a known transcript spoken during each window.
+
+    Turn times are spread over ``duration_s`` by word count (or assumed at
+    ``words_per_s``), and each call sleeps ``latency_s`` like a model request.
+    """
+
+    def __init__(self, transcript_json, duration_s=None, words_per_s=2.5, latency_s=0.5):
+        self.turns = transcript_json.get("Call Details", {}).get("Transcript", [])
+        words = [max(1, len(turn.get("Voice", "").split())) for turn in self.turns]
+        seconds_per_word = duration_s / sum(words) if duration_s and words else 1 / words_per_s
+        self.times = []
+        elapsed = 0.0
+        for count in words:
+            self.times.append((elapsed, elapsed + count * seconds_per_word))
+            elapsed += count * seconds_per_word
+        self.latency_s = latency_s
+
+    def __call__(self, window):
+        time.sleep(self.latency_s)
+        return [
+            dict(turn) for turn, (start, end) in zip(self.turns, self.times)
+            if start < window["end_s"] and end > window["start_s"]
+        ]
+
+
+class ModelJudge:
+    """Updates the judgment fields from the previous judgment and the new turns."""
+
+    def __init__(self, model_json, limiter=None, timeout=None):
+        self.model_json = model_json
+        self.limiter = limiter
+        self.timeout = timeout
+
+    def __call__(self, previous, new_turns):
+        payload = (
+            "Previous Analysis:\n" + json.dumps(previous or {}, ensure_ascii=False) + "\n\nNew part of the transcript:\n"
+            + encode_transcript({"Call Details": {"Transcript": new_turns}})
+        )
+        options = {"request_options": {"timeout": self.timeout}} if self.timeout else {}
+        with span("live_judgment", model=self.model_json.model_name, turns=len(new_turns)), \
+                self.limiter if self.limiter is not None else nullcontext():
+            response = self.model_json.generate_content(
+                [payload, prompt_update_judgment], generation_config=judgment_generation_config, **options
+            )
+            text = record_usage(response).text
+        return parse_json(text, "judgment")
+
+
+class StubJudge:
+    """Stand-in for the model: a judgment built from the turns alone, after ``latency_s``."""
+
+    def __init__(self, latency_s=0.5):
+        self.latency_s = latency_s
+        self.turns = 0
+
+    def __call__(self, previous, new_turns):
+        time.sleep(self.latency_s)
+        self.turns += len(new_turns)
+        client = [turn for turn in new_turns if canonical_speaker(turn.get("Speaker")) == "Client"]
+        satisfied = (previous or {}).get("Client Satisfaction", True)
+        if client:
+            satisfied = client[-1].get("Emotion", "").lower() not in ALERT_EMOTIONS
+        return {
+            "Questions Asked by the Customer": [],
+            "Resolutions Given by the Agent": [],
+            "Suggestion For the Agent": [],
+            "Important Conclusion and Summary of Conversation": f"{self.turns} turns so far.",
+            "Entities Detected": {"Organization": [], "Person": [], "Location": []},
+            "Client Satisfaction": satisfied,
+        }
+
+
+class LiveAnalysis:
+    """Running transcript and stage-2 analysis of one live call.
+
+    ``add_window`` merges a window's turns and updates the local fields for
+    the changed turns only; ``alerts`` collects client turns with an
+    emotion in ``alert_emotions`` (one per streak). ``take_unjudged`` hands
+    out the turns the judgment has not seen yet.
+    """
+
+    def __init__(self, matcher=None, alert_emotions=ALERT_EMOTIONS):
+        self.matcher = matcher or KeywordMatcher(load_keywords())
+        self.alert_emotions = alert_emotions
+        self.turns = []
+        self.keywords = []
+        self.entities = {"Email address": [], "Phone number": [], "Duration": []}
+        self.alerts = []
+        self.judgment = None
+        # Turns already sent to the judge
+        self.judged_turns = 0
+        self._alerted = set()
+
+    def add_window(self, window_turns, at_s=None):
+        """Merges one window's turns; returns the new alerts."""
+        first_changed = merge_window(self.turns, window_turns)
+        changed = self.turns[first_changed:]
+        for label in self.matcher.labels_in("\n".join(turn.get("Voice", "") for turn in changed)):
+            if label not in self.keywords:
+                self.keywords.append(label)
+        for kind, values in detect_entities("\n".join(turn.get("Voice", "") for turn in changed)).items():
+            self.entities[kind].extend(value for value in values if value not in self.entities[kind])
+
+        alerts = []
+        for index in range(first_changed, len(self.turns)):
+            turn = self.turns[index]
+            emotion = turn.get("Emotion", "").lower()
+            if turn["Speaker"] != "Client" or emotion not in self.alert_emotions or index in self._alerted:
+                continue
+            previous = next((t for t in reversed(self.turns[:index]) if t["Speaker"] == "Client"), None)
+            self._alerted.add(index)
+            if previous is not None and previous.get("Emotion", "").lower() == emotion:
+                continue
+            alerts.append({"turn": index, "emotion": emotion, "voice": turn.get("Voice", ""), "at_s": at_s})
+        self.alerts.extend(alerts)
+        return alerts
+
+    def take_unjudged(self):
+        """Returns the turns added since the last call, for the next judgment update."""
+        new_turns = self.turns[self.judged_turns:]
+        self.judged_turns = len(self.turns)
+        return new_turns
+
+    def transcript_json(self):
+        speakers = {turn["Speaker"] for turn in self.turns if turn["Speaker"] != "Unknown"}
+        return {"Call Details": {"Number of Speakers": len(speakers), "Transcript": list(self.turns)}}
+
+    def analysis(self):
+        """The current detailed analysis in the usual key order."""
+        local_fields = {
+            "Emotion Tracking of Clients": [t.get("Emotion", "") for t in self.turns if t["Speaker"] == "Client"],
+            "Emotion Tracking of Agents": [t.get("Emotion", "") for t in self.turns if t["Speaker"] == "Agent"],
+            "Important Words Used in the Conversation": list(self.keywords),
+            "Entities Detected": {kind: list(values) for kind, values in self.entities.items()},
+        }
+        return merge_analysis(local_fields, self.judgment or {})
+
+
+def run_live(source, transcribe, judge=None, analysis=None, windower=None, on_event=None, max_in_flight=2,
+             judge_every_s=JUDGE_EVERY_S):
+    """Runs a live call from ``source`` (an iterable of PCM frames) until it ends.
+
+    Windows are transcribed on up to ``max_in_flight`` threads and merged in
+    order; when that many are pending, reading the source waits, which bounds
+    memory if the model falls behind. ``on_event(event)`` receives "turns",
+    "alert" and "analysis" events. Returns the ``LiveAnalysis`` and lag stats.
+    """
+    analysis = analysis or LiveAnalysis()
+    windower = windower or RollingWindower()
+    on_event = on_event or (lambda event: None)
+    slots = threading.Semaphore(max_in_flight)
+    lock = threading.Lock()
+    finished = {}
+    next_index = [0]
+    lags = []
+    last_judged = [time.monotonic()]
+    judging = threading.Lock()
+    judge_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="live-judge")
+
+    def judge_now():
+        with judging:
+            with lock:
+                new_turns, previous = analysis.take_unjudged(), analysis.judgment
+            if not new_turns:
+                return
+            try:
+                judgment = judge(previous, new_turns)
+            except Exception as exc:
+                on_event({"type": "error", "window": None, "error": f"judgment: {type(exc).__name__}: {exc}"})
+                return
+            with lock:
+                analysis.judgment = judgment
+                current = analysis.analysis()
+            on_event({"type": "analysis", "analysis": current, "judgment": judgment})
+
+    def deliver(window, turns):
+        # Merge windows strictly in order, whichever transcription finishes first
+        with lock:
+            finished[window["index"]] = (window, turns)
+            while next_index[0] in finished:
+                ready, ready_turns = finished.pop(next_index[0])
+                next_index[0] += 1
+                before = len(analysis.turns)
+                alerts = analysis.add_window(ready_turns, at_s=ready["end_s"])
+                lag = time.monotonic() - ready["closed_at"]
+                lags.append(lag)
+                REGISTRY.observe("curateai_live_lag_seconds", lag, help="Time from a window's last audio to its turns.")
+                on_event({"type": "turns", "window": ready["index"], "turns": analysis.turns[before:],
+                          "transcript": analysis.transcript_json(), "lag_s": lag})
+                for alert in alerts:
+                    on_event(dict(alert, type="alert"))
+        if judge is not None and time.monotonic() - last_judged[0] >= judge_every_s and not judging.locked():
+            last_judged[0] = time.monotonic()
+            judge_executor.submit(in_current_context(judge_now))
+
+    def process(window):
+        try:
+            with span("live_window", window=window["index"], audio_s=round(window["end_s"] - window["start_s"], 2)):
+                turns = transcribe(window)
+        except Exception as exc:
+            on_event({"type": "error", "window": window["index"], "error": f"{type(exc).__name__}: {exc}"})
+            turns = []
+        finally:
+            slots.release()
+        deliver(window, turns)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="live-window") as executor:
+
+        def submit(window):
+            slots.acquire()
+            executor.submit(in_current_context(process), window)
+
+        for frame in source:
+            for window in windower.push(frame):
+                submit(window)
+        last = windower.flush()
+        if last is not None:
+            submit(last)
+    if judge is not None:
+        judge_executor.submit(in_current_context(judge_now))
+    judge_executor.shutdown(wait=True)
+
+    lags.sort()
+    stats = {
+        "windows": len(lags),
+        "wall_s": time.monotonic() - started,
+        "lag_p50_s": lags[len(lags) // 2] if lags else None,
+        "lag_p95_s": lags[min(len(lags) - 1, int(0.95 * len(lags)))] if lags else None,
+        "lag_max_s": lags[-1] if lags else None,
+    }
+    return analysis, stats
+
+
+def send(path, host="localhost", port=9555, rate=LIVE_RATE, speed=1.0):
+    """Streams a recording to a ``SocketSource`` at ``speed`` times real time."""
+    with socket.create_connection((host, port)) as conn:
+        for frame in ReplaySource(path, rate, speed=speed):
+            conn.sendall(frame)
+
+
+def _build_backends(args):
+    if args.stub is not None:
+        duration_s = None
+        if args.command == "replay":
+            duration_s = len(decode_pcm(args.audio)) / (2 * LIVE_RATE)
+        with open(args.stub, encoding="utf-8") as f:
+            transcript_json = json.load(f)
+        return StubTranscriber(transcript_json, duration_s, latency_s=args.stub_latency), StubJudge(args.stub_latency)
+
+    from backends import gemini_backend
+    from batch_process import load_secret
+    from prompt_registry import PromptCache, configured_ttl_s
+    from prompts import system_prompt_audio, system_prompt_json
+    from result_cache import ResultCache
+
+    genai = gemini_backend()
+    genai.configure(api_key=load_secret("gemini_api_key", "GEMINI_API_KEY"))
+    model_audio = genai.GenerativeModel(model_name=args.audio_model, system_instruction=system_prompt_audio)
+    model_json = genai.GenerativeModel(model_name=args.analysis_model, system_instruction=system_prompt_json)
+    prompt_cache = PromptCache(genai, ttl_s=configured_ttl_s())
+    model_audio = prompt_cache.wrap(model_audio, system_prompt_audio)
+    model_json = prompt_cache.wrap(model_json, system_prompt_json)
+    return ModelTranscriber(model_audio, ResultCache()), ModelJudge(model_json, timeout=30)
+
+
+def print_event(event):
+    if event["type"] == "turns":
+        for turn in event["turns"]:
+            print(f"[{event['lag_s']:4.1f}s lag] {turn['Speaker']} ({turn.get('Emotion', '')}): {turn.get('Voice', '')}")
+    elif event["type"] == "alert":
+        print(f"!! ALERT: client is {event['emotion']} at {event['at_s']:.0f}s: {event['voice']}")
+    elif event["type"] == "analysis":
+        judgment = event["judgment"] or {}
+        print(f"-- analysis updated: satisfied={judgment.get('Client Satisfaction')} "
+              f"{judgment.get('Important Conclusion and Summary of Conversation', '')}")
+    elif event["type"] == "error":
+        print(f"!! window {event['window']} failed: {event['error']}", file=sys.stderr)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze a call while it is still in progress.")
+    parser.add_argument("command", choices=["replay", "file", "socket", "send"])
+    parser.add_argument("audio", nargs="?", help="Recording to replay or send, or the growing PCM/WAV file to follow")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=9555)
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed (1 = real time, 0 = as fast as possible)")
+    parser.add_argument("--stub", help="Transcript JSON to replay instead of calling the models")
+    parser.add_argument("--stub-latency", type=float, default=0.5, help="Seconds each stub model call takes")
+    parser.add_argument("--audio-model", default="gemini-2.0-flash-001")
+    parser.add_argument("--analysis-model", default="gemini-2.0-flash")
+    parser.add_argument("--judge-every", type=float, default=JUDGE_EVERY_S,
+                        help="Seconds between judgment updates while the call runs")
+    parser.add_argument("--output", help="Write the final transcript and analysis JSON here")
+    args = parser.parse_args(argv)
+    if args.command != "socket" and not args.audio:
+        parser.error(f"{args.command} needs an audio path")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "send":
+        send(args.audio, args.host, args.port, speed=args.speed)
+        return 0
+    if args.command == "replay":
+        source = ReplaySource(args.audio, speed=args.speed)
+    elif args.command == "file":
+        source = GrowingFileSource(args.audio)
+    else:
+        source = SocketSource("0.0.0.0", args.port)
+        print(f"Waiting for PCM audio (16-bit mono, {LIVE_RATE} Hz) on port {args.port}", file=sys.stderr)
+    transcribe, judge = _build_backends(args)
+    analysis, stats = run_live(source, transcribe, judge, on_event=print_event, judge_every_s=args.judge_every)
+    print(
+        f"{stats['windows']} windows in {stats['wall_s']:.1f}s, lag p50 {stats['lag_p50_s'] or 0:.2f}s, "
+        f"p95 {stats['lag_p95_s'] or 0:.2f}s, max {stats['lag_max_s'] or 0:.2f}s",
+        file=sys.stderr,
+    )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"transcript": analysis.transcript_json(), "analysis": analysis.analysis()}, f, indent=4)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
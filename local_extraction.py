@@ -0,0 +1,210 @@
+import json
+import os
+import re
+from collections import deque
+
+from transcript_codec import canonical_speaker
+
+# Key phrases looked up in every call. Each entry maps the label reported in
+# "Important Words Used in the Conversation" to the phrases that trigger it.
+# Override with a JSON file of the same shape via KEYWORDS_PATH.
+DEFAULT_KEYWORDS = {
+    "billing statement": ["billing statement", "bill", "billing", "invoice", "statement"],
+    "late fee": ["late fee", "late charge", "late payment fee", "penalty"],
+    "card expired": ["card expired", "expired card", "card has expired", "card is expired"],
+    "payment method": ["payment method", "credit card", "debit card", "autopay", "auto pay"],
+    "refund": ["refund", "money back", "reimburse", "reimbursement"],
+    "waive": ["waive", "waived", "waiver"],
+    "adjustment": ["adjustment", "credit to your account", "account credit"],
+    "cancellation": ["cancel", "cancellation", "terminate", "close my account"],
+    "upgrade": ["upgrade", "downgrade", "change my plan", "switch plans"],
+    "coverage": ["coverage", "policy", "deductible", "premium"],
+    "savings": ["savings", "save money", "discount", "promotion", "offer"],
+    "order": ["order", "order number", "shipment", "delivery", "tracking number"],
+    "complaint": ["complaint", "escalate", "supervisor", "manager"],
+    "technical issue": ["not working", "error", "outage", "broken", "reset", "password"],
+}
+
+EMAIL_PATTERN = re.compile(r"\b[\w.+-]+@[\w-]+(?:\.[\w-]+)+\b")
+# Emails read out loud: "adam dot turner at mail dot com"
+SPOKEN_EMAIL_PATTERN = re.compile(
+    r"\b([a-z0-9]+(?:\s+(?:dot|underscore)\s+[a-z0-9]+)*)\s+at\s+([a-z0-9]+(?:\s+dot\s+[a-z0-9]+)*\s+dot\s+(?:com|net|org|edu|gov|co|io|in|uk))\b",
+    re.IGNORECASE,
+)
+PHONE_PATTERN = re.compile(r"(?<!\w)(?:\+?\d{1,3}[\s.-]?)?(?:\(\d{3}\)|\d{3})[\s.-]?\d{3}[\s.-]?\d{4}(?!\w)")
+_NUMBER_WORDS = (
+    "one|two|three|four|five|six|seven|eight|nine|ten|eleven|twelve|fifteen|twenty|thirty|forty|"
+    "fifty|sixty|a few|a couple of|several|an|a|half an"
+)
+DURATION_PATTERN = re.compile(
+    rf"\b(?:\d+(?:\.\d+)?(?:\s*(?:-|to)\s*\d+)?|{_NUMBER_WORDS})[\s-]+(?:business\s+)?(?:seconds?|minutes?|mins?|hours?|hrs?|days?|weeks?|months?|years?)\b",
+    re.IGNORECASE,
+)
+
+
+class AhoCorasick:
+    """Multi-pattern matcher: finds every dictionary phrase in one pass over the text."""
+
+    def __init__(self, patterns):
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for pattern in patterns:
+            self._add(pattern)
+        self._build()
+
+    def _add(self, pattern):
+        state = 0
+        for char in pattern:
+            if char not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+                self._goto[state][char] = len(self._goto) - 1
+            state = self._goto[state][char]
+        self._output[state].append(pattern)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0) if self._goto[fail].get(char, 0) != child else 0
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def find_all(self, text):
+        """Yields ``(start, end, pattern)`` for every match, including overlapping ones."""
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for pattern in self._output[state]:
+                yield index - len(pattern) + 1, index + 1, pattern
+
+
+class KeywordMatcher:
+    """Finds dictionary keywords in transcript text on word boundaries."""
+
+    def __init__(self, keywords=None):
+        keywords = keywords or DEFAULT_KEYWORDS
+        self._labels = {}
+        for label, phrases in keywords.items():
+            for phrase in phrases:
+                self._labels.setdefault(phrase.lower(), label)
+        self._automaton = AhoCorasick(self._labels)
+
+    def labels_in(self, text):
+        """Returns the matched labels in order of first appearance."""
+        text = text.lower()
+        found = []
+        for start, end, phrase in self._automaton.find_all(text):
+            before = text[start - 1] if start > 0 else " "
+            after = text[end] if end < len(text) else " "
+            if before.isalnum() or after.isalnum():
+                continue
+            label = self._labels[phrase]
+            if label not in found:
+                found.append(label)
+        return found
+
+
+def load_keywords(path=None):
+    """Loads the keyword dictionary from ``path`` or KEYWORDS_PATH, else the default."""
+    path = path or os.environ.get("KEYWORDS_PATH")
+    if not path:
+        return DEFAULT_KEYWORDS
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+_default_matcher = None
+
+
+def _unique(values):
+    seen = []
+    for value in values:
+        if value not in seen:
+            seen.append(value)
+    return seen
+
+
+def detect_entities(text):
+    """Regex entity detection for emails, phone numbers and durations."""
+    emails = EMAIL_PATTERN.findall(text)
+    for user, domain in SPOKEN_EMAIL_PATTERN.findall(text):
+        spoken = f"{user}@{domain}"
+        emails.append(re.sub(r"\s+(?:dot)\s+", ".", re.sub(r"\s+underscore\s+", "_", spoken)).replace(" ", ""))
+    return {
+        "Email address": _unique(email.lower() for email in emails),
+        "Phone number": _unique(match.strip() for match in PHONE_PATTERN.findall(text)),
+        "Duration": _unique(match.lower() for match in DURATION_PATTERN.findall(text)),
+    }
+
+
+def extract_local_fields(transcript_json, matcher=None):
+    """Computes the stage-2 fields that are plain projections of the transcript.
+
+    Returns the emotion timelines per speaker role, dictionary keywords and
+    regex-detected entities, using the same keys as ``prompt_transcript_to_output``.
+    """
+    global _default_matcher
+    if matcher is None:
+        if _default_matcher is None:
+            _default_matcher = KeywordMatcher(load_keywords())
+        matcher = _default_matcher
+
+    turns = transcript_json.get("Call Details", {}).get("Transcript", [])
+    client_emotions, agent_emotions = [], []
+    for turn in turns:
+        speaker = canonical_speaker(turn.get("Speaker"))
+        emotion = turn.get("Emotion", "")
+        if speaker == "Client":
+            client_emotions.append(emotion)
+        elif speaker == "Agent":
+            agent_emotions.append(emotion)
+
+    text = "\n".join(turn.get("Voice", "") for turn in turns)
+    return {
+        "Emotion Tracking of Clients": client_emotions,
+        "Emotion Tracking of Agents": agent_emotions,
+        "Important Words Used in the Conversation": matcher.labels_in(text),
+        "Entities Detected": detect_entities(text),
+    }
+
+
+# Output order of prompt_transcript_to_output, kept for the merged result
+ANALYSIS_KEYS = [
+    "Emotion Tracking of Clients",
+    "Emotion Tracking of Agents",
+    "Important Words Used in the Conversation",
+    "Questions Asked by the Customer",
+    "Resolutions Given by the Agent",
+    "Suggestion For the Agent",
+    "Important Conclusion and Summary of Conversation",
+    "Entities Detected",
+    "Client Satisfaction",
+]
+
+
+def merge_analysis(local_fields, llm_fields):
+    """Combines local fields with the LLM's judgment fields in the usual key order."""
+    merged = {}
+    entities = dict(llm_fields.get("Entities Detected") or {}) if isinstance(llm_fields.get("Entities Detected"), dict) else {}
+    for kind, values in local_fields["Entities Detected"].items():
+        if values:
+            entities[kind] = values
+    for key in ANALYSIS_KEYS:
+        if key == "Entities Detected":
+            merged[key] = entities
+        elif key in local_fields:
+            merged[key] = local_fields[key]
+        elif key in llm_fields:
+            merged[key] = llm_fields[key]
+    for key, value in llm_fields.items():
+        merged.setdefault(key, value)
+    return merged
@@ -0,0 +1,277 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_LOG_PATH = os.path.join("logs", "spans.jsonl")
+DEFAULT_METRICS_PORT = 9464
+# Histogram buckets for stage latency, in seconds
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_call_id = contextvars.ContextVar("call_id", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def new_call_id():
+    return uuid.uuid4().hex[:16]
+
+
+def current_call_id():
+    """Returns the call ID of the enclosing ``call_scope``, if any."""
+    return _call_id.get()
+
+
+@contextmanager
+def call_scope(call_id=None):
+    """Ties every span opened inside the block to one call ID (one processed recording)."""
+    call_id = call_id or current_call_id() or new_call_id()
+    token = _call_id.set(call_id)
+    try:
+        yield call_id
+    finally:
+        _call_id.reset(token)
+
+
+def bind_call_id(call_id):
+    """Sets the call ID for the rest of the current thread's work (e.g. one Streamlit rerun)."""
+    _call_id.set(call_id)
+
+
+def in_current_context(fn):
+    """Wraps ``fn`` so it runs with the caller's call ID when submitted to a thread pool."""
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return run
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+class MetricsRegistry:
+    """In-process counters and latency histograms, rendered in Prometheus text format."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1, help="", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ("counter", help))
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, help="", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ("histogram", help))
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["counts"][index] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: dict(value, counts=list(value["counts"])) for key, value in self._histograms.items()}
+            help_texts = dict(self._help)
+        lines = []
+        for name in sorted(help_texts):
+            kind, help = help_texts[name]
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == "counter":
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_format_labels(labels)} {value}")
+                continue
+            for (metric, labels), histogram in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(self.buckets, histogram["counts"]):
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', bound),))} {count}")
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram['sum']}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+class SpanLog:
+    """Appends one JSON object per finished span to a JSON-lines file."""
+
+    def __init__(self, path=DEFAULT_LOG_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+# Process-wide defaults; the span log can be disabled with METRICS_LOG_PATH=""
+REGISTRY = MetricsRegistry()
+_log_path = os.environ.get("METRICS_LOG_PATH", DEFAULT_LOG_PATH)
+SPAN_LOG = SpanLog(_log_path) if _log_path else None
+
+
+class Span:
+    """Measurements for one stage of one call; fill in fields while the span is open."""
+
+    def __init__(self, stage, model=None, **fields):
+        self.record = {
+            "call_id": current_call_id(),
+            "span_id": uuid.uuid4().hex[:8],
+            "stage": stage,
+            "model": model,
+            "cache": None,
+            "bytes": 0,
+            "prompt_tokens": 0,
+            "output_tokens": 0,
+            "cached_tokens": 0,
+        }
+        self.record.update(fields)
+
+    def __setitem__(self, name, value):
+        self.record[name] = value
+
+    def __getitem__(self, name):
+        return self.record[name]
+
+    def add_usage(self, prompt_tokens=0, output_tokens=0, cached_tokens=0):
+        self.record["prompt_tokens"] += prompt_tokens or 0
+        self.record["output_tokens"] += output_tokens or 0
+        self.record["cached_tokens"] += cached_tokens or 0
+
+
+@contextmanager
+def span(stage, model=None, registry=None, log=None, **fields):
+    """Times a block as one stage of the current call.
+
+    Records the wall time, bytes, token counts, model and cache outcome in
+    the metrics registry and writes the span to the JSON log. Exceptions are
+    recorded as ``status="error"`` and re-raised.
+    """
+    registry = registry or REGISTRY
+    log = log if log is not None else SPAN_LOG
+    current = Span(stage, model, **fields)
+    token = _current_span.set(current)
+    started_at = time.time()
+    started = time.perf_counter()
+    status = "ok"
+    try:
+        yield current
+    except BaseException as exc:
+        status = "error"
+        current["error"] = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        _current_span.reset(token)
+        seconds = time.perf_counter() - started
+        record = current.record
+        record.update(ts=round(started_at, 3), seconds=round(seconds, 4), status=status)
+        _record_metrics(registry, record, seconds)
+        if log is not None:
+            log.write(record)
+
+
+def _record_metrics(registry, record, seconds):
+    labels = {"stage": record["stage"], "model": record["model"] or "", "cache": record["cache"] or "none"}
+    registry.observe("curateai_stage_seconds", seconds, help="Wall time per pipeline stage.", **labels)
+    registry.inc("curateai_stage_calls_total", help="Pipeline stage executions.", status=record["status"], **labels)
+    if record["bytes"]:
+        registry.inc("curateai_bytes_total", record["bytes"], help="Bytes uploaded per stage.", stage=record["stage"])
+    for kind in ("prompt", "output", "cached"):
+        if record[f"{kind}_tokens"]:
+            registry.inc(
+                "curateai_tokens_total", record[f"{kind}_tokens"], help="Model tokens reported by the provider.",
+                stage=record["stage"], model=labels["model"], kind=kind,
+            )
+
+
+def current_span():
+    return _current_span.get()
+
+
+def record_usage(response):
+    """Adds the token usage reported on a Gemini or Groq response to the open span.
+
+    Prompt tokens include any served from a cached prompt prefix, which are
+    also counted as ``cached_tokens``.
+
+    Returns ``response`` so it can wrap a call expression.
+    """
+    current = current_span()
+    if current is None or response is None:
+        return response
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        current.add_usage(
+            getattr(usage, "prompt_token_count", 0),
+            getattr(usage, "candidates_token_count", 0),
+            getattr(usage, "cached_content_token_count", 0),
+        )
+        return response
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        current.add_usage(getattr(usage, "prompt_tokens", 0), getattr(usage, "completion_tokens", 0))
+    return response
+
+
+def instrumented_upload(upload):
+    """Wraps ``upload(path, mime_type)`` in an "upload" span that records the file size."""
+    def upload_with_span(path, mime_type=None):
+        with span("upload", bytes=os.path.getsize(path), mime_type=mime_type):
+            return upload(path, mime_type=mime_type)
+    return upload_with_span
+
+
+def start_metrics_server(port=DEFAULT_METRICS_PORT, registry=None, host="0.0.0.0"):
+    """Serves ``/metrics`` in Prometheus text format from a daemon thread.
+
+    Returns the server; call ``shutdown()`` to stop it.
+    """
+    registry = registry or REGISTRY
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,98 @@
+import streamlit as st
+import pandas as pd
+import time
+from datetime import date, datetime, timedelta
+from call_store import CallStore
+
+# Shared store of every processed call (see call_store.py)
+@st.cache_resource
+def get_call_store():
+    return CallStore()
+
+def to_epoch(day):
+    return datetime.combine(day, datetime.min.time()).timestamp()
+
+def show_table(rows, **kwargs):
+    if rows:
+        st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True, **kwargs)
+    else:
+        st.caption("No calls match.")
+
+st.title("Call Analytics")
+
+store = get_call_store()
+started = time.perf_counter()
+
+# Time range shared by every query on the page
+date_range = st.date_input("Processed between", value=(date.today() - timedelta(days=7), date.today()))
+# While a new range is being picked only its first day is set
+if len(date_range) < 2:
+    st.info("Pick the last day of the range.")
+    st.stop()
+start_day, end_day = date_range
+since, until = to_epoch(start_day), to_epoch(end_day + timedelta(days=1))
+agents = store.agents()
+agent = st.selectbox("Agent", ["All agents"] + agents)
+agent = None if agent == "All agents" else agent
+
+satisfaction = store.satisfaction(since, until, agent=agent)
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("Calls", satisfaction["calls"])
+col2.metric("Satisfied", satisfaction["satisfied"])
+col3.metric("Unsatisfied", satisfaction["unsatisfied"])
+col4.metric("Unsatisfied share", f"{satisfaction['unsatisfied_pct']:.1f}%")
+
+st.subheader("Emotions")
+role = st.radio("Speaker", ["Client", "Agent"], horizontal=True)
+emotions = store.emotion_counts(role, since, until, agent=agent)
+if emotions:
+    st.bar_chart(pd.DataFrame(emotions).set_index("emotion")["calls"])
+else:
+    st.caption("No calls match.")
+
+st.subheader("Agents by client emotion")
+emotion_names = [row["emotion"] for row in store.emotion_counts("Client", since, until, limit=50)]
+emotion = st.selectbox("Emotion", emotion_names, index=emotion_names.index("frustrated") if "frustrated" in emotion_names else 0) if emotion_names else None
+if emotion:
+    show_table(store.agents_by_emotion(emotion, "Client", since, until))
+
+col1, col2 = st.columns(2)
+with col1:
+    st.subheader("Key words")
+    show_table(store.top_keywords(since, until))
+with col2:
+    st.subheader("Entities")
+    show_table(store.top_entities(since=since, until=until))
+
+st.subheader("Find calls")
+with st.form("find_calls"):
+    col1, col2, col3 = st.columns(3)
+    find_emotion = col1.text_input("Client emotion")
+    find_keyword = col2.text_input("Key word")
+    find_entity = col3.text_input("Entity")
+    find_satisfied = st.radio("Client satisfied", ["Any", "Yes", "No"], horizontal=True)
+    submitted = st.form_submit_button("Search")
+if submitted:
+    calls = store.find_calls(
+        emotion=find_emotion or None,
+        keyword=find_keyword or None,
+        entity=find_entity or None,
+        satisfied={"Any": None, "Yes": True, "No": False}[find_satisfied],
+        agent=agent,
+        since=since,
+        until=until,
+    )
+    for call in calls:
+        call["processed_at"] = datetime.fromtimestamp(call["processed_at"]).strftime("%Y-%m-%d %H:%M")
+    # Kept across reruns so picking a call below does not clear the results
+    st.session_state.found_calls = calls
+if "found_calls" in st.session_state:
+    calls = st.session_state.found_calls
+    show_table(calls)
+    if calls:
+        selected = st.selectbox("Show call", [call["call_key"] for call in calls])
+        documents = store.get_call(selected)
+        if documents:
+            st.json(documents, expanded=False)
+
+st.caption(f"Queries answered in {1000 * (time.perf_counter() - started):.0f} ms")
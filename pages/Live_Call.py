@@ -0,0 +1,120 @@
+import streamlit as st
+import backends
+import json
+import queue
+import threading
+from pathlib import Path
+from live_analysis import (
+    LIVE_RATE, LiveAnalysis, ModelJudge, ModelTranscriber, ReplaySource, SocketSource, StubJudge, StubTranscriber,
+    decode_pcm, run_live,
+)
+from ingest import SessionFiles
+from metrics import in_current_context
+from prompts import system_prompt_audio, system_prompt_json
+from prompt_registry import PromptCache, configured_ttl_s
+from result_cache import ResultCache
+
+# Models shared by all sessions of this process
+@st.cache_resource
+def get_live_models():
+    genai = backends.gemini_backend()
+    genai.configure(api_key=None if backends.stub_enabled() else st.secrets["gemini_api_key"])
+    model_audio = genai.GenerativeModel(model_name="gemini-2.0-flash-001", system_instruction=system_prompt_audio)
+    model_json = genai.GenerativeModel(model_name="gemini-2.0-flash", system_instruction=system_prompt_json)
+    prompt_cache = PromptCache(genai, ttl_s=configured_ttl_s())
+    return prompt_cache.wrap(model_audio, system_prompt_audio), prompt_cache.wrap(model_json, system_prompt_json)
+
+@st.cache_resource
+def get_result_cache():
+    return ResultCache()
+
+st.title("Live Call Monitor")
+
+source_kind = st.radio("Audio source", ["Replay a recording", "Socket (16-bit mono PCM)"], horizontal=True)
+if source_kind == "Replay a recording":
+    replay_audio = st.file_uploader("Recording to replay", type=["mp3", "aac", "wav", "aiff"])
+    speed = st.slider("Replay speed", 1.0, 8.0, 1.0)
+else:
+    port = st.number_input("Port", value=9555, step=1)
+    st.caption(f"Send {LIVE_RATE} Hz audio with `python live_analysis.py send call.mp3 --port {port}`")
+use_stub = st.checkbox("Use the stub backend (replays a known transcript, no model calls)")
+stub_transcript = st.file_uploader("Transcript JSON for the stub", type=["json"]) if use_stub else None
+judge_every = st.slider("Refresh the judgment every (seconds)", 10, 120, 30)
+
+if st.button("Start"):
+    if use_stub and stub_transcript is None:
+        st.error("Upload the transcript JSON the stub should replay.")
+        st.stop()
+    # The replayed recording is spooled here and removed once the call ends
+    replay_files = None
+    if source_kind == "Replay a recording":
+        if replay_audio is None:
+            st.error("Upload a recording to replay.")
+            st.stop()
+        replay_files = SessionFiles()
+        path = replay_files.spool(replay_audio.getbuffer(), suffix=Path(replay_audio.name).suffix.lower())
+        source = ReplaySource(path, speed=speed)
+    else:
+        source = SocketSource(port=int(port))
+        st.info(f"Waiting for audio on port {int(port)}...")
+
+    if use_stub:
+        duration_s = len(decode_pcm(path)) / (2 * LIVE_RATE) if source_kind == "Replay a recording" else None
+        transcribe, judge = StubTranscriber(json.load(stub_transcript), duration_s), StubJudge()
+    else:
+        model_audio, model_json = get_live_models()
+        transcribe, judge = ModelTranscriber(model_audio, get_result_cache()), ModelJudge(model_json, timeout=30)
+
+    # run_live reports from worker threads; the script thread drains the events and draws them
+    events = queue.Queue()
+    analysis = LiveAnalysis()
+    result = {}
+
+    def run():
+        try:
+            result["stats"] = run_live(source, transcribe, judge, analysis=analysis, on_event=events.put,
+                                       judge_every_s=judge_every)[1]
+        except Exception as exc:
+            result["error"] = f"{type(exc).__name__}: {exc}"
+        finally:
+            if replay_files is not None:
+                replay_files.cleanup()
+
+    worker = threading.Thread(target=in_current_context(run), daemon=True)
+    worker.start()
+
+    alerts_box = st.container()
+    lag_caption = st.empty()
+    col1, col2 = st.columns(2)
+    transcript_box = col1.container(height=500)
+    analysis_box = col2.empty()
+    while worker.is_alive() or not events.empty():
+        try:
+            event = events.get(timeout=0.2)
+        except queue.Empty:
+            continue
+        if event["type"] == "turns":
+            for turn in event["turns"]:
+                transcript_box.markdown(f"**{turn['Speaker']}** ({turn.get('Emotion', '')}): {turn.get('Voice', '')}")
+            lag_caption.caption(f"Window {event['window'] + 1} shown {event['lag_s']:.1f}s after its last audio")
+        elif event["type"] == "alert":
+            alerts_box.warning(f"Client is {event['emotion']} ({event['at_s']:.0f}s): {event['voice']}")
+        elif event["type"] == "analysis":
+            analysis_box.json(event["analysis"], expanded=False)
+        elif event["type"] == "error":
+            alerts_box.error(f"Window {event['window']} failed: {event['error']}")
+
+    if "error" in result:
+        st.error(f"Live analysis stopped: {result['error']}")
+    else:
+        stats = result["stats"]
+        st.success(
+            f"Call ended: {stats['windows']} windows, lag p50 {stats['lag_p50_s'] or 0:.1f}s, "
+            f"p95 {stats['lag_p95_s'] or 0:.1f}s"
+        )
+    st.download_button(
+        label="Download Transcript and Analysis JSON",
+        data=json.dumps({"transcript": analysis.transcript_json(), "analysis": analysis.analysis()}, indent=4),
+        file_name="live_call.json",
+        mime="application/json"
+    )
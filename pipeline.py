@@ -0,0 +1,300 @@
+import json
+from contextlib import nullcontext
+from pathlib import Path
+
+from result_cache import make_key
+from prompts import (
+    transcript_generation_config,
+    analysis_generation_config,
+    judgment_generation_config,
+    Prompt_for_audio_transcript,
+    system_prompt_audio,
+    system_prompt_json,
+    prompt_transcript_to_output,
+    prompt_summarize_part,
+    prompt_transcript_to_judgment,
+)
+from local_extraction import extract_local_fields, merge_analysis
+from metrics import REGISTRY, span, record_usage
+from json_repair import PARSE_STATS, is_cacheable, loads_tolerant, parse_transcript
+from schemas import ANALYSIS_SCHEMA, schema_errors
+from transcript_codec import CODEC_VERSION, TOKEN_BUDGETS, fit_to_budget, compaction_report
+from vad import remap_turn_starts
+
+VALID_EXTENSIONS = [".mp3", ".aac", ".wav", ".aiff"]
+
+GROQ_MODEL = "llama-3.3-70b-versatile"
+GROQ_PARAMS = {
+    "temperature": 0.3,
+    "response_format": {"type": "json_object"},
+    "max_tokens": 2048
+}
+
+
+def _gemini_timeout(timeout):
+    return {"request_options": {"timeout": timeout}} if timeout else {}
+
+
+def _groq_timeout(timeout):
+    return {"timeout": timeout} if timeout else {}
+
+
+def mime_type_for(path):
+    """Returns the Gemini mime type for an audio file, based on its extension."""
+    file_extension = Path(path).suffix.lower()
+    return f"audio/{file_extension.strip('.') if file_extension != '.mp3' else 'mpeg'}"
+
+
+def _cached(result_cache, key, compute, stage, limiter=None, model=None):
+    if limiter is not None:
+        unlimited = compute
+
+        def compute():
+            with limiter:
+                return unlimited()
+
+    with span(stage, model=model) as stage_span:
+        if result_cache is None:
+            value, cached = compute(), False
+        else:
+            # Output the repair parser can fix is cached too, so it never has to be regenerated;
+            # salvaged (cut-off) transcripts are not, so they are regenerated next time
+            value, cached = result_cache.get_or_compute(
+                key, compute, stage=stage, validate=lambda text: is_cacheable(text, stage)
+            )
+        stage_span["cache"] = "off" if result_cache is None else ("hit" if cached else "miss")
+    return value, cached
+
+
+def _count_parse(stage, outcome):
+    PARSE_STATS.record(stage, outcome)
+    REGISTRY.inc("curateai_json_parse_total", help="Model output parses by outcome.", stage=stage, outcome=outcome)
+
+
+def parse_json(response_text, stage, report=None):
+    """Parses model output, repairing it (or salvaging transcript turns) if needed.
+
+    Measured as the "<stage>_parse" span; the outcome ("ok", "repaired",
+    "salvaged" or "failed") is counted in ``PARSE_STATS`` and, if ``report``
+    is a dict, stored in it. Raises ``json.JSONDecodeError`` when nothing
+    can be recovered.
+    """
+    with span(f"{stage}_parse", chars=len(response_text)) as parse_span:
+        try:
+            if stage == "transcript":
+                value, outcome = parse_transcript(response_text)
+            else:
+                value, outcome = loads_tolerant(response_text)
+        except ValueError:
+            outcome = "failed"
+            raise
+        finally:
+            parse_span["outcome"] = outcome
+            _count_parse(stage, outcome)
+            if report is not None:
+                report["outcome"] = outcome
+        if stage == "analysis":
+            parse_span["schema_errors"] = len(schema_errors(value, ANALYSIS_SCHEMA))
+        return value
+
+
+def transcript_to_original_time(transcript_json, time_remap):
+    """Maps the turn start times of a transcript of trimmed audio back to the original recording."""
+    details = transcript_json.get("Call Details") if isinstance(transcript_json, dict) else None
+    if not time_remap or not isinstance(details, dict) or not isinstance(details.get("Transcript"), list):
+        return transcript_json
+    turns = remap_turn_starts(details["Transcript"], time_remap)
+    return dict(transcript_json, **{"Call Details": dict(details, Transcript=turns)})
+
+
+def transcript_cache_key(model_audio, audio_hash):
+    """Result-cache key for the stage-1 transcript of the given audio."""
+    return make_key(
+        stage="transcript",
+        audio=audio_hash,
+        model=model_audio.model_name,
+        prompt=Prompt_for_audio_transcript,
+        system_instruction=system_prompt_audio,
+        generation_config=transcript_generation_config,
+    )
+
+
+def transcribe_audio(model_audio, audio_file, audio_hash, result_cache=None, limiter=None):
+    """Stage 1: runs the transcript prompt over an uploaded Gemini file.
+
+    ``audio_file`` may be a callable returning the file, so the upload only
+    happens on a cache miss. Returns ``(response_text, cached)``. ``limiter``
+    (a ``rate_limit.ProviderLimiter``) is only entered when the model is
+    actually called, not on cache hits or while uploading.
+    """
+    key = transcript_cache_key(model_audio, audio_hash)
+
+    def compute():
+        uploaded = audio_file() if callable(audio_file) else audio_file
+        with limiter if limiter is not None else nullcontext():
+            return record_usage(model_audio.generate_content(
+                [uploaded, Prompt_for_audio_transcript], generation_config=transcript_generation_config
+            )).text
+
+    return _cached(result_cache, key, compute, "transcript", None, model_audio.model_name)
+
+
+def _payload_and_report(transcript_json, provider, summarize, baseline, report):
+    payload, level = fit_to_budget(transcript_json, TOKEN_BUDGETS[provider], summarize)
+    if report is not None:
+        report.update(compaction_report(transcript_json, payload, level, baseline))
+    return payload
+
+
+def _fallback_report(transcript_json, provider, baseline):
+    report = {}
+    _payload_and_report(transcript_json, provider, None, baseline, report)
+    return report
+
+
+def _compaction_key(analysis_key):
+    return make_key(stage="compaction", analysis=analysis_key)
+
+
+def _finish_report(result_cache, key, cached, report, fallback):
+    """Saves the compaction report of a fresh analysis, or restores the saved one on a cache hit.
+
+    A restored report is marked ``cached``: it describes the payload sent when
+    the answer was first generated, and nothing was sent this time.
+    ``fallback()`` rebuilds a report (without summarizing) for entries cached
+    before reports were saved.
+    """
+    if result_cache is None:
+        report["cached"] = False
+    elif not cached:
+        report["cached"] = False
+        result_cache.put(_compaction_key(key), json.dumps(report), stage="compaction")
+    else:
+        saved = result_cache.get(_compaction_key(key))
+        report.update(json.loads(saved) if saved is not None else fallback())
+        report["cached"] = True
+
+
+def with_local_fields(transcript_json, response_text):
+    """Adds the locally extracted fields to the model's judgment-only JSON answer."""
+    try:
+        llm_fields, outcome = loads_tolerant(response_text)
+    except json.JSONDecodeError:
+        _count_parse("judgment", "failed")
+        return response_text
+    # The merged answer is re-serialized, so repairs are only visible here
+    _count_parse("judgment", outcome)
+    if not isinstance(llm_fields, dict):
+        return response_text
+    with span("local_fields"):
+        local_fields = extract_local_fields(transcript_json)
+    return json.dumps(merge_analysis(local_fields, llm_fields), ensure_ascii=False)
+
+
+def analyze_with_gemini(model_json, transcript_json, result_cache=None, limiter=None, report=None, local_fields=True,
+                        timeout=None):
+    """Stage 2 on Gemini: turns a transcript JSON into the detailed analysis.
+
+    The transcript is sent in the compact encoding from ``transcript_codec``,
+    compacted further (or summarized part by part) when it exceeds the Gemini
+    token budget. If ``report`` is a dict it receives the token savings
+    (the saved report, marked ``cached``, when the answer comes from the cache).
+    With ``local_fields``, emotion tracking, key words and regex entities are
+    computed by ``local_extraction`` and the model only answers the judgment
+    fields. ``timeout`` bounds each request in seconds.
+
+    Returns ``(response_text, cached)``.
+    """
+    # Kept even when the caller does not ask for it, so cache hits can report it
+    report = {} if report is None else report
+    prompt = prompt_transcript_to_judgment if local_fields else prompt_transcript_to_output
+    generation_config = judgment_generation_config if local_fields else analysis_generation_config
+    transcript_str = json.dumps(transcript_json)
+    key = make_key(
+        stage="analysis",
+        transcript=transcript_str,
+        encoding=CODEC_VERSION,
+        budget=TOKEN_BUDGETS["gemini"],
+        model=model_json.model_name,
+        prompt=prompt,
+        system_instruction=system_prompt_json,
+        generation_config=generation_config,
+    )
+
+    # Runs inside compute(), which already holds the limiter
+    def summarize(text):
+        return record_usage(model_json.generate_content([text, prompt_summarize_part], **_gemini_timeout(timeout))).text
+
+    def compute():
+        payload = _payload_and_report(transcript_json, "gemini", summarize, transcript_str, report)
+        response = model_json.generate_content(
+            [payload, prompt], generation_config=generation_config, **_gemini_timeout(timeout)
+        )
+        return record_usage(response).text
+
+    response_text, cached = _cached(result_cache, key, compute, "analysis", limiter, model_json.model_name)
+    _finish_report(result_cache, key, cached, report, lambda: _fallback_report(transcript_json, "gemini", transcript_str))
+    if local_fields:
+        response_text = with_local_fields(transcript_json, response_text)
+    return response_text, cached
+
+
+def analyze_with_groq(groq_client, transcript_json, result_cache=None, model=GROQ_MODEL, limiter=None, report=None,
+                      local_fields=True, timeout=None):
+    """Stage 2 on Groq: turns a transcript JSON into the detailed analysis.
+
+    Uses the same compact encoding and local extraction as
+    ``analyze_with_gemini``, with the smaller Groq token budget.
+    Returns ``(response_text, cached)``.
+    """
+    report = {} if report is None else report
+    prompt = prompt_transcript_to_judgment if local_fields else prompt_transcript_to_output
+    formatted_json = json.dumps(transcript_json, indent=2)
+    key = make_key(
+        stage="analysis",
+        transcript=json.dumps(transcript_json),
+        encoding=CODEC_VERSION,
+        budget=TOKEN_BUDGETS["groq"],
+        prompt=prompt,
+        model=model,
+        **GROQ_PARAMS
+    )
+
+    def summarize(text):
+        completion = groq_client.chat.completions.create(
+            messages=[{"role": "user", "content": f"{prompt_summarize_part}\n\n{text}"}],
+            model=model,
+            temperature=GROQ_PARAMS["temperature"],
+            max_tokens=512,
+            **_groq_timeout(timeout)
+        )
+        return record_usage(completion).choices[0].message.content
+
+    def compute():
+        payload = _payload_and_report(transcript_json, "groq", summarize, formatted_json, report)
+        messages = [
+            {
+                "role": "user",
+                "content": f"{prompt}\n\nHere's the transcript data:\n{payload}"
+            }
+        ]
+        completion = groq_client.chat.completions.create(messages=messages, model=model, **GROQ_PARAMS, **_groq_timeout(timeout))
+        return record_usage(completion).choices[0].message.content
+
+    response_text, cached = _cached(result_cache, key, compute, "analysis", limiter, model)
+    _finish_report(result_cache, key, cached, report, lambda: _fallback_report(transcript_json, "groq", formatted_json))
+    if local_fields:
+        response_text = with_local_fields(transcript_json, response_text)
+    return response_text, cached
+
+
+def transcript_to_text(transcript_json):
+    """Builds the plain-text "Speaker: text" transcript from the JSON transcript."""
+    entries = transcript_json.get("Call Details", {}).get("Transcript", [])
+    lines = []
+    for item in entries:
+        speaker = item.get("Speaker", "")
+        text = item.get("Voice", "")
+        if speaker and text:
+            lines.append(f"{speaker}: {text}")
+    return "\n".join(lines)
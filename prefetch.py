@@ -0,0 +1,83 @@
+import threading
+from concurrent.futures import CancelledError, Future
+
+from metrics import in_current_context
+
+
+class PrefetchSlot:
+    """Holds at most one background request, tied to the input it was started for.
+
+    Kept in ``st.session_state``: the stage-2 analysis is started as soon as a
+    transcript exists, and "View Detailed Analysis" then picks up the finished
+    (or still running) future instead of starting a new request.
+    """
+
+    def __init__(self):
+        self.key = None
+        self.future = None
+        self._lock = threading.Lock()
+
+    def start(self, executor, key, fn, *args, **kwargs):
+        """Submits ``fn`` for ``key`` unless a request for the same key already exists.
+
+        ``fn`` runs with the caller's call ID so its spans are tied to the same call.
+        """
+        with self._lock:
+            if self.key == key and self.future is not None and not self.future.cancelled():
+                return self.future
+            self._cancel_locked()
+            self.key = key
+            self.future = executor.submit(in_current_context(fn), *args, **kwargs)
+            return self.future
+
+    def fill(self, key, result):
+        """Stores a result obtained elsewhere (e.g. from the job service) as the finished request for ``key``."""
+        future = Future()
+        future.set_result(result)
+        with self._lock:
+            self._cancel_locked()
+            self.key, self.future = key, future
+
+    def result(self, key, timeout=None):
+        """Returns the prefetched result for ``key``, waiting if it is still running.
+
+        Returns None when nothing was prefetched for ``key`` or the request
+        was cancelled or failed, so the caller can fall back to a direct call.
+        """
+        with self._lock:
+            future = self.future if self.key == key else None
+        if future is None:
+            return None
+        try:
+            return future.result(timeout=timeout)
+        except CancelledError:
+            return None
+        except Exception:
+            # Drop the failed request so the next click retries it
+            with self._lock:
+                if self.future is future:
+                    self.key, self.future = None, None
+            return None
+
+    def status(self, key):
+        """Returns "idle", "running", "ready" or "failed" for ``key``."""
+        with self._lock:
+            if self.key != key or self.future is None or self.future.cancelled():
+                return "idle"
+            if not self.future.done():
+                return "running"
+            return "failed" if self.future.exception() is not None else "ready"
+
+    def cancel(self):
+        """Cancels the pending request, e.g. when a new file is uploaded.
+
+        A request that has already been sent cannot be interrupted; its result
+        is simply discarded.
+        """
+        with self._lock:
+            self._cancel_locked()
+
+    def _cancel_locked(self):
+        if self.future is not None:
+            self.future.cancel()
+        self.key, self.future = None, None
@@ -0,0 +1,290 @@
+"""Versioned registry of the static prompts, cached on the provider side.
+
+Each stage repeats the same system instruction and instruction block on every
+request. ``PromptCache`` registers each of these prefixes once per model as
+Gemini cached content (``genai.caching.CachedContent``) and extends its TTL
+before it runs out. Models wrapped with ``PromptCache.wrap`` then send only
+the audio or transcript and reference the cached prefix, which is billed at
+the cached-token rate and skips most of the prefill time. A prefix that
+cannot be cached (below the model's minimum cache size, or a model without
+caching) is simply sent in full, as before.
+
+Gemini only caches prefixes of at least ``MIN_CACHE_TOKENS`` (4,096 tokens
+on 2.0 Flash, 32,768 on 1.5 models). The current prompts are about 470-1,400
+tokens, so none of them qualifies yet; they are not registered, and caching
+is off unless a TTL is set (``--prompt-cache-ttl`` or CURATEAI_PROMPT_CACHE_TTL).
+
+    python prompt_registry.py   # versions and sizes of the registered prompts
+"""
+import hashlib
+import os
+import threading
+import time
+from datetime import timedelta
+
+from metrics import REGISTRY
+from prompts import (
+    Prompt_for_audio_transcript,
+    prompt_transcript_to_judgment,
+    prompt_transcript_to_output,
+    prompt_update_judgment,
+    system_prompt_audio,
+    system_prompt_json,
+)
+from provider_router import is_retryable
+from transcript_codec import estimate_tokens
+
+# Static prefix of every stage: the model's system instruction and the instruction block
+PROMPTS = {
+    "transcript": {"system": system_prompt_audio, "instruction": Prompt_for_audio_transcript},
+    "analysis": {"system": system_prompt_json, "instruction": prompt_transcript_to_output},
+    "judgment": {"system": system_prompt_json, "instruction": prompt_transcript_to_judgment},
+    "update_judgment": {"system": system_prompt_json, "instruction": prompt_update_judgment},
+}
+DEFAULT_TTL_S = 3600
+# Smallest cached content each model accepts, by model name prefix (longest match wins);
+# unknown models get the largest minimum
+MIN_CACHE_TOKENS = {
+    "gemini-1.5": 32768,
+    "gemini-2.0-flash": 4096,
+}
+DEFAULT_MIN_CACHE_TOKENS = 32768
+# How long to wait before trying again to cache a prefix after a transient error
+RETRY_AFTER_S = 60
+
+
+def prompt_version(name):
+    """Version of a registered prompt: changes whenever its system or instruction text does."""
+    spec = PROMPTS[name]
+    digest = hashlib.sha256(f"{spec['system']}\0{spec['instruction']}".encode("utf-8")).hexdigest()
+    return f"{name}-{digest[:12]}"
+
+
+def prompt_tokens(name):
+    spec = PROMPTS[name]
+    return estimate_tokens(spec["system"]) + estimate_tokens(spec["instruction"])
+
+
+def min_cache_tokens(model_name, table=MIN_CACHE_TOKENS):
+    """Minimum size in tokens of a cached content on ``model_name``."""
+    name = (model_name or "").split("/")[-1]
+    matches = [prefix for prefix in table if name.startswith(prefix)]
+    return table[max(matches, key=len)] if matches else DEFAULT_MIN_CACHE_TOKENS
+
+
+def configured_ttl_s():
+    """Prefix TTL for the apps and live calls: CURATEAI_PROMPT_CACHE_TTL seconds, 0 (off) by default."""
+    return float(os.environ.get("CURATEAI_PROMPT_CACHE_TTL") or 0)
+
+
+def _caching(genai):
+    caching = getattr(genai, "caching", None)
+    if caching is None:
+        from google.generativeai import caching
+    return caching
+
+
+def _count(event):
+    REGISTRY.inc("curateai_prompt_cache_total", help="Cached prompt prefix events.", event=event)
+
+
+def _cache_missing(exc):
+    """True when a cached content was deleted or expired on the provider side."""
+    status = getattr(exc, "status_code", None) or getattr(exc, "code", None)
+    return type(exc).__name__ in ("NotFound", "PermissionDenied") or status in (403, 404)
+
+
+class PromptCache:
+    """Registered prompt prefixes per (prompt, model), created on first use and refreshed before expiry.
+
+    Thread-safe; shared by every model wrapped with ``wrap``. ``ttl_s`` is the
+    lifetime requested from the provider (0 turns caching off), and the TTL is
+    extended when less than ``refresh_margin_s`` of it is left. Prefixes
+    smaller than the model's ``min_cache_tokens`` are never registered.
+    """
+
+    def __init__(self, genai, ttl_s=DEFAULT_TTL_S, refresh_margin_s=None):
+        self.genai = genai
+        self.ttl_s = ttl_s
+        self.refresh_margin_s = refresh_margin_s if refresh_margin_s is not None else min(300, ttl_s / 4)
+        self._entries = {}
+        self._skip_until = {}
+        self._errors = {}
+        self._pending = {}
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def wrap(self, model, system_instruction):
+        """Wraps a ``GenerativeModel`` built with ``system_instruction`` so it uses the cached prefixes."""
+        if not self.ttl_s:
+            return model
+        return CachedPromptModel(model, system_instruction, self)
+
+    def cached_model(self, name, model_name):
+        """The model bound to the cached prefix of prompt ``name``, or None to send the prompt in full.
+
+        Creating or refreshing a prefix happens outside the lock; concurrent
+        callers for the same prefix wait for that one request (or keep using
+        the current prefix while it is still valid).
+        """
+        key = (name, model_name)
+        while True:
+            now = time.time()
+            with self._lock:
+                if self._closed or self._skip_until.get(key, 0) > now:
+                    return None
+                tokens, minimum = prompt_tokens(name), min_cache_tokens(model_name)
+                if tokens < minimum:
+                    # Gemini would refuse it; don't spend a request finding out
+                    self._errors[key] = f"prefix of ~{tokens} tokens is below the {minimum}-token minimum of {model_name}"
+                    self._skip_until[key] = float("inf")
+                    _count("too_small")
+                    return None
+                entry = self._entries.get(key)
+                if entry is not None and entry["expires_at"] <= now:
+                    entry = None
+                if entry is not None and entry["expires_at"] >= now + self.refresh_margin_s:
+                    return entry["model"]
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = threading.Event()
+                    break
+                if entry is not None:
+                    return entry["model"]
+            pending.wait()
+        try:
+            return self._renew(key, entry)
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+            pending.set()
+
+    def _renew(self, key, entry):
+        """Extends ``entry``, or registers the prefix again; returns its model or None."""
+        name, model_name = key
+        if entry is not None:
+            try:
+                entry["cache"].update(ttl=timedelta(seconds=self.ttl_s))
+                with self._lock:
+                    entry["expires_at"] = time.time() + self.ttl_s
+                _count("refreshed")
+                return entry["model"]
+            except Exception:
+                # Deleted on the provider side: register it again below
+                pass
+        try:
+            entry = self._create(name, model_name)
+        except Exception as exc:
+            # Too small for the model's minimum or caching unsupported: sent in full from now
+            # on; transient errors are retried after RETRY_AFTER_S
+            with self._lock:
+                self._entries.pop(key, None)
+                self._errors[key] = f"{type(exc).__name__}: {exc}"
+                self._skip_until[key] = time.time() + RETRY_AFTER_S if is_retryable(exc) else float("inf")
+            _count("failed")
+            return None
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._entries[key] = entry
+        if closed:
+            # close() ran while this prefix was being created
+            try:
+                entry["cache"].delete()
+            except Exception:
+                pass
+            return None
+        _count("created")
+        return entry["model"]
+
+    def _create(self, name, model_name):
+        spec = PROMPTS[name]
+        cache = _caching(self.genai).CachedContent.create(
+            model=model_name,
+            display_name=prompt_version(name),
+            system_instruction=spec["system"],
+            contents=[spec["instruction"]],
+            ttl=timedelta(seconds=self.ttl_s),
+        )
+        return {
+            "cache": cache,
+            "model": self.genai.GenerativeModel.from_cached_content(cached_content=cache),
+            "expires_at": time.time() + self.ttl_s,
+        }
+
+    def invalidate(self, name, model_name):
+        with self._lock:
+            self._entries.pop((name, model_name), None)
+
+    def report(self):
+        """One row per prompt and model that was looked up: version, cached tokens and status."""
+        now = time.time()
+        with self._lock:
+            keys = sorted(set(self._entries) | set(self._errors))
+            rows = []
+            for name, model_name in keys:
+                entry = self._entries.get((name, model_name))
+                usage = getattr(entry["cache"], "usage_metadata", None) if entry else None
+                rows.append({
+                    "prompt": name,
+                    "version": prompt_version(name),
+                    "model": model_name,
+                    "cached": entry is not None,
+                    "cached_tokens": getattr(usage, "total_token_count", None),
+                    "expires_in_s": round(entry["expires_at"] - now) if entry else None,
+                    "error": None if entry else self._errors.get((name, model_name)),
+                })
+        return rows
+
+    def close(self):
+        """Deletes the cached prefixes (they are billed for storage until their TTL ends)."""
+        with self._lock:
+            self._closed = True
+            entries, self._entries = list(self._entries.values()), {}
+        for entry in entries:
+            try:
+                entry["cache"].delete()
+            except Exception:
+                pass
+
+
+class CachedPromptModel:
+    """A ``GenerativeModel`` whose requests reference a cached prefix when they contain a registered prompt.
+
+    ``model_name`` is unchanged, so result cache keys stay the same. Requests
+    without a registered prompt (e.g. part summaries) go to the plain model.
+    """
+
+    def __init__(self, model, system_instruction, prompt_cache):
+        self.model = model
+        self.model_name = model.model_name
+        self.prompt_cache = prompt_cache
+        self._prompts = {
+            spec["instruction"]: name for name, spec in PROMPTS.items() if spec["system"] == system_instruction
+        }
+
+    def generate_content(self, contents, **kwargs):
+        contents = contents if isinstance(contents, list) else [contents]
+        name = next((self._prompts[part] for part in contents if isinstance(part, str) and part in self._prompts), None)
+        cached_model = self.prompt_cache.cached_model(name, self.model_name) if name else None
+        if cached_model is None:
+            return self.model.generate_content(contents, **kwargs)
+        instruction = PROMPTS[name]["instruction"]
+        rest = [part for part in contents if not (isinstance(part, str) and part == instruction)]
+        try:
+            response = cached_model.generate_content(rest, **kwargs)
+        except Exception as exc:
+            if not _cache_missing(exc):
+                raise
+            # Deleted or expired early on the provider side: send in full, re-cache next time
+            self.prompt_cache.invalidate(name, self.model_name)
+            return self.model.generate_content(contents, **kwargs)
+        _count("used")
+        return response
+
+
+if __name__ == "__main__":
+    for name in PROMPTS:
+        print(f"{prompt_version(name):<32}~{prompt_tokens(name)} tokens")
+    for prefix, minimum in MIN_CACHE_TOKENS.items():
+        print(f"{prefix + '*':<32}caches prefixes of {minimum}+ tokens")
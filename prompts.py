@@ -0,0 +1,205 @@
+# Prompts and generation settings shared by the Streamlit apps and the batch pipeline
+
+from schemas import TRANSCRIPT_SCHEMA, JUDGMENT_SCHEMA, ANALYSIS_SCHEMA
+
+# Common generation configuration
+generation_config = {
+    "temperature": 0.3,
+    "response_mime_type": "application/json"
+}
+
+# Per-stage configurations that also constrain Gemini's answer to the schema
+transcript_generation_config = dict(generation_config, response_schema=TRANSCRIPT_SCHEMA)
+analysis_generation_config = dict(generation_config, response_schema=ANALYSIS_SCHEMA)
+judgment_generation_config = dict(generation_config, response_schema=JUDGMENT_SCHEMA)
+
+# Prompts for the models
+Prompt_for_audio_transcript = '''
+You are an advanced AI assistant specialized in audio processing, speaker diarization, and emotion detection. Your expertise lies in analyzing audio files, identifying speakers, transcribing conversations, and detecting emotions in real-time. Your task is to process an audio file from a call center and provide a detailed, structured output in JSON format.
+Task:
+
+Number of Speakers: Identify and state the total number of unique speakers in the audio file.
+
+Transcript with Speaker Labels: Generate a clear and accurate transcript of the audio, labeling each segment of speech with the corresponding speaker (e.g.Agent,Client etc). Use proper punctuation and formatting for readability.
+
+Emotion Detection: For each speaker at every point in the conversation, detect and note their emotion (e.g., happy, sad, angry, neutral, frustrated, etc.). Provide a timeline of emotions in JSON format.
+
+Guidelines:
+- Use clear, concise, and professional language.
+-Ensure the transcript is accurate and easy to read.
+-If a speaker cannot be identified, label them as "Unknown."
+-Emotions should be detected for each speaker at every conversational turn.
+-For each turn, give the time in the audio where it begins as "Start" in MM:SS format.
+-Follow the JSON output format strictly.
+
+Output Format:
+Provide the output in the following JSON structure:
+{
+  "Call Details": {
+    "Number of Speakers": "<total_number_of_speakers>",
+    "Transcript": [
+      {
+        "Speaker": "<Agent/client/Unknown>",
+        "Voice": "<extracted_text_from_audio>",
+        "Emotion": "<detected_emotion>",
+        "Start": "<MM:SS>"
+      },
+      {
+        "Speaker": "<Agent/client/Unknown>",
+        "Voice": "<extracted_text_from_audio>",
+        "Emotion": "<detected_emotion>",
+        "Start": "<MM:SS>"
+      },
+      ...
+    ]
+  }
+}
+Example Output:
+{
+  "Call Details": {
+    "Number of Speakers": 2,
+    "Transcript": [
+      {
+        "Speaker": "Agent",
+        "Voice": "Hello, how can I assist you today?",
+        "Emotion": "neutral",
+        "Start": "00:00"
+      },
+      {
+        "Speaker": "Client",
+        "Voice": "I’m having issues with my recent order.",
+        "Emotion": "frustrated",
+        "Start": "00:04"
+      },
+      {
+        "Speaker": "Agent",
+        "Voice": "I’m sorry to hear that. Can you provide your order number?",
+        "Emotion": "neutral",
+        "Start": "00:09"
+      },
+      ...
+    ]
+  }
+}
+'''
+
+system_prompt_audio = '''You are a highly skilled AI assistant with a deep understanding of audio analysis, natural language processing, and emotional intelligence. You are meticulous, detail-oriented, and committed to delivering accurate and structured results. Your goal is to provide a comprehensive analysis of the call center audio, ensuring the transcript is clear, emotions are accurately detected, and the output is well-organized for further use.'''
+
+system_prompt_json = '''You are an AI trained in analyzing customer service call transcripts. Your expertise lies in emotion detection, summarization, and extracting key insights from conversations. You are meticulous, detail-oriented, and capable of providing structured outputs in JSON format.'''
+prompt_transcript_to_output = '''
+Analyze the provided JSON input, which contains a customer service call transcript with emotion labels for each speaker. Extract the following details and present them in a structured JSON format:
+	1- Emotion Tracking of Clients: A list of emotions expressed by the client (Speaker B) throughout the conversation.
+	2-Emotion Tracking of Agents: A list of emotions expressed by the agent (Speaker A) throughout the conversation.
+	3-Important Words Used in the Conversation: A list of key words or phrases that are significant to the conversation (e.g., billing, late fee, card expired, etc.).
+	4-Questions Asked by the Customer:ANALYSE THIS CAREFULLY.THIS SHOULD INCLUDE WHY A CLIENT CALLED CUSTOMER SERVICE.Donot just copy paste client exact conversation word.Use proper sentence to explain in points why client called the customer care.
+	5-Resolutions Given by the Agent: A list of resolutions or actions taken by the agent to address the client's concerns.
+ 	6-Suggestions For Agents:Analyse carefully what the customer asks and what are the response given by the agent.Then decide what better we can suggest the Agent to improve.
+	7-Important Conclusion and Summary of Conversation: A concise summary of the conversation, including the main issue, resolution, and any additional actions taken.
+ 	8-Entity Detection:A list of entity detected in the provided transcript (Carefully analyse this to find out the entities correctly),Most probable entities are Organisation,Person,Email address,Location,Duration
+	9-Client Satisfaction: A boolean value (true or false) indicating whether the client seemed satisfied with the agent's response based on their emotions and statements.
+	
+Input:
+The JSON input provided contains the call transcript with speaker labels, their statements, and emotion labels.
+
+Output Format:
+Your output must be in JSON format, structured as follows:
+{
+  "Emotion Tracking of Clients": ["emotion1", "emotion2", ...],
+  "Emotion Tracking of Agents": ["emotion1", "emotion2", ...],
+  "Important Words Used in the Conversation": ["word1", "word2", ...],
+  "Questions Asked by the Customer": ["question1", "question2", ...],
+  "Resolutions Given by the Agent": ["resolution1", "resolution2", ...],
+  "Suggestion For the Agent": ["Suggestion1", "Suggestion2", ...],
+  "Important Conclusion and Summary of Conversation": "summary text",
+  "Entities Detected": {"Organization": ["..."], "Person": ["..."], "Location": ["..."], "Email address": ["..."], "Duration": ["..."]},
+  "Client Satisfaction": true/false
+}
+
+Example Output:
+Here’s an example of how the output should look:
+{
+  "Emotion Tracking of Clients": ["confused", "concerned", "neutral", "slightly-regretful", "relieved", "hopeful", "neutral", "grateful"],
+  "Emotion Tracking of Agents": ["neutral", "sympathetic", "neutral", "neutral", "neutral", "neutral", "neutral", "neutral"],
+  "Important Words Used in the Conversation": ["billing statement", "late fee", "card expired", "waive", "adjustment", "coverage", "savings"],
+  "Questions Asked by the Customer": [
+    "The client called  because his latest billing statement seems higher than usual, and he don't understand why.",
+    "Would you be open to a quick review?"
+  ],
+  "Resolutions Given by the Agent": [
+    "Waived the late fee as a courtesy.",
+    "Updated the client's payment method to avoid future issues.",
+    "Offered to review the client's current plan for potential savings."
+  ],
+  "Suggestion For the Agent": ["Offer multiple options to cut the cost for the client."],
+  "Important Conclusion and Summary of Conversation": "The client called regarding an unexpectedly high billing statement due to a late fee. The agent identified the issue as a result of an expired card and waived the late fee. The agent also updated the client's payment details and offered to review their current plan for potential savings. The client expressed relief and gratitude.",
+  "Entities Detected": {
+    "Organization": ["Newco", "General"],
+    "Person": ["Allison", "B. Ben Hur"],
+    "Location": ["4741 Pick Street, Fort Morgan, Colorado 80701"],
+    "Email address": ["adam.turner@mail.com"]
+  },
+  "Client Satisfaction": true
+}
+
+Instructions:
+	- Carefully analyze the JSON input to extract the required details.
+	- Ensure the output is well-structured and adheres to the provided JSON format.
+	- Focus on accuracy in emotion tracking, key phrase extraction, and summarization.
+	- Use the client's final emotions and statements to determine satisfaction.
+'''
+
+# Map step for transcripts too long for a single stage-2 request
+prompt_summarize_part = '''
+Summarize this part of a customer service call transcript in a few sentences. Keep every customer question or request, every resolution or action by the agent, and every key word or phrase (billing, late fee, card expired, etc.). List every entity mentioned (organisation, person, email address, location, duration) exactly as spoken. Output plain text only.
+'''
+
+# Stage 2 when emotion tracking, key words, emails, phone numbers and durations
+# are extracted locally (local_extraction.py): only the judgment fields are asked for
+prompt_transcript_to_judgment = '''
+Analyze the provided call transcript, which contains a customer service call with speaker labels and emotion labels for each turn. Extract the following details and present them in a structured JSON format:
+	1-Questions Asked by the Customer:ANALYSE THIS CAREFULLY.THIS SHOULD INCLUDE WHY A CLIENT CALLED CUSTOMER SERVICE.Donot just copy paste client exact conversation word.Use proper sentence to explain in points why client called the customer care.
+	2-Resolutions Given by the Agent: A list of resolutions or actions taken by the agent to address the client's concerns.
+	3-Suggestions For Agents:Analyse carefully what the customer asks and what are the response given by the agent.Then decide what better we can suggest the Agent to improve.
+	4-Important Conclusion and Summary of Conversation: A concise summary of the conversation, including the main issue, resolution, and any additional actions taken.
+	5-Entity Detection:The organisations, persons and locations mentioned in the transcript (Carefully analyse this to find out the entities correctly).
+	6-Client Satisfaction: A boolean value (true or false) indicating whether the client seemed satisfied with the agent's response based on their emotions and statements.
+
+Output Format:
+Your output must be valid JSON, structured as follows:
+{
+  "Questions Asked by the Customer": ["question1", "question2", ...],
+  "Resolutions Given by the Agent": ["resolution1", "resolution2", ...],
+  "Suggestion For the Agent": ["Suggestion1", "Suggestion2", ...],
+  "Important Conclusion and Summary of Conversation": "summary text",
+  "Entities Detected": {"Organization": ["..."], "Person": ["..."], "Location": ["..."]},
+  "Client Satisfaction": true/false
+}
+
+Instructions:
+	- Carefully analyze the transcript to extract the required details.
+	- Ensure the output is well-structured and adheres to the provided JSON format.
+	- Use the client's final emotions and statements to determine satisfaction.
+'''
+
+# Live calls (live_analysis.py): the judgment fields are updated from the previous
+# answer and the turns spoken since, instead of re-reading the whole call
+prompt_update_judgment = '''
+You are monitoring a customer service call that is still in progress. You are given the analysis of the call so far ("Previous Analysis", empty at the start of the call) and the newest part of the transcript, with speaker and emotion labels for each turn. Update the analysis so it covers the whole call up to now:
+	1-Questions Asked by the Customer: Keep the earlier questions and add any new reasons the client gives for calling, in your own words.
+	2-Resolutions Given by the Agent: Keep the earlier resolutions and add new ones.
+	3-Suggestion For the Agent: What the agent could do better from here on.
+	4-Important Conclusion and Summary of Conversation: A concise summary of the whole call so far.
+	5-Entities Detected: The organisations, persons and locations mentioned so far.
+	6-Client Satisfaction: true or false, based on the client's latest emotions and statements.
+
+Output Format:
+Your output must be valid JSON, structured as follows:
+{
+  "Questions Asked by the Customer": ["question1", "question2", ...],
+  "Resolutions Given by the Agent": ["resolution1", "resolution2", ...],
+  "Suggestion For the Agent": ["Suggestion1", "Suggestion2", ...],
+  "Important Conclusion and Summary of Conversation": "summary text",
+  "Entities Detected": {"Organization": ["..."], "Person": ["..."], "Location": ["..."]},
+  "Client Satisfaction": true/false
+}
+'''
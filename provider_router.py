@@ -0,0 +1,255 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from metrics import REGISTRY, in_current_context
+from pipeline import GROQ_MODEL, analyze_with_gemini, analyze_with_groq
+from json_repair import is_recoverable
+
+# Exception class names (google.api_core, groq/openai, requests) worth retrying
+RETRYABLE_ERRORS = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+    "DeadlineExceeded", "GatewayTimeout", "RateLimitError", "APITimeoutError", "APIConnectionError",
+    "Timeout", "ReadTimeout", "ConnectTimeout", "ConnectionError", "TimeoutError", "InvalidResponse",
+}
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class InvalidResponse(RuntimeError):
+    """The provider answered, but not with JSON that could be repaired."""
+
+
+class AllProvidersFailed(RuntimeError):
+    pass
+
+
+def is_retryable(exc):
+    """True for rate limits, timeouts, server errors and malformed answers."""
+    if type(exc).__name__ in RETRYABLE_ERRORS:
+        return True
+    status = getattr(exc, "status_code", None) or getattr(exc, "code", None)
+    return isinstance(status, int) and status in RETRYABLE_STATUS_CODES
+
+
+class RetryPolicy:
+    """Per-attempt deadline, overall deadline and jittered exponential backoff."""
+
+    def __init__(self, max_attempts=3, attempt_timeout_s=60, deadline_s=150, base_delay_s=0.5, max_delay_s=8):
+        self.max_attempts = max_attempts
+        self.attempt_timeout_s = attempt_timeout_s
+        self.deadline_s = deadline_s
+        self.base_delay_s = base_delay_s
+        self.max_delay_s = max_delay_s
+
+    def backoff(self, attempt):
+        """Full-jitter delay: random up to the exponential cap, so retries don't bunch up."""
+        return random.uniform(0, min(self.max_delay_s, self.base_delay_s * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Stops sending requests to a provider after repeated failures.
+
+    After ``failure_threshold`` consecutive failures the breaker opens for
+    ``reset_timeout_s``; then a single probe request is let through and its
+    outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout_s=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout_s = reset_timeout_s
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def available(self):
+        """True if a request could be sent now (does not take the half-open probe)."""
+        with self._lock:
+            if self.state == "open":
+                return time.monotonic() - self._opened_at >= self.reset_timeout_s
+            return self.state == "closed"
+
+    def allow(self):
+        """True if a request may be sent now; takes the probe slot when half-open."""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout_s:
+                self.state = "half_open"
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Recent successful (uncached) request latencies, used to decide when to hedge."""
+
+    def __init__(self, window=200, min_samples=20, default_s=15.0, floor_s=1.0):
+        self.min_samples = min_samples
+        self.default_s = default_s
+        self.floor_s = floor_s
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def p95(self):
+        """Returns the 95th percentile latency, or ``default_s`` until enough samples exist."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < self.min_samples:
+            return self.default_s
+        return max(self.floor_s, samples[min(len(samples) - 1, int(0.95 * len(samples)))])
+
+
+class Provider:
+    """One stage-2 backend: ``call(transcript_json, timeout, report)`` returns ``(text, cached)``."""
+
+    def __init__(self, name, call, breaker=None, latency=None):
+        self.name = name
+        self.call = call
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = latency or LatencyTracker()
+
+
+class ProviderRouter:
+    """Routes the detailed analysis across providers with retries, failover and hedging.
+
+    The first provider whose circuit breaker is closed is the primary. With
+    ``hedge``, if the primary has not answered within its p95 latency the
+    next provider is asked as well and the first valid answer wins; without
+    it, the next provider is only tried once the primary has given up.
+    A hedged request that loses still finishes in the background, and its
+    answer lands in the result cache.
+    """
+
+    def __init__(self, providers, policy=None, hedge=True, max_workers=16):
+        self.providers = providers
+        self.policy = policy or RetryPolicy()
+        self.hedge = hedge
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis-router")
+
+    def _attempts(self, provider, transcript_json, report, deadline):
+        for attempt in range(self.policy.max_attempts):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"{provider.name}: deadline exceeded")
+            if not provider.breaker.allow():
+                raise AllProvidersFailed(f"{provider.name}: circuit breaker open")
+            started = time.monotonic()
+            try:
+                text, cached = provider.call(transcript_json, min(self.policy.attempt_timeout_s, remaining), report)
+                if not is_recoverable(text):
+                    raise InvalidResponse(f"{provider.name} returned an answer that is not (repairable) JSON")
+            except Exception as exc:
+                provider.breaker.record_failure()
+                REGISTRY.inc("curateai_router_attempts_total", help="Stage-2 attempts per provider.",
+                             provider=provider.name, outcome="error")
+                delay = self.policy.backoff(attempt)
+                if attempt + 1 >= self.policy.max_attempts or not is_retryable(exc):
+                    raise
+                if time.monotonic() + delay >= deadline:
+                    raise
+                time.sleep(delay)
+                continue
+            provider.breaker.record_success()
+            REGISTRY.inc("curateai_router_attempts_total", help="Stage-2 attempts per provider.",
+                         provider=provider.name, outcome="cached" if cached else "ok")
+            if not cached:
+                provider.latency.add(time.monotonic() - started)
+            return text, cached
+
+    def analyze(self, transcript_json, report=None):
+        """Returns ``(response_text, cached)`` from the first provider that answers.
+
+        If ``report`` is a dict it receives the winner's compaction report plus
+        ``provider`` and ``hedged``. Raises AllProvidersFailed when every
+        provider failed, was skipped by its breaker, or ran past the deadline.
+        """
+        deadline = time.monotonic() + self.policy.deadline_s
+        candidates = [provider for provider in self.providers if provider.breaker.available()]
+        if not candidates:
+            raise AllProvidersFailed("every provider's circuit breaker is open")
+
+        pending = {}
+        errors = []
+
+        def launch(provider):
+            attempt_report = {}
+            future = self._executor.submit(
+                in_current_context(self._attempts), provider, transcript_json, attempt_report, deadline
+            )
+            pending[future] = (provider, attempt_report)
+
+        primary = candidates.pop(0)
+        launch(primary)
+        hedge_at = time.monotonic() + primary.latency.p95() if self.hedge and candidates else None
+        hedged = False
+
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            timeout = deadline - now
+            if hedge_at is not None:
+                timeout = min(timeout, max(0.0, hedge_at - now))
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                if hedge_at is not None and time.monotonic() >= hedge_at:
+                    # The primary is slower than usual: ask the next provider too
+                    hedge_at, hedged = None, True
+                    REGISTRY.inc("curateai_router_hedges_total", help="Hedged stage-2 requests.")
+                    launch(candidates.pop(0))
+                continue
+            for future in done:
+                provider, attempt_report = pending.pop(future)
+                try:
+                    text, cached = future.result()
+                except Exception as exc:
+                    errors.append(f"{provider.name}: {type(exc).__name__}: {exc}")
+                    continue
+                if report is not None:
+                    report.update(attempt_report, provider=provider.name, hedged=hedged)
+                return text, cached
+            # Everything running so far failed: fail over to the next provider
+            if not pending and candidates:
+                hedge_at = None
+                launch(candidates.pop(0))
+
+        if pending:
+            errors.append(f"deadline of {self.policy.deadline_s}s exceeded")
+        raise AllProvidersFailed("; ".join(errors))
+
+
+def build_analysis_router(model_json=None, groq_client=None, primary="gemini", result_cache=None,
+                          gemini_limiter=None, groq_limiter=None, groq_model=GROQ_MODEL, hedge=True, policy=None,
+                          max_workers=16):
+    """Builds a router over whichever stage-2 backends are configured, ``primary`` first."""
+    providers = []
+    if model_json is not None:
+        providers.append(Provider("gemini", lambda transcript_json, timeout, report: analyze_with_gemini(
+            model_json, transcript_json, result_cache, gemini_limiter, report=report, timeout=timeout
+        )))
+    if groq_client is not None:
+        providers.append(Provider("groq", lambda transcript_json, timeout, report: analyze_with_groq(
+            groq_client, transcript_json, result_cache, groq_model, groq_limiter, report=report, timeout=timeout
+        )))
+    if not providers:
+        raise ValueError("at least one of model_json or groq_client is required")
+    providers.sort(key=lambda provider: provider.name != primary)
+    return ProviderRouter(providers, policy, hedge, max_workers)
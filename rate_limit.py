@@ -0,0 +1,69 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket used to stay under a provider's request quota.
+
+    ``rate`` is the number of tokens added per second and ``capacity`` the
+    largest burst allowed. A rate of None or 0 disables limiting.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1, rate or 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, requests_per_minute, capacity=None):
+        if not requests_per_minute:
+            return cls(None, capacity)
+        return cls(requests_per_minute / 60.0, capacity)
+
+    def _refill(self, now):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens=1):
+        """Blocks until ``tokens`` are available and takes them."""
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class ProviderLimiter:
+    """Caps both the concurrency and the request rate for one provider.
+
+    Use it as a context manager around each request:
+
+        with limiter:
+            model.generate_content(...)
+    """
+
+    def __init__(self, name, max_concurrency, requests_per_minute=None):
+        self.name = name
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._bucket = TokenBucket.per_minute(requests_per_minute)
+
+    def __enter__(self):
+        self._semaphore.acquire()
+        try:
+            self._bucket.acquire()
+        except BaseException:
+            self._semaphore.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._semaphore.release()
+        return False
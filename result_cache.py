@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+DEFAULT_CACHE_PATH = os.environ.get("RESULT_CACHE_PATH", os.path.join(".cache", "results.sqlite3"))
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def make_key(**parts):
+    """Builds a cache key from everything that influences a model response.
+
+    Typical parts are the audio/transcript hash, model name, prompt text,
+    system instruction and generation config. Any change to one of them
+    produces a different key, so stale entries are simply never read again.
+    """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_json(text):
+    """Returns True if ``text`` parses as JSON; used to avoid caching bad output."""
+    try:
+        json.loads(text)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+class ResultCache:
+    """Size-bounded LRU cache of model responses stored in SQLite.
+
+    Every operation opens its own connection, and the database runs in WAL
+    mode, so several Streamlit sessions (threads or processes) can read and
+    write the same file at once.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    stage TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_results_last_access ON results (last_access)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def get(self, key):
+        """Returns the cached text for ``key`` or None."""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE results SET last_access = ? WHERE key = ?", (time.time(), key))
+        with self._lock:
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return None if row is None else row[0]
+
+    def put(self, key, value, stage=""):
+        """Stores ``value`` under ``key`` and evicts LRU entries over the size limit."""
+        size = len(value.encode("utf-8"))
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, stage, value, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, stage, value, size, now, now),
+            )
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            if total > self.max_bytes:
+                rows = conn.execute("SELECT key, size FROM results ORDER BY last_access ASC").fetchall()
+                for old_key, old_size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    if old_key == key:
+                        continue
+                    conn.execute("DELETE FROM results WHERE key = ?", (old_key,))
+                    total -= old_size
+            conn.execute("COMMIT")
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def get_or_compute(self, key, compute, stage="", validate=None):
+        """Returns the cached text for ``key``, calling ``compute()`` on a miss.
+
+        ``compute`` must return the response text. When ``validate`` is given,
+        only values for which it returns True are stored, so malformed model
+        output is retried on the next request instead of being cached. The
+        boolean in the returned tuple tells whether the value came from the cache.
+        """
+        value = self.get(key)
+        if value is not None:
+            return value, True
+        value = compute()
+        if validate is None or validate(value):
+            self.put(key, value, stage=stage)
+        return value, False
+
+    def stats(self):
+        """Returns hit/miss counters for this process and the on-disk size."""
+        with closing(self._connect()) as conn:
+            entries, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        with self._lock:
+            return {"entries": entries, "bytes": total, "hits": self.hits, "misses": self.misses}
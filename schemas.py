@@ -0,0 +1,118 @@
+# Response schemas for both stages, in the OpenAPI subset accepted by Gemini's
+# ``response_schema``. The same dicts are used to check answers locally.
+
+STRING = {"type": "string"}
+STRING_LIST = {"type": "array", "items": STRING}
+
+TURN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "Speaker": STRING,
+        "Voice": STRING,
+        "Emotion": STRING,
+        # "MM:SS" where the turn begins; optional so older cached answers still validate
+        "Start": STRING,
+    },
+    "required": ["Speaker", "Voice", "Emotion"],
+}
+
+TRANSCRIPT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "Call Details": {
+            "type": "object",
+            "properties": {
+                "Number of Speakers": {"type": "integer"},
+                "Transcript": {"type": "array", "items": TURN_SCHEMA},
+            },
+            "required": ["Number of Speakers", "Transcript"],
+        },
+    },
+    "required": ["Call Details"],
+}
+
+# Fields of prompt_transcript_to_judgment (the rest are extracted locally)
+JUDGMENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "Questions Asked by the Customer": STRING_LIST,
+        "Resolutions Given by the Agent": STRING_LIST,
+        "Suggestion For the Agent": STRING_LIST,
+        "Important Conclusion and Summary of Conversation": STRING,
+        "Entities Detected": {
+            "type": "object",
+            "properties": {
+                "Organization": STRING_LIST,
+                "Person": STRING_LIST,
+                "Location": STRING_LIST,
+            },
+        },
+        "Client Satisfaction": {"type": "boolean"},
+    },
+    "required": [
+        "Questions Asked by the Customer",
+        "Resolutions Given by the Agent",
+        "Suggestion For the Agent",
+        "Important Conclusion and Summary of Conversation",
+        "Entities Detected",
+        "Client Satisfaction",
+    ],
+}
+
+# Full answer of prompt_transcript_to_output (and of the merged local + judgment result)
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "Emotion Tracking of Clients": STRING_LIST,
+        "Emotion Tracking of Agents": STRING_LIST,
+        "Important Words Used in the Conversation": STRING_LIST,
+        **JUDGMENT_SCHEMA["properties"],
+        "Entities Detected": {
+            "type": "object",
+            "properties": {
+                "Organization": STRING_LIST,
+                "Person": STRING_LIST,
+                "Location": STRING_LIST,
+                "Email address": STRING_LIST,
+                "Phone number": STRING_LIST,
+                "Duration": STRING_LIST,
+            },
+        },
+    },
+    "required": [
+        "Emotion Tracking of Clients",
+        "Emotion Tracking of Agents",
+        "Important Words Used in the Conversation",
+        *JUDGMENT_SCHEMA["required"],
+    ],
+}
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+}
+
+
+def schema_errors(value, schema, path="$"):
+    """Returns the places where ``value`` does not match ``schema`` (empty if it matches)."""
+    expected = schema.get("type")
+    if expected and not isinstance(value, _TYPES[expected]):
+        return [f"{path}: expected {expected}, got {type(value).__name__}"]
+    if expected in ("integer", "number") and isinstance(value, bool):
+        return [f"{path}: expected {expected}, got bool"]
+    errors = []
+    if expected == "object":
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"{path}: missing {key!r}")
+        for key, subschema in schema.get("properties", {}).items():
+            if key in value:
+                errors.extend(schema_errors(value[key], subschema, f"{path}.{key}"))
+    elif expected == "array" and "items" in schema:
+        for index, item in enumerate(value):
+            errors.extend(schema_errors(item, schema["items"], f"{path}[{index}]"))
+    return errors
@@ -0,0 +1,47 @@
+import time
+
+from prompts import transcript_generation_config, Prompt_for_audio_transcript
+from pipeline import transcript_cache_key
+from json_repair import TranscriptStreamParser, is_cacheable
+from metrics import span, record_usage
+
+
+def stream_transcript(model_audio, audio_file, audio_hash, result_cache=None, on_turn=None):
+    """Stage 1 with a streamed response; calls ``on_turn(turn)`` for each finished turn.
+
+    Returns ``(response_text, cached, time_to_first_turn)``. On a cache hit the
+    turns are replayed from the cached text and no request is made.
+    """
+    key = transcript_cache_key(model_audio, audio_hash)
+    started = time.perf_counter()
+    time_to_first_turn = None
+    parser = TranscriptStreamParser()
+
+    with span("transcript", model=model_audio.model_name, streamed=True) as stage_span:
+        cached_text = result_cache.get(key) if result_cache is not None else None
+        if cached_text is not None:
+            chunks = [cached_text]
+        else:
+            response = model_audio.generate_content(
+                [audio_file, Prompt_for_audio_transcript],
+                generation_config=transcript_generation_config,
+                stream=True,
+            )
+            chunks = (chunk.text for chunk in response)
+        stage_span["cache"] = "off" if result_cache is None else ("hit" if cached_text is not None else "miss")
+
+        for chunk in chunks:
+            for turn in parser.feed(chunk):
+                if time_to_first_turn is None:
+                    time_to_first_turn = time.perf_counter() - started
+                if on_turn is not None:
+                    on_turn(turn)
+        if cached_text is None:
+            # The usage totals arrive with the final chunk
+            record_usage(response)
+        stage_span["first_turn_s"] = time_to_first_turn
+
+    response_text = parser.text
+    if cached_text is None and result_cache is not None and is_cacheable(response_text, "transcript"):
+        result_cache.put(key, response_text, stage="transcript")
+    return response_text, cached_text is not None, time_to_first_turn
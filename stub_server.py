@@ -0,0 +1,435 @@
+"""Local stand-in for the Gemini and Groq APIs, for offline tests and benchmarks.
+
+Replays recorded responses from a fixtures directory (one JSON list of
+response texts per stage: transcript, judgment, analysis, summary) with a
+configurable latency, error and truncation profile. Transcripts are
+stretched to the length of the uploaded audio, so longer calls produce
+proportionally longer transcripts. Cached contents (prompt prefixes) are
+kept until their TTL, and their tokens are reported as cached and skip the
+prefill delay. Streamed requests get their answer in chunks. Point the code
+at it with ``CURATEAI_BACKEND=stub`` (see ``backends.py``).
+
+    python stub_server.py --profile realistic
+    python stub_server.py import-cache .cache/results.sqlite3
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import closing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from prompts import (
+    Prompt_for_audio_transcript,
+    prompt_summarize_part,
+    prompt_transcript_to_judgment,
+    prompt_transcript_to_output,
+    prompt_update_judgment,
+)
+from prompt_registry import MIN_CACHE_TOKENS, min_cache_tokens
+from schemas import ANALYSIS_SCHEMA, JUDGMENT_SCHEMA, TRANSCRIPT_SCHEMA, schema_errors
+from transcript_codec import estimate_tokens
+
+DEFAULT_PORT = 8765
+DEFAULT_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "fixtures")
+STAGES = ["transcript", "judgment", "analysis", "summary"]
+
+# The first token arrives after base_s + jitter + uncached prompt tokens / prefill_tokens_per_s,
+# the rest at chars_per_s; uploads take size / upload_mbps
+# Every profile enforces Gemini's per-model minimum cache size (prompt_registry.MIN_CACHE_TOKENS);
+# "min_cache_tokens" (or --min-cache-tokens) replaces it with a single value
+PROFILES = {
+    "instant": {"base_s": 0.0, "jitter_s": 0.0, "prefill_tokens_per_s": 0, "chars_per_s": 0, "upload_mbps": 0,
+                "error_rate": 0.0, "truncate_rate": 0.0},
+    "fast": {"base_s": 0.2, "jitter_s": 0.1, "prefill_tokens_per_s": 50000, "chars_per_s": 20000, "upload_mbps": 200,
+             "error_rate": 0.0, "truncate_rate": 0.0},
+    "realistic": {"base_s": 1.0, "jitter_s": 0.5, "prefill_tokens_per_s": 8000, "chars_per_s": 2000, "upload_mbps": 20,
+                  "error_rate": 0.02, "truncate_rate": 0.02},
+    "flaky": {"base_s": 1.0, "jitter_s": 2.0, "prefill_tokens_per_s": 8000, "chars_per_s": 2000, "upload_mbps": 20,
+              "error_rate": 0.15, "truncate_rate": 0.1},
+}
+ERROR_CODES = [429, 500, 503]
+# Speech rate used to stretch transcripts, and the bitrate assumed for non-WAV uploads
+TURNS_PER_MINUTE = 12
+COMPRESSED_KBPS = 64
+# Gemini bills audio input at a fixed token rate
+AUDIO_TOKENS_PER_SECOND = 32
+
+_PROMPT_STAGES = [
+    (Prompt_for_audio_transcript, "transcript"),
+    (prompt_transcript_to_judgment, "judgment"),
+    (prompt_update_judgment, "judgment"),
+    (prompt_transcript_to_output, "analysis"),
+    (prompt_summarize_part, "summary"),
+]
+
+
+def detect_stage(text):
+    """Which recorded stage a request is for, from the prompt it contains."""
+    for prompt, stage in _PROMPT_STAGES:
+        if prompt.strip()[:120] in text:
+            return stage
+    return "analysis"
+
+
+def load_fixtures(directory=DEFAULT_FIXTURES):
+    fixtures = {}
+    for stage in STAGES:
+        path = os.path.join(directory, f"{stage}.json")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                fixtures[stage] = json.load(f)
+    return fixtures
+
+
+def stretch_transcript(text, seconds, turns_per_minute=TURNS_PER_MINUTE):
+    """Repeats the recorded turns to match an audio length of ``seconds``."""
+    try:
+        turns = json.loads(text)["Call Details"]["Transcript"]
+    except (ValueError, KeyError, TypeError):
+        return text
+    if not turns or not seconds:
+        return text
+    count = max(2, round(seconds / 60 * turns_per_minute))
+    stretched = []
+    for index in range(count):
+        turn = dict(turns[index % len(turns)])
+        if index >= len(turns):
+            # Keep repeated turns distinct so overlap merging does not fold them together
+            turn["Voice"] = f"{turn.get('Voice', '')} (part {index // len(turns) + 1})"
+        stretched.append(turn)
+    speakers = {turn.get("Speaker") for turn in stretched}
+    return json.dumps({"Call Details": {"Number of Speakers": len(speakers), "Transcript": stretched}}, ensure_ascii=False)
+
+
+class StubState:
+    """Fixtures, fault profile, uploaded files and counters shared by the request handlers."""
+
+    def __init__(self, fixtures, profile, seed=None):
+        self.fixtures = fixtures
+        self.profile = profile
+        self.random = random.Random(seed)
+        self.files = {}
+        self.caches = {}
+        self.lock = threading.Lock()
+        self.counters = {
+            "requests": {}, "errors": 0, "truncated": 0, "bytes_uploaded": 0, "files_deleted": 0,
+            "caches_created": 0, "cached_tokens": 0,
+        }
+        self._next = {stage: 0 for stage in STAGES}
+
+    def count(self, key):
+        with self.lock:
+            self.counters["requests"][key] = self.counters["requests"].get(key, 0) + 1
+
+    def upload(self, data, mime_type, seconds=None):
+        if seconds is None:
+            seconds = len(data) * 8 / (COMPRESSED_KBPS * 1000)
+        name = f"files/{uuid.uuid4().hex[:12]}"
+        with self.lock:
+            self.files[name] = {"bytes": len(data), "seconds": seconds, "mime_type": mime_type}
+            self.counters["bytes_uploaded"] += len(data)
+        if self.profile["upload_mbps"]:
+            time.sleep(len(data) * 8 / (self.profile["upload_mbps"] * 1_000_000))
+        return name
+
+    def delete(self, name):
+        with self.lock:
+            if self.files.pop(name, None) is not None:
+                self.counters["files_deleted"] += 1
+            self.caches.pop(name, None)
+
+    def _cache_payload(self, name):
+        cache = self.caches[name]
+        return {"name": name, "model": cache["model"], "display_name": cache["display_name"],
+                "expires_at": cache["expires_at"], "tokens": cache["tokens"]}
+
+    def create_cache(self, request):
+        """Stores a prompt prefix (system instruction and contents) like Gemini cached content."""
+        text = "\n".join([request.get("system_instruction") or ""] + request.get("contents", []))
+        tokens = estimate_tokens(text)
+        minimum = self.profile.get("min_cache_tokens", MIN_CACHE_TOKENS)
+        if isinstance(minimum, dict):
+            minimum = min_cache_tokens(request.get("model"), minimum)
+        if tokens < minimum:
+            return None
+        name = f"cachedContents/{uuid.uuid4().hex[:12]}"
+        with self.lock:
+            self.caches[name] = {
+                "model": request.get("model"), "display_name": request.get("display_name"), "text": text,
+                "tokens": tokens, "expires_at": time.time() + request.get("ttl_s", 3600),
+            }
+            self.counters["caches_created"] += 1
+            return self._cache_payload(name)
+
+    def update_cache(self, name, ttl_s):
+        with self.lock:
+            if name not in self.caches:
+                return None
+            self.caches[name]["expires_at"] = time.time() + ttl_s
+            return self._cache_payload(name)
+
+    def cached_prefix(self, name):
+        """Text and token count of a live cached content, or None when it is unknown or expired."""
+        with self.lock:
+            cache = self.caches.get(name)
+            if cache is None or cache["expires_at"] < time.time():
+                return None
+            return cache["text"], cache["tokens"]
+
+    def fault(self):
+        """Returns an HTTP error status to fail this request with, or None."""
+        with self.lock:
+            if self.random.random() < self.profile["error_rate"]:
+                self.counters["errors"] += 1
+                return self.random.choice(ERROR_CODES)
+        return None
+
+    def respond(self, stage, prompt_text, seconds=None, cached_tokens=0):
+        """Picks the next recorded response for ``stage``.
+
+        Returns ``(payload, first_token_s, generate_s)``: how long the
+        profile says the first token and the rest of the answer take.
+        ``prompt_text`` is the part of the prompt that was not cached.
+        """
+        with self.lock:
+            recorded = self.fixtures.get(stage) or self.fixtures.get("analysis") or ["{}"]
+            text = recorded[self._next[stage] % len(recorded)]
+            self._next[stage] += 1
+            truncate = self.random.random() < self.profile["truncate_rate"]
+            jitter = self.random.uniform(0, self.profile["jitter_s"])
+            cut = self.random.uniform(0.3, 0.9)
+        if stage == "transcript":
+            text = stretch_transcript(text, seconds)
+        if truncate:
+            # Like a response cut off at the output token limit
+            text = text[:int(len(text) * cut)]
+            with self.lock:
+                self.counters["truncated"] += 1
+        fresh_tokens = estimate_tokens(prompt_text) + int((seconds or 0) * AUDIO_TOKENS_PER_SECOND)
+        first_token_s = self.profile["base_s"] + jitter
+        if self.profile["prefill_tokens_per_s"]:
+            first_token_s += fresh_tokens / self.profile["prefill_tokens_per_s"]
+        generate_s = len(text) / self.profile["chars_per_s"] if self.profile["chars_per_s"] else 0.0
+        if cached_tokens:
+            with self.lock:
+                self.counters["cached_tokens"] += cached_tokens
+        usage = {
+            "prompt_tokens": fresh_tokens + cached_tokens,
+            "cached_tokens": cached_tokens,
+            "output_tokens": estimate_tokens(text),
+        }
+        return {"text": text, "usage": usage}, first_token_s, generate_s
+
+    def stats(self):
+        with self.lock:
+            return json.loads(json.dumps(dict(self.counters, files_stored=len(self.files), caches_stored=len(self.caches))))
+
+
+def make_handler(state):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self):
+            return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        def _stream(self, payload, first_token_s, generate_s, chunk_chars=200):
+            """Sends the answer as JSON lines, the first after ``first_token_s``; usage comes last."""
+            text = payload["text"]
+            chunks = [text[start:start + chunk_chars] for start in range(0, len(text), chunk_chars)] or [""]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            time.sleep(first_token_s)
+            for chunk in chunks:
+                self.wfile.write(json.dumps({"text": chunk}).encode("utf-8") + b"\n")
+                self.wfile.flush()
+                time.sleep(generate_s / len(chunks))
+            self.wfile.write(json.dumps({"usage": payload["usage"]}).encode("utf-8") + b"\n")
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._send(200, state.stats())
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_PATCH(self):
+            request = json.loads(self._body() or b"{}")
+            payload = state.update_cache(self.path[len("/v1/"):], request.get("ttl_s", 3600))
+            if payload is None:
+                self._send(404, {"error": "cached content not found"})
+            else:
+                self._send(200, payload)
+
+        def do_DELETE(self):
+            state.count("delete")
+            state.delete(self.path[len("/v1/"):])
+            self._send(200, {})
+
+        def do_POST(self):
+            body = self._body()
+            if self.path == "/v1/files":
+                state.count("upload")
+                seconds = self.headers.get("X-Audio-Seconds")
+                name = state.upload(body, self.headers.get("Content-Type"), float(seconds) if seconds else None)
+                self._send(200, {"name": name, "expires_at": time.time() + 48 * 3600})
+                return
+            request = json.loads(body or b"{}")
+            if self.path == "/v1/cachedContents":
+                state.count("cache_create")
+                payload = state.create_cache(request)
+                if payload is None:
+                    # Gemini refuses prefixes below the model's minimum cache size
+                    self._send(400, {"error": "cached content is too small"})
+                else:
+                    self._send(200, payload)
+                return
+            cached_text, cached_tokens = "", 0
+            if self.path.endswith(":generateContent"):
+                if request.get("cached_content"):
+                    prefix = state.cached_prefix(request["cached_content"])
+                    if prefix is None:
+                        self._send(404, {"error": "cached content not found or expired"})
+                        return
+                    cached_text, cached_tokens = prefix
+                texts = [request.get("system_instruction") or ""]
+                texts += [part["text"] for part in request.get("parts", []) if "text" in part]
+                seconds = None
+                for part in request.get("parts", []):
+                    if "file" in part:
+                        seconds = state.files.get(part["file"], {}).get("seconds")
+                    elif "inline_bytes" in part:
+                        seconds = part.get("duration_s") or part["inline_bytes"] * 8 / (COMPRESSED_KBPS * 1000)
+            elif self.path == "/openai/v1/chat/completions":
+                texts = [message.get("content", "") for message in request.get("messages", [])]
+                seconds = None
+            else:
+                self._send(404, {"error": "not found"})
+                return
+            prompt_text = "\n".join(texts)
+            stage = detect_stage(cached_text + prompt_text)
+            state.count(stage)
+            status = state.fault()
+            if status is not None:
+                time.sleep(state.profile["base_s"] / 2)
+                self._send(status, {"error": "injected fault"})
+                return
+            payload, first_token_s, generate_s = state.respond(stage, prompt_text, seconds, cached_tokens)
+            if request.get("stream"):
+                self._stream(payload, first_token_s, generate_s)
+            else:
+                time.sleep(first_token_s + generate_s)
+                self._send(200, payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class StubServer:
+    """Runs the stub API on a background thread (``url`` once started)."""
+
+    def __init__(self, port=DEFAULT_PORT, profile="fast", fixtures_dir=DEFAULT_FIXTURES, seed=None, host="127.0.0.1",
+                 **overrides):
+        profile = dict(PROFILES[profile] if isinstance(profile, str) else profile, **overrides)
+        self.state = StubState(load_fixtures(fixtures_dir), profile, seed)
+        self.httpd = ThreadingHTTPServer((host, port), make_handler(self.state))
+        self.httpd.daemon_threads = True
+        self.url = f"http://{host}:{self.httpd.server_address[1]}"
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="stub-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def import_cache(cache_path, fixtures_dir=DEFAULT_FIXTURES, per_stage=20):
+    """Writes responses stored in a result cache as fixtures (real model output, recorded).
+
+    Only model answers are imported: "transcript" rows, and "analysis" rows,
+    which hold either a full analysis or (with local extraction) a judgment.
+    Other rows, such as compaction reports and time remaps, are skipped.
+    """
+    recorded = {stage: [] for stage in STAGES}
+    with closing(sqlite3.connect(cache_path)) as conn:
+        rows = conn.execute(
+            "SELECT stage, value FROM results WHERE stage IN ('transcript', 'analysis') ORDER BY last_access DESC"
+        )
+        for cache_stage, value in rows:
+            try:
+                parsed = json.loads(value)
+            except ValueError:
+                continue
+            if cache_stage == "transcript":
+                stage = "transcript" if not schema_errors(parsed, TRANSCRIPT_SCHEMA) else None
+            elif not schema_errors(parsed, ANALYSIS_SCHEMA):
+                stage = "analysis"
+            elif not schema_errors(parsed, JUDGMENT_SCHEMA):
+                stage = "judgment"
+            else:
+                stage = None
+            if stage is not None and len(recorded[stage]) < per_stage:
+                recorded[stage].append(value)
+    os.makedirs(fixtures_dir, exist_ok=True)
+    for stage, values in recorded.items():
+        if values:
+            with open(os.path.join(fixtures_dir, f"{stage}.json"), "w", encoding="utf-8") as f:
+                json.dump(values, f, indent=2, ensure_ascii=False)
+    return {stage: len(values) for stage, values in recorded.items()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the Gemini and Groq APIs.")
+    parser.add_argument("command", nargs="?", choices=["serve", "import-cache"], default="serve")
+    parser.add_argument("cache", nargs="?", help="Result cache to import fixtures from (import-cache)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="fast")
+    parser.add_argument("--fixtures", default=DEFAULT_FIXTURES)
+    parser.add_argument("--error-rate", type=float, help="Override the profile's share of failed requests")
+    parser.add_argument("--truncate-rate", type=float, help="Override the profile's share of cut-off responses")
+    parser.add_argument("--min-cache-tokens", type=int, help="Refuse cached contents smaller than this (default: the real per-model minimum)")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+    if args.command == "import-cache":
+        counts = import_cache(args.cache or os.path.join(".cache", "results.sqlite3"), args.fixtures)
+        print(", ".join(f"{count} {stage}" for stage, count in counts.items()), "responses recorded")
+        return 0
+    overrides = {
+        key: value for key, value in (
+            ("error_rate", args.error_rate), ("truncate_rate", args.truncate_rate), ("min_cache_tokens", args.min_cache_tokens)
+        )
+        if value is not None
+    }
+    server = StubServer(args.port, args.profile, args.fixtures, args.seed, host="0.0.0.0", **overrides)
+    print(f"Stub API on port {args.port} ({args.profile} profile); set CURATEAI_BACKEND=stub "
+          f"STUB_SERVER_URL=http://localhost:{args.port}", file=sys.stderr)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
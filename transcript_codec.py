@@ -0,0 +1,164 @@
+import json
+import re
+
+# Bump when the encoding changes so cached analyses of the old encoding are not reused
+CODEC_VERSION = "compact-v1"
+
+# Rough input-token budgets for the stage-2 transcript payload. The prompt
+# itself is not counted here.
+TOKEN_BUDGETS = {
+    "gemini": 24000,
+    "groq": 8000,
+}
+
+COMPACT_LEGEND = (
+    "The transcript below is compacted. \"s\" lists the speakers, \"e\" lists the emotions, "
+    "and each entry of \"t\" is one turn as [speaker index, emotion index, text]."
+)
+SUMMARY_LEGEND = (
+    "The call was too long to send in full. \"parts\" holds summaries of consecutive parts "
+    "of the call in order. \"s\" lists the speakers, \"e\" lists the emotions, and \"t\" holds "
+    "every turn as [speaker index, emotion index] in order, without the text."
+)
+
+# Speaker label variants the model produces, mapped to one spelling
+CANONICAL_SPEAKERS = {
+    "agent": "Agent",
+    "client": "Client",
+    "customer": "Client",
+    "caller": "Client",
+    "unknown": "Unknown",
+}
+
+
+# Words, punctuation marks, and line breaks with their indentation
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]|\n\s*", re.UNICODE)
+
+
+def estimate_tokens(text):
+    """Cheap token estimate: words, punctuation and indentation, scaled for sub-word splits."""
+    return int(len(_TOKEN_PATTERN.findall(text)) * 1.2) + 1
+
+
+def canonical_speaker(label):
+    """Maps label variants like "client" or "Customer" to a single spelling."""
+    label = (label or "").strip()
+    return CANONICAL_SPEAKERS.get(label.lower(), label or "Unknown")
+
+
+def _turns(transcript_json):
+    return transcript_json.get("Call Details", {}).get("Transcript", [])
+
+
+def _index(values):
+    table = {}
+    for value in values:
+        table.setdefault(value, len(table))
+    return table
+
+
+def merge_consecutive_turns(turns):
+    """Joins back-to-back turns from the same speaker with the same emotion."""
+    merged = []
+    for turn in turns:
+        previous = merged[-1] if merged else None
+        if previous and previous.get("Speaker") == turn.get("Speaker") and previous.get("Emotion") == turn.get("Emotion"):
+            previous["Voice"] = f"{previous.get('Voice', '')} {turn.get('Voice', '')}".strip()
+        else:
+            merged.append(dict(turn))
+    return merged
+
+
+def encode_transcript(transcript_json, level=1):
+    """Serializes the transcript for stage 2 at the given compaction level.
+
+    0: the original structure without whitespace.
+    1: speaker and emotion dictionaries with [speaker, emotion, text] turns.
+    2: like 1, with consecutive same-speaker/same-emotion turns merged.
+    """
+    if level == 0:
+        return json.dumps(transcript_json, separators=(",", ":"), ensure_ascii=False)
+    turns = _turns(transcript_json)
+    if level >= 2:
+        turns = merge_consecutive_turns(turns)
+    speakers = _index(turn.get("Speaker", "") for turn in turns)
+    emotions = _index(turn.get("Emotion", "") for turn in turns)
+    compact = {
+        "n": transcript_json.get("Call Details", {}).get("Number of Speakers"),
+        "s": list(speakers),
+        "e": list(emotions),
+        "t": [[speakers[turn.get("Speaker", "")], emotions[turn.get("Emotion", "")], turn.get("Voice", "")] for turn in turns],
+    }
+    return COMPACT_LEGEND + "\n" + json.dumps(compact, separators=(",", ":"), ensure_ascii=False)
+
+
+def split_turns(turns, max_tokens):
+    """Splits turns into consecutive groups whose encoded size stays under ``max_tokens``."""
+    groups, current, current_tokens = [], [], 0
+    for turn in turns:
+        tokens = estimate_tokens(f"{turn.get('Speaker', '')}: {turn.get('Voice', '')}")
+        if current and current_tokens + tokens > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(turn)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
+
+
+def summarize_transcript(transcript_json, summarize, max_part_tokens):
+    """Map-reduce encoding for transcripts that do not fit the budget at any level.
+
+    ``summarize(text)`` is called once per part of the call (the map step,
+    typically a short LLM request) and the part summaries are sent together
+    with the speaker/emotion sequence, which stage 2 still needs in full.
+    """
+    turns = _turns(transcript_json)
+    parts = [
+        summarize("\n".join(f"{turn.get('Speaker', '')}: {turn.get('Voice', '')}" for turn in group))
+        for group in split_turns(turns, max_part_tokens)
+    ]
+    speakers = _index(turn.get("Speaker", "") for turn in turns)
+    emotions = _index(turn.get("Emotion", "") for turn in turns)
+    compact = {
+        "n": transcript_json.get("Call Details", {}).get("Number of Speakers"),
+        "parts": parts,
+        "s": list(speakers),
+        "e": list(emotions),
+        "t": [[speakers[turn.get("Speaker", "")], emotions[turn.get("Emotion", "")]] for turn in turns],
+    }
+    return SUMMARY_LEGEND + "\n" + json.dumps(compact, separators=(",", ":"), ensure_ascii=False)
+
+
+def fit_to_budget(transcript_json, budget, summarize=None):
+    """Returns ``(payload, level)`` using the least compaction that fits ``budget`` tokens.
+
+    Falls back to ``summarize_transcript`` (level "summary") when even level 2
+    is too large and a ``summarize`` function is available; otherwise the
+    level-2 payload is returned as is.
+    """
+    payload = None
+    for level in (1, 2):
+        payload = encode_transcript(transcript_json, level)
+        if estimate_tokens(payload) <= budget:
+            return payload, level
+    if summarize is not None:
+        return summarize_transcript(transcript_json, summarize, max_part_tokens=budget), "summary"
+    return payload, 2
+
+
+def compaction_report(transcript_json, payload, level, baseline=None):
+    """Compares the tokens of ``payload`` with the previous (uncompacted) encoding."""
+    if baseline is None:
+        baseline = json.dumps(transcript_json)
+    baseline_tokens = estimate_tokens(baseline)
+    payload_tokens = estimate_tokens(payload)
+    return {
+        "level": level,
+        "turns": len(_turns(transcript_json)),
+        "baseline_tokens": baseline_tokens,
+        "payload_tokens": payload_tokens,
+        "tokens_saved": baseline_tokens - payload_tokens,
+        "saved_pct": round(100 * (baseline_tokens - payload_tokens) / baseline_tokens, 1) if baseline_tokens else 0.0,
+    }
@@ -0,0 +1,201 @@
+import bisect
+
+import numpy as np
+
+from audio_utils import frame_signal, runs_of
+
+# Thresholds for the energy/spectral voice-activity detector
+VAD_SETTINGS = {
+    "frame_ms": 30,
+    # A frame must be this many dB above the estimated noise floor...
+    "energy_margin_db": 10.0,
+    # ...and never quieter than this absolute level
+    "min_energy_db": -50.0,
+    # Share of the frame's energy that must sit in the 250-4000 Hz speech band
+    "min_speech_band_ratio": 0.15,
+    # Noise-like frames (flat spectrum) are not speech
+    "max_spectral_flatness": 0.5,
+    # Speech loudness rises and falls with syllables; steady hold music does not.
+    # Standard deviation of the frame energy over ~1 s must exceed this.
+    "min_energy_modulation_db": 3.0,
+    # Gaps shorter than this inside speech are kept as speech
+    "max_gap_ms": 600,
+    # Speech bursts shorter than this are treated as noise
+    "min_speech_ms": 200,
+    # Only non-speech stretches longer than this are cut
+    "min_cut_ms": 2000,
+    # Audio kept on each side of a cut so words are not clipped
+    "padding_ms": 300,
+    # If more than this would be removed the detector is probably wrong
+    # (e.g. very quiet speech), so the audio is left untouched
+    "max_removed_pct": 90.0,
+}
+
+_FFT_BLOCK_FRAMES = 4096
+
+
+def frame_features(samples, rate, frame_ms=30):
+    """Returns per-frame energy (dBFS), speech-band energy ratio and spectral flatness.
+
+    Frames are processed in blocks so memory stays bounded for long calls.
+    """
+    frames, hop = frame_signal(samples, rate, frame_ms)
+    frame_len = frames.shape[1]
+    window = np.hanning(frame_len).astype(np.float32)
+    freqs = np.fft.rfftfreq(frame_len, 1.0 / rate)
+    band = (freqs >= 250) & (freqs <= 4000)
+
+    energy = np.empty(len(frames), dtype=np.float32)
+    band_ratio = np.empty(len(frames), dtype=np.float32)
+    flatness = np.empty(len(frames), dtype=np.float32)
+    for start in range(0, len(frames), _FFT_BLOCK_FRAMES):
+        block = frames[start:start + _FFT_BLOCK_FRAMES]
+        rms = np.sqrt(np.mean(np.square(block, dtype=np.float32), axis=1))
+        # Floor at -100 dBFS so digital silence doesn't skew the statistics
+        energy[start:start + len(block)] = 20 * np.log10(np.maximum(rms, 1e-5))
+        power = np.abs(np.fft.rfft(block * window, axis=1)) ** 2 + 1e-12
+        total = power.sum(axis=1)
+        band_ratio[start:start + len(block)] = power[:, band].sum(axis=1) / total
+        flatness[start:start + len(block)] = np.exp(np.mean(np.log(power), axis=1)) / (total / power.shape[1])
+    return energy, band_ratio, flatness, hop / rate
+
+
+def energy_modulation(energy, hop_s, span_s=1.0):
+    """Returns the rolling standard deviation of frame energy over ``span_s``."""
+    width = max(1, int(span_s / hop_s))
+    kernel = np.full(width, 1.0 / width)
+    mean = np.convolve(energy, kernel, mode="same")
+    mean_sq = np.convolve(np.square(energy, dtype=np.float64), kernel, mode="same")
+    return np.sqrt(np.maximum(mean_sq - np.square(mean), 0.0))
+
+
+def _fill_short_runs(mask, value, max_len):
+    """Flips runs of ``value`` shorter than ``max_len`` frames (interior runs only)."""
+    mask = mask.copy()
+    for start, end in runs_of(mask == value):
+        if end - start < max_len and start > 0 and end < len(mask):
+            mask[start:end] = not value
+    return mask
+
+
+def detect_speech(samples, rate, settings=VAD_SETTINGS):
+    """Returns a boolean speech mask per frame and the frame hop in seconds."""
+    energy, band_ratio, flatness, hop_s = frame_features(samples, rate, settings["frame_ms"])
+    noise_floor = np.percentile(energy, 10) if len(energy) else -100.0
+    threshold = max(noise_floor + settings["energy_margin_db"], settings["min_energy_db"])
+    speech = (
+        (energy > threshold)
+        & (band_ratio >= settings["min_speech_band_ratio"])
+        & (flatness <= settings["max_spectral_flatness"])
+        & (energy_modulation(energy, hop_s) >= settings["min_energy_modulation_db"])
+    )
+    frames_per_ms = 1 / (hop_s * 1000)
+    speech = _fill_short_runs(speech, False, int(settings["max_gap_ms"] * frames_per_ms))
+    speech = _fill_short_runs(speech, True, int(settings["min_speech_ms"] * frames_per_ms))
+    return speech, hop_s
+
+
+def keep_segments(speech, hop_s, duration_s, settings=VAD_SETTINGS):
+    """Turns a speech mask into the ``(start_s, end_s)`` ranges of audio to keep."""
+    min_cut_s = settings["min_cut_ms"] / 1000
+    padding_s = settings["padding_ms"] / 1000
+    cuts = []
+    for start, end in runs_of(~speech):
+        cut_start = start * hop_s + (padding_s if start > 0 else 0)
+        cut_end = min(end * hop_s, duration_s) - (padding_s if end < len(speech) else 0)
+        if cut_end - cut_start >= min_cut_s:
+            cuts.append((cut_start, cut_end))
+    segments = []
+    position = 0.0
+    for cut_start, cut_end in cuts:
+        if cut_start > position:
+            segments.append((position, cut_start))
+        position = cut_end
+    if position < duration_s:
+        segments.append((position, duration_s))
+    return segments
+
+
+def build_remap(segments):
+    """Builds the trimmed-time -> original-time table for the kept segments.
+
+    Each row is ``(trimmed_start_s, original_start_s, length_s)``.
+    """
+    remap = []
+    trimmed = 0.0
+    for start, end in segments:
+        remap.append((round(float(trimmed), 3), round(float(start), 3), round(float(end - start), 3)))
+        trimmed += end - start
+    return remap
+
+
+def to_original_time(trimmed_s, remap):
+    """Maps a time in the trimmed audio back to the original recording."""
+    if not remap:
+        return trimmed_s
+    index = max(0, bisect.bisect_right([row[0] for row in remap], trimmed_s) - 1)
+    trimmed_start, original_start, length = remap[index]
+    return original_start + min(trimmed_s - trimmed_start, length)
+
+
+def parse_timestamp(value):
+    """Returns seconds for a "MM:SS" / "H:MM:SS" string or a number; None if it is neither."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    try:
+        seconds = 0.0
+        for part in str(value).strip().split(":"):
+            seconds = seconds * 60 + float(part)
+        return seconds
+    except ValueError:
+        return None
+
+
+def format_timestamp(seconds):
+    """Formats seconds as "MM:SS" (minutes are not wrapped into hours)."""
+    minutes, rest = divmod(int(round(seconds)), 60)
+    return f"{minutes:02d}:{rest:02d}"
+
+
+def remap_turn_starts(turns, remap=None, offset_s=0.0):
+    """Returns copies of transcript turns with their "Start" moved to the original recording.
+
+    ``offset_s`` is added first (the window start in long-audio mode), then
+    the time is mapped through ``remap`` (see ``build_remap``). Turns without
+    a readable "Start" are copied unchanged.
+    """
+    remapped = []
+    for turn in turns:
+        start = parse_timestamp(turn.get("Start")) if "Start" in turn else None
+        if start is None:
+            remapped.append(dict(turn))
+        else:
+            remapped.append(dict(turn, Start=format_timestamp(to_original_time(start + offset_s, remap))))
+    return remapped
+
+
+def trim_non_speech(samples, rate, settings=VAD_SETTINGS):
+    """Cuts long silence, hold music and IVR stretches from mono float samples.
+
+    Returns ``(trimmed_samples, remap, stats)``; see ``build_remap`` for the
+    remap rows.
+    """
+    duration_s = len(samples) / rate
+    speech, hop_s = detect_speech(samples, rate, settings)
+    segments = keep_segments(speech, hop_s, duration_s, settings)
+    kept_s = sum(end - start for start, end in segments)
+    skipped = bool(duration_s > 0 and 100 * (duration_s - kept_s) / duration_s > settings["max_removed_pct"])
+    if skipped:
+        segments = [(0.0, duration_s)]
+    pieces = [samples[int(start * rate):int(end * rate)] for start, end in segments]
+    trimmed = np.concatenate(pieces) if pieces else samples[:0]
+    trimmed_s = len(trimmed) / rate
+    stats = {
+        "original_s": round(duration_s, 3),
+        "trimmed_s": round(trimmed_s, 3),
+        "removed_s": round(duration_s - trimmed_s, 3),
+        "removed_pct": round(100 * (duration_s - trimmed_s) / duration_s, 1) if duration_s else 0.0,
+        "cuts": max(0, len(segments) - 1),
+        "skipped": skipped,
+    }
+    return trimmed, build_remap(segments), stats